@@ -0,0 +1,271 @@
+"""Build device-ready assets ahead of deployment.
+
+Run on a desktop for the target display; copy `assets/` (including
+`assets/build/`) to the device:
+
+    python3 assetbuild.py --profile pi-7in
+    python3 assetbuild.py --profile desktop --size 2560x1440
+    python3 assetbuild.py --list-profiles
+
+It writes into `assets/build/`:
+
+- the logo pre-scaled to a ladder of widths around the login form's width
+  on that display, as PNG that Tk loads without Pillow
+- each map (`assets/map.png|jpg|jpeg`) as an MBTiles tile database (see
+  `mbtiles`), with its georeference copied alongside; tile size and the
+  coarsest level follow the screen size
+- `manifest.json`: profile, and per variant its file, size and SHA-256,
+  plus the source's size and hash
+
+At run time `LoginApp` takes the logo variant closest to the width it
+needs and `MapWindow` opens the prebuilt tile database, so the device never
+decodes or resamples the originals. Anything missing from the manifest
+falls back to the usual path.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from typing import Any, Dict, List, Optional
+
+from fsutil import atomic_write_json
+
+BUILD_DIR = "build"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+LOGO_SOURCES = ("logo.png", "logo.jpeg", "logo.jpg")
+MAP_SOURCES = ("map.png", "map.jpg", "map.jpeg")
+# a logo variant within this fraction of the wanted width is used as is
+LOGO_TOLERANCE = 0.15
+
+# the logo is as wide as the username entry: 20 characters of the entry
+# font, 16 pt (22 pt in touch mode; see src/main.py), at Tk's 96 dpi
+ENTRY_CHARS = 20
+ENTRY_FONT_PT = {False: 16, True: 22}
+# average character width of the default font, in em
+CHAR_EM = 0.6
+# the ladder brackets that estimate, since fonts and dpi vary
+LOGO_STEPS = (0.75, 0.875, 1.0, 1.125, 1.25, 1.5)
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "pi-7in": {"width": 800, "height": 480, "touch": True, "map_format": "jpeg"},
+    "pi-hdmi": {"width": 1280, "height": 720, "touch": False, "map_format": "jpeg"},
+    "pi-touch-1080": {"width": 1920, "height": 1080, "touch": True, "map_format": "jpeg"},
+    "desktop": {"width": 1920, "height": 1080, "touch": False, "map_format": "png"},
+}
+
+
+def logo_widths(profile: dict) -> List[int]:
+    """Logo widths to prebuild: steps around the entry width, at most 3/4 of the screen."""
+    entry = ENTRY_CHARS * CHAR_EM * ENTRY_FONT_PT[bool(profile["touch"])] * 96 / 72
+    cap = profile["width"] * 3 // 4
+    return sorted({min(cap, max(64, int(round(entry * k / 8)) * 8)) for k in LOGO_STEPS})
+
+
+def map_tiling(profile: dict) -> Dict[str, int]:
+    """Tile size and coarsest level side for the profile's screen."""
+    import mappyramid
+    longer = max(profile["width"], profile["height"])
+    # bigger tiles mean fewer reads per view on a big screen
+    tile_size = 512 if longer > 1280 else 256
+    # the coarsest level stays decoded (the maptiles overview) and fills
+    # gaps while tiles load; about half the screen is sharp enough for that
+    return {"tile_size": tile_size, "min_side": max(mappyramid.MIN_LEVEL_SIDE, longer // 2)}
+
+
+def assets_dir() -> str:
+    return os.path.join(os.path.abspath(os.path.dirname(__file__)), "assets")
+
+
+def manifest_path(assets: Optional[str] = None) -> str:
+    return os.path.join(assets or assets_dir(), BUILD_DIR, MANIFEST_NAME)
+
+
+# -- run time --------------------------------------------------------------
+
+_manifest_cache: Dict[str, Optional[dict]] = {}
+
+
+def load_manifest(assets: Optional[str] = None) -> Optional[dict]:
+    """The build manifest, or None if there is none (or it is unreadable)."""
+    path = manifest_path(assets)
+    if path not in _manifest_cache:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            _manifest_cache[path] = data if data.get("version") == MANIFEST_VERSION else None
+        except (OSError, ValueError):
+            _manifest_cache[path] = None
+    return _manifest_cache[path]
+
+
+# (path, size, mtime_ns) -> whether the file still hashes to the manifest's sha256
+_source_checks: Dict[tuple, bool] = {}
+
+
+def _source_matches(assets: str, entry: dict) -> bool:
+    # the source must still be the one the variant was built from. Size and
+    # mtime are compared first; if only the mtime moved (copied, touched or
+    # replaced by a same-size file) the file is re-hashed, once per stamp.
+    import mappyramid
+    path = os.path.join(assets, entry.get("source", ""))
+    try:
+        st = os.stat(path)
+        if st.st_size != entry["source_bytes"]:
+            return False
+        if st.st_mtime_ns == entry.get("source_mtime_ns"):
+            return True
+        key = (path, st.st_size, st.st_mtime_ns)
+        if key not in _source_checks:
+            _source_checks[key] = mappyramid.file_sha256(path) == entry["source_sha256"]
+        return _source_checks[key]
+    except (OSError, KeyError):
+        return False
+
+
+def _source_fields(path: str) -> dict:
+    import mappyramid
+    st = os.stat(path)
+    return {"source_bytes": st.st_size, "source_mtime_ns": st.st_mtime_ns,
+            "source_sha256": mappyramid.file_sha256(path)}
+
+
+def best_logo(width: int, assets: Optional[str] = None) -> Optional[str]:
+    """Path of the prebuilt logo closest to `width`, if one is close enough."""
+    assets = assets or assets_dir()
+    manifest = load_manifest(assets)
+    if not manifest or not manifest.get("logo") or not _source_matches(assets, manifest["logo"]):
+        return None
+    best = None
+    for v in manifest["logo"]["variants"]:
+        off = abs(v["width"] - width) / float(width)
+        if off <= LOGO_TOLERANCE and (best is None or off < best[0]):
+            best = (off, v["file"])
+    if best is None:
+        return None
+    path = os.path.join(assets, best[1])
+    return path if os.path.exists(path) else None
+
+
+def best_map(assets: Optional[str] = None, source: Optional[str] = None) -> Optional[str]:
+    """Path of the tile database prebuilt from `source` (a map file name in assets), or from any map."""
+    assets = assets or assets_dir()
+    manifest = load_manifest(assets)
+    for entry in (manifest or {}).get("maps", []):
+        if source is not None and entry.get("source") != source:
+            continue
+        path = os.path.join(assets, entry["file"])
+        if _source_matches(assets, entry) and os.path.exists(path):
+            return path
+    return None
+
+
+# -- build -----------------------------------------------------------------
+
+def _variant(assets: str, path: str, **extra) -> dict:
+    import mappyramid
+    return dict(file=os.path.relpath(path, assets).replace(os.sep, "/"), bytes=os.path.getsize(path),
+                sha256=mappyramid.file_sha256(path), **extra)
+
+
+def build_logo(assets: str, out: str, profile: dict) -> Optional[dict]:
+    from PIL import Image
+    import imagecache
+    src = next((n for n in LOGO_SOURCES if os.path.exists(os.path.join(assets, n))), None)
+    if src is None:
+        return None
+    path = os.path.join(assets, src)
+    with Image.open(path) as img:
+        ow, oh = img.size
+        rgba = img.convert("RGBA")
+    for name in os.listdir(out):
+        # widths from an earlier build for another profile
+        if name.startswith("logo-w") and name.endswith(".png"):
+            os.remove(os.path.join(out, name))
+    variants = []
+    for width in profile["logo_widths"]:
+        height = max(1, round(oh * width / ow))
+        dst = os.path.join(out, f"logo-w{width}.png")
+        rgba.resize((width, height), imagecache._resample("lanczos")).save(dst, format="PNG", optimize=True)
+        variants.append(_variant(assets, dst, width=width, height=height))
+    return dict(source=src, **_source_fields(path), size=[ow, oh], variants=variants)
+
+
+def build_maps(assets: str, out: str, profile: dict) -> List[dict]:
+    import mbtiles
+    import georef
+    entries = []
+    for name in MAP_SOURCES:
+        path = os.path.join(assets, name)
+        if not os.path.exists(path):
+            continue
+        dst = os.path.join(out, os.path.splitext(name)[0] + mbtiles.MBTILES_SUFFIX)
+        t0 = time.perf_counter()
+        levels = mbtiles.build_mbtiles(path, dst, fmt=profile["map_format"], **profile["map_tiling"])
+        sidecar = georef.georef_path_for(path)
+        if os.path.exists(sidecar):
+            shutil.copyfile(sidecar, georef.georef_path_for(dst))
+        print(f"  {name}: {len(levels)} levels, {os.path.getsize(dst) / 1e6:.1f} MB in {time.perf_counter() - t0:.1f} s")
+        entries.append(_variant(assets, dst, source=name, **_source_fields(path), size=list(levels[0]),
+                                levels=len(levels), format=profile["map_format"], **profile["map_tiling"]))
+    return entries
+
+
+def build(profile_name: str, assets: Optional[str] = None, size: Optional[str] = None,
+          touch: Optional[bool] = None, maps: bool = True) -> dict:
+    assets = assets or assets_dir()
+    profile = dict(PROFILES[profile_name], name=profile_name)
+    if size:
+        w, _, h = size.lower().partition("x")
+        profile["width"], profile["height"] = int(w), int(h)
+    if touch is not None:
+        profile["touch"] = touch
+    # everything device-specific follows from the screen size and touch
+    profile["logo_widths"] = logo_widths(profile)
+    profile["map_tiling"] = map_tiling(profile)
+    out = os.path.join(assets, BUILD_DIR)
+    os.makedirs(out, exist_ok=True)
+    manifest = {"version": MANIFEST_VERSION, "built": time.strftime("%Y-%m-%dT%H:%M:%S"), "profile": profile}
+    logo = build_logo(assets, out, profile)
+    if logo:
+        manifest["logo"] = logo
+        print(f"  {logo['source']}: {len(logo['variants'])} widths")
+    old = load_manifest(assets) or {}
+    manifest["maps"] = build_maps(assets, out, profile) if maps else old.get("maps", [])
+    atomic_write_json(manifest_path(assets), manifest)
+    _manifest_cache.pop(manifest_path(assets), None)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="assetbuild.py", description="prebuild assets for a target display")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="pi-7in")
+    parser.add_argument("--size", metavar="WxH", help="override the profile's screen size")
+    touch = parser.add_mutually_exclusive_group()
+    touch.add_argument("--touch", dest="touch", action="store_true", default=None)
+    touch.add_argument("--no-touch", dest="touch", action="store_false")
+    parser.add_argument("--skip-maps", action="store_true", help="only rebuild the logo (maps take longest)")
+    parser.add_argument("--assets", help="assets directory (default: the package's)")
+    parser.add_argument("--list-profiles", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.list_profiles:
+        for name, p in sorted(PROFILES.items()):
+            tiling = map_tiling(p)
+            print(f"{name:<14} {p['width']}x{p['height']} {'touch' if p['touch'] else 'desktop'}, "
+                  f"logo {'/'.join(map(str, logo_widths(p)))} px, "
+                  f"maps as {p['map_format']} in {tiling['tile_size']} px tiles down to {tiling['min_side']} px")
+        return
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("assetbuild.py needs Pillow")
+    print(f"building assets for {args.profile}")
+    m = build(args.profile, args.assets, args.size, args.touch, maps=not args.skip_maps)
+    print(f"wrote {manifest_path(args.assets)} ({len(m.get('maps', []))} maps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""Local authentication daemon.
+
+One process owns the `UserManager` and serves several UI processes (kiosk
+screens, a field tablet) over a Unix domain socket. The protocol is one
+JSON object per line:
+
+    -> {"id": 1, "method": "authenticate", "params": {"username": ..., "password": ...}}
+    <- {"id": 1, "result": {...}}  or  {"id": 1, "error": {"type": "KeyError", "message": ...}}
+
+Password hashes never leave the daemon; users are sent as username, role
+and KDF parameters. Account changes are only accepted from connections
+whose peer uid (SO_PEERCRED) is the daemon's own, root, or one given with
+`--admin-uid`. Point UI processes at it with NEUROLINK_AUTHD_SOCKET
+(or `main.py --auth-socket`) and `users.get_manager()` returns an
+`AuthClient` instead of a local manager.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import users
+from auththrottle import AuthThrottle, AuthThrottled
+from userstore import JournaledJsonStore, SQLITE_SUFFIXES, StoreCorrupt, open_store
+
+DEFAULT_SOCKET_FILENAME = "authd.sock"
+MAX_LINE = 16 * 1024 * 1024
+
+# methods that run PBKDF2 on the bounded hashing pool
+HASH_METHODS = {"authenticate"}
+# methods that change the store; applied in batches by a single writer
+WRITE_METHODS = {"create_user", "create_users", "set_password", "delete_user", "update_role"}
+# writes whose PBKDF2 runs on the hashing pool; the writer only stores the result
+PREPARED_WRITES = {"create_user", "create_users", "set_password"}
+READ_METHODS = {"get_user", "list_users", "has_permission", "has_all", "has_any", "count", "usernames", "auth_stats"}
+
+
+def default_socket_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(users.default_store_path())), DEFAULT_SOCKET_FILENAME)
+
+
+def _user_to_wire(u: Optional[users.User]) -> Optional[Dict[str, Any]]:
+    if u is None:
+        return None
+    return {"username": u.username, "role": u.role, "kdf": u.kdf, "iterations": u.iterations}
+
+
+def _user_from_wire(d: Optional[Dict[str, Any]]) -> Optional[users.User]:
+    if d is None:
+        return None
+    return users.User(username=d["username"], role=d["role"], salt=b"", pwd_hash=b"",
+                      kdf=d["kdf"], iterations=d["iterations"])
+
+
+def _peer_uid(writer: asyncio.StreamWriter) -> Optional[int]:
+    """The connecting process's uid, where the OS reports Unix socket peers."""
+    sock = writer.get_extra_info("socket")
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return None
+    try:
+        _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    except OSError:
+        return None
+    return uid
+
+
+class AuthDaemon:
+    """Serve a `UserManager` over a Unix socket with asyncio.
+
+    Password checks run on a thread pool of `hash_workers` threads (PBKDF2
+    releases the GIL) with at most `max_pending` checks queued, so a flood
+    of logins can't grow memory or starve the writer. Mutations go through
+    one writer that applies everything queued within `batch_window`
+    seconds and then makes the whole batch durable with a single flush
+    before answering; new passwords are hashed on the hashing pool first,
+    so a bulk import doesn't hold up other writes. Logins flush too, since
+    they may rehash. Reads run on a small pool of their own, holding the
+    store lock, so they see no half-applied batch and never block the loop.
+    Writes are refused unless the peer's uid is in `admin_uids` (default:
+    ours and root).
+    """
+
+    def __init__(self, manager: users.UserManager, socket_path: str, hash_workers: int = 2,
+                 max_pending: int = 32, batch_window: float = 0.005, max_batch: int = 64,
+                 admin_uids: Optional[Iterable[int]] = None):
+        self.manager = manager
+        self.admin_uids = set(admin_uids) if admin_uids is not None else {os.geteuid(), 0}
+        self.socket_path = socket_path
+        self.hash_workers = hash_workers
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._hash_pool = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix="authd-hash")
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="authd-write")
+        # reads hold the store lock, so they run off the loop too
+        self._read_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="authd-read")
+        self._pending: Optional[asyncio.Semaphore] = None
+        self._writes: Optional[asyncio.Queue] = None
+        self._server = None
+
+    async def serve(self) -> None:
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._writes = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        old_umask = os.umask(0o177)  # socket is rw for our user only
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=MAX_LINE)
+        finally:
+            os.umask(old_umask)
+        writer = asyncio.ensure_future(self._writer())
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        print(f"[authd] listening on {self.socket_path}")
+        try:
+            await stop.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            writer.cancel()
+            self._hash_pool.shutdown(wait=True)
+            self._write_pool.shutdown(wait=True)
+            self._read_pool.shutdown(wait=True)
+            self.manager.close()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        send_lock = asyncio.Lock()
+        uid = _peer_uid(writer)
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # requests on one connection are answered as they complete
+                t = asyncio.ensure_future(self._answer(line, writer, send_lock, uid))
+                tasks.add(t)
+                t.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            for t in list(tasks):
+                t.cancel()
+            writer.close()
+
+    async def _answer(self, line: bytes, writer: asyncio.StreamWriter, send_lock: asyncio.Lock,
+                      uid: Optional[int] = None) -> None:
+        req_id = None
+        try:
+            req = json.loads(line)
+            req_id = req.get("id")
+            # the client is who the socket says, never what the request says;
+            # login backoff is kept per username and client (see AuthThrottle)
+            params = dict(req.get("params") or {}, client=None if uid is None else f"uid:{uid}")
+            resp = {"id": req_id, "result": await self._dispatch(req["method"], params, uid)}
+        except Exception as e:
+            resp = {"id": req_id, "error": {"type": type(e).__name__, "message": str(e.args[0]) if e.args else ""}}
+            if isinstance(e, AuthThrottled):
+                resp["error"].update(retry_after=e.retry_after, reason=e.reason)
+        data = (json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8")
+        async with send_lock:
+            writer.write(data)
+            await writer.drain()
+
+    async def _dispatch(self, method: str, params: Dict[str, Any], uid: Optional[int] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        if method in HASH_METHODS:
+            async with self._pending:
+                return await loop.run_in_executor(self._hash_pool, self._login, method, params)
+        if method in WRITE_METHODS:
+            if uid is None or uid not in self.admin_uids:
+                raise PermissionError("account changes need an administrator connection")
+            if method in PREPARED_WRITES:
+                async with self._pending:
+                    params = await loop.run_in_executor(self._hash_pool, self._prepare, method, params)
+            fut = loop.create_future()
+            await self._writes.put((method, params, fut))
+            return await fut
+        if method in READ_METHODS:
+            return await loop.run_in_executor(self._read_pool, self._read, method, params)
+        raise ValueError(f"unknown method {method!r}")
+
+    def _call(self, method: str, params: Dict[str, Any]) -> Any:
+        m = self.manager
+        if method == "authenticate":
+            return _user_to_wire(m.authenticate(params["username"], params["password"], params.get("client")))
+        if method == "get_user":
+            return _user_to_wire(m.get_user(params["username"]))
+        if method == "list_users":
+            return [_user_to_wire(u) for u in m.list_users(params.get("role"))]
+        if method == "count":
+            return len(m.users)
+        if method == "usernames":
+            return list(m.users)
+        if method == "auth_stats":
+            return m.auth_stats()
+        if method in ("has_permission", "has_all", "has_any"):
+            arg = params["permission"] if method == "has_permission" else params["permissions"]
+            return getattr(m, method)(params["username"], arg)
+        # writes, with params from _prepare where the method hashes
+        if method == "create_user":
+            return _user_to_wire(m.add_user(params["user"]))
+        if method == "create_users":
+            report = m.add_users(params["prepared"])
+            return {"created": report.created, "errors": [[e.row, e.username, e.message] for e in report.errors]}
+        if method == "set_password":
+            return m.store_password(params["username"], params["salt"], params["pwd_hash"])
+        if method == "delete_user":
+            return m.delete_user(params["username"])
+        if method == "update_role":
+            return m.update_role(params["username"], params["role"])
+        raise ValueError(f"unknown method {method!r}")
+
+    def _login(self, method: str, params: Dict[str, Any]) -> Any:
+        result = self._call(method, params)
+        # a login may have rehashed the account; make that durable too
+        self.manager.flush()
+        return result
+
+    def _prepare(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        # hashing pool: the PBKDF2 half of a write, checked against the
+        # store first so a doomed request costs no hashing
+        m = self.manager
+        if method in ("create_user", "set_password"):
+            with m.lock():
+                exists = m.get_user(params["username"]) is not None
+        if method == "create_user":
+            if exists:
+                raise ValueError("user exists")
+            return {"user": m.new_user(params["username"], params["password"], params["role"])}
+        if method == "create_users":
+            return {"prepared": m.prepare_users(params["records"], default_role=params.get("default_role"))}
+        if method == "set_password":
+            if not exists:
+                raise KeyError("user not found")
+            salt, pwd_hash = m.hash_password(params["password"])
+            return {"username": params["username"], "salt": salt, "pwd_hash": pwd_hash}
+        raise ValueError(f"unknown method {method!r}")
+
+    def _read(self, method: str, params: Dict[str, Any]) -> Any:
+        # under the store lock, so the writer can't change records mid-read
+        with self.manager.lock():
+            return self._call(method, params)
+
+    def _apply_batch(self, batch: List[tuple]) -> List[tuple]:
+        results = []
+        for method, params, _ in batch:
+            try:
+                results.append((True, self._call(method, params)))
+            except Exception as e:
+                results.append((False, e))
+        # one fsync for the whole batch before anyone is told it's done
+        self.manager.flush()
+        return results
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._writes.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(self._write_pool, self._apply_batch, batch)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            for (_, _, fut), (ok, value) in zip(batch, results):
+                if fut.done():
+                    continue
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+
+
+class AuthDaemonError(RuntimeError):
+    pass
+
+
+# exception types re-raised on the client side; anything else becomes
+# AuthDaemonError
+_REMOTE_ERRORS = {"KeyError": KeyError, "ValueError": ValueError, "PermissionError": PermissionError}
+
+
+class _RemoteUserView:
+    """Read-only username -> User view over the daemon, like `users.UserView`."""
+
+    def __init__(self, client: "AuthClient"):
+        self._client = client
+
+    def __getitem__(self, username: str) -> users.User:
+        u = self._client.get_user(username)
+        if u is None:
+            raise KeyError(username)
+        return u
+
+    def get(self, username: str, default=None):
+        u = self._client.get_user(username)
+        return default if u is None else u
+
+    def __contains__(self, username) -> bool:
+        return self._client.get_user(username) is not None
+
+    def __iter__(self):
+        return iter(self._client._call("usernames"))
+
+    def __len__(self) -> int:
+        return self._client._call("count")
+
+    def values(self):
+        return self._client.list_users()
+
+
+class AuthClient:
+    """Blocking client with the same method surface as `users.UserManager`.
+
+    Safe to share between the Tk thread and the auth worker; calls are
+    serialized over one connection that is re-opened if the daemon
+    restarts.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.users = _RemoteUserView(self)
+        self._sock: Optional[socket.socket] = None
+        self._rfile = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _connect(self) -> None:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        s.connect(self.socket_path)
+        self._sock = s
+        self._rfile = s.makefile("rb")
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._rfile.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._rfile = None
+
+    def _call(self, method: str, **params) -> Any:
+        with self._lock:
+            self._next_id += 1
+            req_id = self._next_id
+            data = (json.dumps({"id": req_id, "method": method, "params": params}, ensure_ascii=False) + "\n").encode("utf-8")
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(data)
+                    while True:
+                        line = self._rfile.readline(MAX_LINE)
+                        if not line:
+                            raise ConnectionError("auth daemon closed the connection")
+                        resp = json.loads(line)
+                        if resp.get("id") == req_id:
+                            break
+                    break
+                except (OSError, ConnectionError) as e:
+                    self._disconnect()
+                    # retry once on a fresh connection; never replay a
+                    # request whose answer we may simply have missed
+                    if attempt or method in WRITE_METHODS:
+                        raise AuthDaemonError(f"auth daemon unavailable: {e}") from e
+        if "error" in resp:
+            err = resp["error"]
+            if err.get("type") == "AuthThrottled":
+                raise AuthThrottled(err.get("retry_after", 1.0), err.get("reason", "throttled"))
+            raise _REMOTE_ERRORS.get(err.get("type"), AuthDaemonError)(err.get("message", ""))
+        return resp.get("result")
+
+    def authenticate(self, username: str, password: str) -> Optional[users.User]:
+        return _user_from_wire(self._call("authenticate", username=username, password=password))
+
+    def get_user(self, username: str) -> Optional[users.User]:
+        return _user_from_wire(self._call("get_user", username=username))
+
+    def list_users(self, role: Optional[str] = None) -> List[users.User]:
+        return [_user_from_wire(d) for d in self._call("list_users", role=role)]
+
+    def has_permission(self, username: str, permission: str) -> bool:
+        return self._call("has_permission", username=username, permission=permission)
+
+    def has_all(self, username: str, permissions: Iterable[str]) -> bool:
+        return self._call("has_all", username=username, permissions=list(permissions))
+
+    def has_any(self, username: str, permissions: Iterable[str]) -> bool:
+        return self._call("has_any", username=username, permissions=list(permissions))
+
+    def auth_stats(self) -> Dict[str, float]:
+        return self._call("auth_stats")
+
+    def create_user(self, username: str, password: str, role: str) -> users.User:
+        return _user_from_wire(self._call("create_user", username=username, password=password, role=role))
+
+    def create_users(self, records: Iterable[Dict[str, Any]], default_role: Optional[str] = None,
+                     workers: Optional[int] = None) -> users.ImportReport:
+        # the daemon decides how many hashing processes to use
+        res = self._call("create_users", records=[dict(r) for r in records], default_role=default_role)
+        return users.ImportReport(created=res["created"], errors=[users.RowError(*e) for e in res["errors"]])
+
+    def import_users(self, path: str, default_role: Optional[str] = None,
+                     workers: Optional[int] = None) -> users.ImportReport:
+        return self.create_users(users.read_import_file(path), default_role=default_role)
+
+    def set_password(self, username: str, new_password: str) -> None:
+        self._call("set_password", username=username, password=new_password)
+
+    def delete_user(self, username: str) -> None:
+        self._call("delete_user", username=username)
+
+    def update_role(self, username: str, role: str) -> None:
+        self._call("update_role", username=username, role=role)
+
+    def refresh(self):
+        # the daemon keeps its own manager current
+        return set()
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="authd.py", description="neurolink local authentication daemon")
+    parser.add_argument("--socket", default=None, help=f"Unix socket path (default: {DEFAULT_SOCKET_FILENAME} next to the store)")
+    parser.add_argument("--store", default=None, help="user store path (default: users.json, or NEUROLINK_USER_STORE)")
+    parser.add_argument("--hash-workers", type=int, default=2, help="concurrent password checks (default 2)")
+    parser.add_argument("--admin-uid", type=int, action="append", default=[],
+                        help="also accept account changes from this uid (repeatable; ours and root always are)")
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("authd needs Unix domain sockets")
+    store_path = args.store or users.default_store_path()
+    # JSON stores are journaled so the writer can batch fsyncs; the
+    # writer flushes explicitly after every batch
+    if store_path.lower().endswith(SQLITE_SUFFIXES):
+        store = open_store(store_path, users.User.from_dict)
+    else:
+        store = JournaledJsonStore(store_path, users.User.from_dict, fsync_batch=1 << 30, fsync_interval=3600.0)
+    # one hash slot per worker thread; extra attempts are refused, not queued
+    try:
+        mgr = users.UserManager(store=store, throttle=AuthThrottle(max_inflight=args.hash_workers))
+    except StoreCorrupt as e:
+        sys.exit(f"authd: {e}")
+    users.ensure_default_admin(mgr)
+    daemon = AuthDaemon(mgr, args.socket or default_socket_path(), hash_workers=args.hash_workers,
+                        admin_uids={os.geteuid(), 0, *args.admin_uid})
+    asyncio.run(daemon.serve())
+
+
+if __name__ == "__main__":
+    main()
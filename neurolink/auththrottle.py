@@ -0,0 +1,164 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+
+class AuthThrottled(Exception):
+    """Login attempt refused before any hashing; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float, reason: str = "throttled"):
+        super().__init__(f"{reason}, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0 on success or the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class _UserState:
+    __slots__ = ("bucket", "failures", "locked_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.failures = 0
+        self.locked_until = 0.0
+
+
+class AuthThrottle:
+    """Admission control in front of PBKDF2 verification.
+
+    An attempt must get a token from its username's bucket and from the
+    global bucket, must not be inside the exponential backoff window that
+    follows `free_failures` consecutive failures, and must find a free
+    slot among `max_inflight` concurrent hash computations. Buckets and
+    backoff are kept per (username, client), so one client's bad guesses
+    don't lock everyone else out of an account. Attempts without a client
+    (typed at the kiosk itself) back off at most `backoff_max_local`
+    seconds, so whoever is at the screen can't hold `admin` locked for
+    long. Unknown usernames go through the same admission checks, wait
+    `hash_delay()` without hashing, and are counted by `reject_unknown`.
+    State is kept for at most `max_tracked` keys.
+    """
+
+    def __init__(self, user_rate: float = 0.2, user_burst: float = 5, global_rate: float = 2.0,
+                 global_burst: float = 10, max_inflight: int = 1, free_failures: int = 3,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0, backoff_max_local: float = 30.0,
+                 max_tracked: int = 1024):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.free_failures = free_failures
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.backoff_max_local = backoff_max_local
+        self.max_tracked = max_tracked
+        self._global = TokenBucket(global_rate, global_burst)
+        self._users: "OrderedDict[Tuple[str, Optional[str]], _UserState]" = OrderedDict()
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        # running estimate of one verification's wall time, slept by
+        # attempts on unknown usernames so they take as long as real ones
+        self._hash_wall_ewma = 0.1
+        self.counters: Dict[str, float] = {
+            "attempts": 0, "throttled": 0, "busy": 0, "unknown_user": 0,
+            "successes": 0, "failures": 0,
+            "hash_count": 0, "hash_cpu_seconds": 0.0, "hash_wall_seconds": 0.0,
+        }
+
+    def _state(self, username: str, client: Optional[str]) -> _UserState:
+        key = (username, client)
+        st = self._users.get(key)
+        if st is None:
+            st = self._users[key] = _UserState(TokenBucket(self.user_rate, self.user_burst))
+            if len(self._users) > self.max_tracked:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(key)
+        return st
+
+    def admit(self, username: str, client: Optional[str] = None) -> None:
+        """Raise AuthThrottled unless an attempt for `username` from `client` may proceed."""
+        now = time.monotonic()
+        with self._lock:
+            self.counters["attempts"] += 1
+            st = self._state(username, client)
+            wait = st.locked_until - now
+            reason = "too many failed attempts"
+            if wait <= 0:
+                wait = st.bucket.take(now)
+                reason = "too many attempts for this user"
+            if wait <= 0:
+                wait = self._global.take(now)
+                reason = "too many login attempts"
+            if wait > 0:
+                self.counters["throttled"] += 1
+                raise AuthThrottled(wait, reason)
+
+    @contextmanager
+    def hashing(self):
+        """Hold one of the in-flight hash slots and account its CPU time."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.counters["busy"] += 1
+            raise AuthThrottled(self._hash_wall_ewma, "verification busy")
+        cpu0 = time.thread_time()
+        wall0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            cpu = time.thread_time() - cpu0
+            wall = time.perf_counter() - wall0
+            self._slots.release()
+            with self._lock:
+                self.counters["hash_count"] += 1
+                self.counters["hash_cpu_seconds"] += cpu
+                self.counters["hash_wall_seconds"] += wall
+                # the first measurement replaces the guess outright
+                alpha = 1.0 if self.counters["hash_count"] == 1 else 0.2
+                self._hash_wall_ewma += alpha * (wall - self._hash_wall_ewma)
+
+    def hash_delay(self) -> float:
+        """Seconds a real verification currently takes (running average)."""
+        with self._lock:
+            return self._hash_wall_ewma
+
+    def reject_unknown(self, username: str, client: Optional[str] = None) -> None:
+        """Record a failed attempt for a username that doesn't exist."""
+        with self._lock:
+            self.counters["unknown_user"] += 1
+        self.record(username, False, client)
+
+    def record(self, username: str, ok: bool, client: Optional[str] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            st = self._state(username, client)
+            if ok:
+                self.counters["successes"] += 1
+                st.failures = 0
+                st.locked_until = 0.0
+                return
+            self.counters["failures"] += 1
+            st.failures += 1
+            over = st.failures - self.free_failures
+            if over >= 0:
+                cap = self.backoff_max if client is not None else self.backoff_max_local
+                st.locked_until = now + min(cap, self.backoff_base * (2 ** over))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.counters, hash_wall_estimate=self._hash_wall_ewma)
@@ -0,0 +1,51 @@
+"""Durable file writes shared by the user store, map state, asset build and caches."""
+import os
+import json
+import threading
+from typing import Any, Optional
+
+
+def fsync_dir(path: str) -> None:
+    """Make a rename of `path` durable by syncing its directory."""
+    # directories can't be opened on Windows
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_temp_json(path: str, data: Any, indent: Optional[int] = 2) -> str:
+    """Write `data` to a synced temp file next to `path`; returns the temp path."""
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+
+def replace_synced(tmp: str, path: str) -> None:
+    """Sync the finished file `tmp`, rename it to `path` and sync the rename."""
+    fd = os.open(tmp, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = 2) -> None:
+    """Write `data` to `path` via temp file + fsync + rename.
+
+    Readers (and a power cut) see either the old file or the new one,
+    never a truncated mix.
+    """
+    os.replace(write_temp_json(path, data, indent), path)
+    fsync_dir(path)
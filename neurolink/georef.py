@@ -0,0 +1,250 @@
+"""Georeferencing: map pixels <-> longitude/latitude.
+
+A map is calibrated with control points (pixel x, y and the lon, lat found
+there) or with the lon/lat bounds of its edges. From three or more points an
+affine transform is fitted by least squares; from four or more a projective
+one can be, which also absorbs a scanned map that is slightly skewed. Lon/lat
+are treated as plane coordinates, which is fine for the area a field map
+covers.
+
+The calibration lives next to the map as `<map>.georef.json`:
+
+    {"kind": "affine", "points": [[px, py, lon, lat], ...]}
+    {"bounds": [west, south, east, north]}
+
+    python3 georef.py fit assets/map.png --point 0 0 121.40 31.30 --point 4000 0 121.55 31.30 \\
+        --point 0 3000 121.40 31.18
+    python3 georef.py fit assets/map.png --bounds 121.40 31.18 121.55 31.30
+    python3 georef.py show assets/map.png
+
+`to_pixels` / `to_lonlat` take whole sequences and convert them in one
+NumPy call when NumPy is installed (pure Python otherwise).
+"""
+import os
+import sys
+import json
+import argparse
+from typing import List, Optional, Sequence, Tuple
+
+from fsutil import atomic_write_json
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+GEOREF_SUFFIX = ".georef.json"
+KINDS = ("affine", "projective")
+
+
+def georef_path_for(map_path: str) -> str:
+    return map_path + GEOREF_SUFFIX
+
+
+def _solve(a: List[List[float]], b: List[float]) -> List[float]:
+    # Gaussian elimination with partial pivoting, for the no-NumPy path
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        piv = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[piv][col]) < 1e-12:
+            raise ValueError("control points are degenerate (collinear or repeated)")
+        m[col], m[piv] = m[piv], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def _lstsq(rows: List[List[float]], rhs: List[float]) -> List[float]:
+    if NUMPY_AVAILABLE:
+        a = np.asarray(rows, dtype=float)
+        sol, _, rank, _ = np.linalg.lstsq(a, np.asarray(rhs, dtype=float), rcond=None)
+        if rank < a.shape[1]:
+            raise ValueError("control points are degenerate (collinear or repeated)")
+        return sol.tolist()
+    # normal equations
+    k = len(rows[0])
+    ata = [[sum(r[i] * r[j] for r in rows) for j in range(k)] for i in range(k)]
+    atb = [sum(r[i] * v for r, v in zip(rows, rhs)) for i in range(k)]
+    return _solve(ata, atb)
+
+
+def _invert3(m: Sequence[Sequence[float]]) -> List[List[float]]:
+    (a, b, c), (d, e, f), (g, h, i) = m
+    det = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+    if abs(det) < 1e-18:
+        raise ValueError("georeference is not invertible")
+    return [[(e * i - f * h) / det, (c * h - b * i) / det, (b * f - c * e) / det],
+            [(f * g - d * i) / det, (a * i - c * g) / det, (c * d - a * f) / det],
+            [(d * h - e * g) / det, (b * g - a * h) / det, (a * e - b * d) / det]]
+
+
+def _apply(m, xs, ys):
+    # 3x3 homogeneous transform over sequences
+    if NUMPY_AVAILABLE:
+        x = np.asarray(xs, dtype=float)
+        y = np.asarray(ys, dtype=float)
+        w = m[2][0] * x + m[2][1] * y + m[2][2]
+        return (m[0][0] * x + m[0][1] * y + m[0][2]) / w, (m[1][0] * x + m[1][1] * y + m[1][2]) / w
+    ox, oy = [], []
+    (a, b, c), (d, e, f), (g, h, i) = m
+    for x, y in zip(xs, ys):
+        w = g * x + h * y + i
+        ox.append((a * x + b * y + c) / w)
+        oy.append((d * x + e * y + f) / w)
+    return ox, oy
+
+
+class Georeference:
+    """A fitted pixel -> lon/lat transform (3x3, homogeneous) and its inverse."""
+
+    def __init__(self, matrix, kind: str = "affine", points=None):
+        self.kind = kind
+        self.matrix = [list(map(float, row)) for row in matrix]
+        self.inverse = _invert3(self.matrix)
+        self.points = [tuple(map(float, p)) for p in (points or [])]
+
+    @classmethod
+    def fit(cls, points: Sequence[Sequence[float]], kind: str = "affine") -> "Georeference":
+        """Fit from [(px, py, lon, lat), ...]."""
+        if kind not in KINDS:
+            raise ValueError(f"unknown georeference kind {kind!r}")
+        need = 3 if kind == "affine" else 4
+        if len(points) < need:
+            raise ValueError(f"{kind} georeference needs at least {need} control points")
+        if kind == "affine":
+            rows = [[px, py, 1.0] for px, py, _, _ in points]
+            a = _lstsq(rows, [lon for _, _, lon, _ in points])
+            b = _lstsq(rows, [lat for _, _, _, lat in points])
+            m = [a, b, [0.0, 0.0, 1.0]]
+        else:
+            # lon = (a px + b py + c) / (g px + h py + 1), same for lat
+            rows, rhs = [], []
+            for px, py, lon, lat in points:
+                rows.append([px, py, 1.0, 0.0, 0.0, 0.0, -px * lon, -py * lon])
+                rhs.append(lon)
+                rows.append([0.0, 0.0, 0.0, px, py, 1.0, -px * lat, -py * lat])
+                rhs.append(lat)
+            h = _lstsq(rows, rhs)
+            m = [h[0:3], h[3:6], [h[6], h[7], 1.0]]
+        return cls(m, kind, points)
+
+    @classmethod
+    def from_bounds(cls, width: float, height: float, west: float, south: float,
+                    east: float, north: float) -> "Georeference":
+        """A north-up map whose edges lie on the given longitudes/latitudes."""
+        points = [(0, 0, west, north), (width, 0, east, north), (0, height, west, south), (width, height, east, south)]
+        return cls.fit(points, "affine")
+
+    def to_lonlat(self, xs, ys):
+        """Map pixels -> (lons, lats); arrays with NumPy, lists without."""
+        return _apply(self.matrix, xs, ys)
+
+    def to_pixels(self, lons, lats):
+        """Lon/lat -> map pixels (level 0); arrays with NumPy, lists without."""
+        return _apply(self.inverse, lons, lats)
+
+    def pixel(self, lon: float, lat: float) -> Tuple[float, float]:
+        xs, ys = self.to_pixels([lon], [lat])
+        return float(xs[0]), float(ys[0])
+
+    def lonlat(self, x: float, y: float) -> Tuple[float, float]:
+        lons, lats = self.to_lonlat([x], [y])
+        return float(lons[0]), float(lats[0])
+
+    def residual(self) -> Optional[float]:
+        """RMS error of the control points, in map pixels."""
+        if not self.points:
+            return None
+        xs, ys = self.to_pixels([p[2] for p in self.points], [p[3] for p in self.points])
+        err = sum((float(x) - p[0]) ** 2 + (float(y) - p[1]) ** 2 for x, y, p in zip(xs, ys, self.points))
+        return (err / len(self.points)) ** 0.5
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "points": [list(p) for p in self.points], "matrix": self.matrix}
+
+
+def from_dict(data: dict, size: Optional[Tuple[int, int]] = None) -> Georeference:
+    if data.get("points"):
+        return Georeference.fit(data["points"], data.get("kind", "affine"))
+    if data.get("bounds"):
+        if size is None:
+            raise ValueError("bounds need the map size")
+        return Georeference.from_bounds(size[0], size[1], *map(float, data["bounds"]))
+    if data.get("matrix"):
+        return Georeference(data["matrix"], data.get("kind", "affine"))
+    raise ValueError("georeference needs points, bounds or matrix")
+
+
+def load_georef(map_path: str, size: Optional[Tuple[int, int]] = None) -> Optional[Georeference]:
+    """The calibration saved next to `map_path`, or None if there is none."""
+    path = georef_path_for(map_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return from_dict(json.load(f), size)
+
+
+def save_georef(map_path: str, georef: Georeference) -> str:
+    path = georef_path_for(map_path)
+    atomic_write_json(path, georef.to_dict())
+    return path
+
+
+def _map_size(map_path: str) -> Tuple[int, int]:
+    import mbtiles
+    if map_path.endswith(mbtiles.MBTILES_SUFFIX):
+        src = mbtiles.MBTilesSource(map_path)
+        try:
+            return src.size
+        finally:
+            src.close()
+    import mappyramid
+    # only the header is read
+    with mappyramid.open_source_image(map_path) as img:
+        return img.size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="georef.py", description="calibrate a map to longitude/latitude")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("fit", help="fit and save a georeference for a map")
+    p.add_argument("map")
+    p.add_argument("--point", nargs=4, type=float, action="append", metavar=("PX", "PY", "LON", "LAT"),
+                   help="control point: map pixel and its lon/lat (repeat)")
+    p.add_argument("--bounds", nargs=4, type=float, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                   help="lon/lat of the map edges, for a north-up map")
+    p.add_argument("--kind", choices=KINDS, default="affine")
+    p = sub.add_parser("show", help="print a map's georeference")
+    p.add_argument("map")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "fit":
+        if args.bounds:
+            w, h = _map_size(args.map)
+            g = Georeference.from_bounds(w, h, *args.bounds)
+        elif args.point:
+            g = Georeference.fit(args.point, args.kind)
+        else:
+            sys.exit("give --point (3+ times) or --bounds")
+        path = save_georef(args.map, g)
+        print(f"{path}: {g.kind}, {len(g.points)} points, rms {g.residual():.2f} px")
+        return
+    g = load_georef(args.map, _map_size(args.map))
+    if g is None:
+        sys.exit(f"{args.map}: no georeference ({georef_path_for(args.map)})")
+    w, h = _map_size(args.map)
+    corners = g.to_lonlat([0, w, w, 0], [0, 0, h, h])
+    print(f"{args.map}: {g.kind}, {len(g.points)} points, rms {g.residual() or 0:.2f} px")
+    for name, lon, lat in zip(("NW", "NE", "SE", "SW"), *corners):
+        print(f"  {name} {float(lon):.6f} {float(lat):.6f}")
+
+
+if __name__ == "__main__":
+    main()
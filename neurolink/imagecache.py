@@ -0,0 +1,206 @@
+"""On-disk cache of scaled UI images, ready for `tk.PhotoImage(file=...)`.
+
+Entries are keyed by the SHA-256 of the source file, the variant (target
+size, resample filter, ...) and the output format, so a changed logo or a
+new screen size simply misses. Hits need neither Pillow nor any decoding
+beyond Tk's own PNG/PPM reader. PNG keeps alpha; PPM is for opaque
+images and is the quickest for Tk to load.
+
+The cache lives in `.cache/images` under the package root
+(`NEUROLINK_IMAGE_CACHE` to move it) and is trimmed, least recently used
+first, to `NEUROLINK_IMAGE_CACHE_MB` (default 32).
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import Callable, Dict, Optional
+
+from fsutil import atomic_write_json, replace_synced
+
+IMAGE_CACHE_ENV = "NEUROLINK_IMAGE_CACHE"
+IMAGE_CACHE_MB_ENV = "NEUROLINK_IMAGE_CACHE_MB"
+DEFAULT_LIMIT_MB = 32
+FORMATS = {"png": "PNG", "ppm": "PPM"}
+# remembers source hashes by (size, mtime) so a hit doesn't reread the source
+HASHES_FILE = "hashes.json"
+
+
+def default_cache_dir() -> str:
+    base = os.path.abspath(os.path.dirname(__file__))
+    return os.environ.get(IMAGE_CACHE_ENV) or os.path.join(base, ".cache", "images")
+
+
+def default_limit_bytes() -> int:
+    try:
+        mb = float(os.environ.get(IMAGE_CACHE_MB_ENV, DEFAULT_LIMIT_MB))
+    except ValueError:
+        mb = DEFAULT_LIMIT_MB
+    return int(mb * 1024 * 1024)
+
+
+def _resample(name: str):
+    from PIL import Image
+    filters = getattr(Image, "Resampling", Image)
+    return getattr(filters, name.upper())
+
+
+class ImageCache:
+    def __init__(self, directory: Optional[str] = None, limit_bytes: Optional[int] = None):
+        self.directory = directory or default_cache_dir()
+        self.limit_bytes = default_limit_bytes() if limit_bytes is None else limit_bytes
+        self._lock = threading.Lock()
+        self._hashes: Optional[Dict[str, list]] = None
+
+    # -- keys --------------------------------------------------------------
+
+    def _load_hashes(self) -> Dict[str, list]:
+        if self._hashes is None:
+            try:
+                with open(os.path.join(self.directory, HASHES_FILE), "r", encoding="utf-8") as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        return self._hashes
+
+    def source_hash(self, path: str) -> str:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            known = self._load_hashes().get(path)
+            if known and known[:2] == stamp:
+                return known[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._load_hashes()[path] = stamp + [digest]
+            self._save_hashes()
+        return digest
+
+    def _save_hashes(self) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write_json(os.path.join(self.directory, HASHES_FILE), self._hashes, indent=None)
+        except OSError:
+            pass
+
+    def entry_path(self, source: str, variant: str, fmt: str = "png") -> str:
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported cache format {fmt!r}")
+        key = hashlib.sha256(f"{self.source_hash(source)}|{variant}|{fmt}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key[:32]}.{fmt}")
+
+    # -- entries -----------------------------------------------------------
+
+    def lookup(self, source: str, variant: str, fmt: str = "png") -> Optional[str]:
+        """Path of the cached entry, or None. A hit counts as a use for LRU."""
+        p = self.entry_path(source, variant, fmt)
+        try:
+            os.utime(p)
+        except OSError:
+            return None
+        return p
+
+    def store(self, source: str, variant: str, image, fmt: str = "png") -> str:
+        """Save a PIL image as the entry for (source, variant); returns its path."""
+        p = self.entry_path(source, variant, fmt)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{p}.tmp-{os.getpid()}-{threading.get_ident()}"
+        if fmt == "ppm" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(tmp, format=FORMATS[fmt], **({"compress_level": 1} if fmt == "png" else {}))
+        replace_synced(tmp, p)
+        self.evict(keep=os.path.basename(p))
+        return p
+
+    def get_or_render(self, source: str, variant: str, render: Callable[[], "object"],
+                      fmt: str = "png") -> Optional[str]:
+        """Cached entry for (source, variant), rendering it with `render()` (a PIL image) on a miss.
+
+        Returns None if the entry can't be produced (e.g. no Pillow), so
+        callers can fall back to loading the source themselves.
+        """
+        try:
+            hit = self.lookup(source, variant, fmt)
+            if hit:
+                return hit
+            return self.store(source, variant, render(), fmt)
+        except Exception as e:
+            print(f"[imagecache] {os.path.basename(source)} {variant}: {e}")
+            return None
+
+    def scaled_to_width(self, source: str, width: int, resample: str = "lanczos",
+                        fmt: str = "png", background: Optional[str] = None) -> Optional[str]:
+        """`source` scaled to `width` px wide (aspect kept); with `background`, flattened onto it."""
+        def render():
+            from PIL import Image
+            img = Image.open(source)
+            ow, oh = img.size
+            height = max(1, round(oh * width / ow))
+            # JPEG can decode at 1/2, 1/4, 1/8 scale, much faster than full size
+            img.draft("RGB", (width, height))
+            img = img.convert("RGBA").resize((width, height), _resample(resample))
+            if background is not None:
+                flat = Image.new("RGB", img.size, background)
+                flat.paste(img, mask=img.getchannel("A"))
+                img = flat
+            return img
+
+        variant = f"w{int(width)}|{resample}|bg={background}"
+        return self.get_or_render(source, variant, render, fmt)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete least recently used entries until the cache fits its limit; returns bytes freed.
+
+        The entry named `keep` (the one just stored) survives even if it
+        alone is over the limit.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        entries = []
+        total = 0
+        for name in names:
+            if os.path.splitext(name)[1][1:] not in FORMATS:
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total += st.st_size
+            if name != keep:
+                entries.append((st.st_mtime, st.st_size, name))
+        freed = 0
+        entries.sort()
+        while total > self.limit_bytes and entries:
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            freed += size
+        return freed
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else ():
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        self._hashes = {}
+
+
+_cache = None
+
+
+def get_cache() -> ImageCache:
+    global _cache
+    if _cache is None:
+        _cache = ImageCache()
+    return _cache
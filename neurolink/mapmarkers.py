@@ -0,0 +1,263 @@
+import math
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+# how each kind of marker is drawn; sizes are screen pixels
+STYLES: Dict[str, Dict[str, Any]] = {
+    "self": {"shape": "arrow", "fill": "red", "outline": "black", "size": 12},
+    "unit": {"shape": "triangle", "fill": "#3a7bd5", "outline": "black", "size": 8},
+    "waypoint": {"shape": "circle", "fill": "#f5c542", "outline": "black", "size": 6},
+    "report": {"shape": "square", "fill": "#e0533d", "outline": "black", "size": 6},
+}
+LAYER_TAG = "_marker"
+# hidden canvas items kept per item type for reuse
+POOL_LIMIT = 512
+
+
+class GridIndex:
+    """Uniform grid over map coordinates: id -> cell and cell -> ids."""
+
+    def __init__(self, cell: float = 512.0):
+        self.cell = cell
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._where: Dict[Hashable, Tuple[int, int]] = {}
+
+    def _key(self, x: float, y: float) -> Tuple[int, int]:
+        return int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+
+    def insert(self, mid: Hashable, x: float, y: float) -> None:
+        key = self._key(x, y)
+        old = self._where.get(mid)
+        if old == key:
+            return
+        if old is not None:
+            self._discard(mid, old)
+        self._where[mid] = key
+        self._cells.setdefault(key, set()).add(mid)
+
+    def remove(self, mid: Hashable) -> None:
+        old = self._where.pop(mid, None)
+        if old is not None:
+            self._discard(mid, old)
+
+    def _discard(self, mid: Hashable, key: Tuple[int, int]) -> None:
+        ids = self._cells[key]
+        ids.discard(mid)
+        if not ids:
+            del self._cells[key]
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> Set[Hashable]:
+        """Ids in cells overlapping the box (a superset of the ids inside it)."""
+        kx0, ky0 = self._key(x0, y0)
+        kx1, ky1 = self._key(x1, y1)
+        out: Set[Hashable] = set()
+        if (kx1 - kx0 + 1) * (ky1 - ky0 + 1) > len(self._cells):
+            # box covers more cells than are occupied: walk the occupied ones
+            for (kx, ky), ids in self._cells.items():
+                if kx0 <= kx <= kx1 and ky0 <= ky <= ky1:
+                    out |= ids
+            return out
+        for kx in range(kx0, kx1 + 1):
+            for ky in range(ky0, ky1 + 1):
+                ids = self._cells.get((kx, ky))
+                if ids:
+                    out |= ids
+        return out
+
+
+class Marker:
+    __slots__ = ("id", "x", "y", "style", "label", "items")
+
+    def __init__(self, mid: Hashable, x: float, y: float, style: str, label: Optional[str]):
+        self.id = mid
+        self.x = x
+        self.y = y
+        self.style = style
+        self.label = label
+        # [(item type, canvas id)] while on screen, else empty
+        self.items: List[Tuple[str, int]] = []
+
+
+def _shape_items(shape: str, px: float, py: float, size: float) -> List[Tuple[str, List[float]]]:
+    if shape == "arrow":
+        return [("polygon", [px, py - size, px - size / 2, py + size, px + size / 2, py + size]),
+                ("oval", [px - 3, py - 3, px + 3, py + 3])]
+    if shape == "triangle":
+        return [("polygon", [px, py - size, px - size, py + size * 0.8, px + size, py + size * 0.8])]
+    if shape == "square":
+        return [("polygon", [px - size, py - size, px + size, py - size, px + size, py + size, px - size, py + size])]
+    return [("oval", [px - size, py - size, px + size, py + size])]
+
+
+class MarkerLayer:
+    """Many map objects drawn on a canvas, updated incrementally.
+
+    Markers live in map coordinates (level-0 pixels) and are indexed in a
+    `GridIndex`, so each view change only visits markers near the viewport:
+    markers that scroll out hide their canvas items and return them to a
+    pool, markers that scroll in take items from it. A pure pan moves the
+    whole layer with one `canvas.move`; `move` and `set_style` only touch
+    the marker concerned.
+    """
+
+    def __init__(self, canvas, styles: Optional[Dict[str, Dict[str, Any]]] = None,
+                 scale: float = 1.0, cell: float = 512.0):
+        self.canvas = canvas
+        self.styles = dict(STYLES, **(styles or {}))
+        self.scale = scale
+        self.index = GridIndex(cell)
+        self.markers: Dict[Hashable, Marker] = {}
+        self.view = None
+        self._visible: Set[Hashable] = set()
+        self._pool: Dict[str, List[int]] = {}
+        self._label_font = ("TkDefaultFont", int(9 * scale))
+        # cull margin in screen px: the largest marker, so half-visible ones stay
+        self._margin = max(st.get("size", 8) for st in self.styles.values()) * scale * 2 + 40
+
+    def __len__(self) -> int:
+        return len(self.markers)
+
+    def __contains__(self, mid: Hashable) -> bool:
+        return mid in self.markers
+
+    def get(self, mid: Hashable) -> Optional[Marker]:
+        return self.markers.get(mid)
+
+    def visible_ids(self) -> Set[Hashable]:
+        return set(self._visible)
+
+    # -- model -------------------------------------------------------------
+
+    def add(self, mid: Hashable, x: float, y: float, style: str = "unit", label: Optional[str] = None) -> Marker:
+        if mid in self.markers:
+            raise ValueError(f"marker {mid!r} exists")
+        m = self.markers[mid] = Marker(mid, float(x), float(y), style, label)
+        self.index.insert(mid, m.x, m.y)
+        self._refresh(m)
+        return m
+
+    def move(self, mid: Hashable, x: float, y: float) -> None:
+        m = self.markers[mid]
+        m.x, m.y = float(x), float(y)
+        self.index.insert(mid, m.x, m.y)
+        self._refresh(m)
+
+    def set_style(self, mid: Hashable, style: Optional[str] = None, label: Any = ...) -> None:
+        m = self.markers[mid]
+        if style is not None:
+            m.style = style
+        if label is not ...:
+            m.label = label
+        # shapes may differ: draw from scratch
+        self._hide(m)
+        self._refresh(m)
+
+    def remove(self, mid: Hashable) -> None:
+        m = self.markers.pop(mid)
+        self.index.remove(mid)
+        self._visible.discard(mid)
+        self._hide(m)
+
+    def clear(self) -> None:
+        for mid in list(self.markers):
+            self.remove(mid)
+
+    # -- view --------------------------------------------------------------
+
+    def _in_view(self, m: Marker) -> bool:
+        v = self.view
+        if v is None:
+            return False
+        sx, sy = v.to_screen(m.x, m.y)
+        r = self._margin
+        return -r <= sx <= v.width + r and -r <= sy <= v.height + r
+
+    def set_view(self, view) -> None:
+        """Re-cull and reposition for a new `maptiles.View`."""
+        old, self.view = self.view, view
+        r = self._margin / view.zoom
+        x0, y0 = view.to_map(0, 0)
+        x1, y1 = view.to_map(view.width, view.height)
+        candidates = self.index.query(x0 - r, y0 - r, x1 + r, y1 + r)
+        now = {mid for mid in candidates if self._in_view(self.markers[mid])}
+        for mid in self._visible - now:
+            self._hide(self.markers[mid])
+        if old is not None and (old.zoom, old.width, old.height) == (view.zoom, view.width, view.height):
+            # pure pan: shift everything already drawn in one call
+            dx = (old.cx - view.cx) * view.zoom
+            dy = (old.cy - view.cy) * view.zoom
+            if dx or dy:
+                self.canvas.move(LAYER_TAG, dx, dy)
+            for mid in now - self._visible:
+                self._draw(self.markers[mid])
+        else:
+            for mid in now:
+                self._draw(self.markers[mid])
+        self._visible = now
+
+    def hit_test(self, sx: float, sy: float, radius: float = 12.0) -> Optional[Hashable]:
+        """Id of the visible marker nearest to screen point (sx, sy) within `radius` px."""
+        v = self.view
+        if v is None:
+            return None
+        radius *= self.scale
+        mx, my = v.to_map(sx, sy)
+        r = radius / v.zoom
+        best, best_d = None, radius * radius
+        for mid in self.index.query(mx - r, my - r, mx + r, my + r):
+            if mid not in self._visible:
+                continue
+            px, py = v.to_screen(self.markers[mid].x, self.markers[mid].y)
+            d = (px - sx) ** 2 + (py - sy) ** 2
+            if d <= best_d:
+                best, best_d = mid, d
+        return best
+
+    # -- canvas ------------------------------------------------------------
+
+    def _refresh(self, m: Marker) -> None:
+        if self._in_view(m):
+            self._draw(m)
+            self._visible.add(m.id)
+        elif m.id in self._visible:
+            self._hide(m)
+            self._visible.discard(m.id)
+
+    def _take(self, kind: str) -> int:
+        pool = self._pool.get(kind)
+        if pool:
+            return pool.pop()
+        if kind == "polygon":
+            return self.canvas.create_polygon(0, 0, 0, 0, tags=(LAYER_TAG,))
+        if kind == "oval":
+            return self.canvas.create_oval(0, 0, 0, 0, tags=(LAYER_TAG,))
+        return self.canvas.create_text(0, 0, anchor="w", tags=(LAYER_TAG,))
+
+    def _draw(self, m: Marker) -> None:
+        style = self.styles.get(m.style) or self.styles["unit"]
+        size = style.get("size", 8) * self.scale
+        px, py = self.view.to_screen(m.x, m.y)
+        wanted = _shape_items(style.get("shape", "circle"), px, py, size)
+        if m.label:
+            wanted.append(("text", [px + size + 4, py]))
+        if [k for k, _ in m.items] != [k for k, _ in wanted]:
+            self._hide(m)
+            m.items = [(kind, self._take(kind)) for kind, _ in wanted]
+            for i, ((kind, item), (_, coords)) in enumerate(zip(m.items, wanted)):
+                if kind == "text":
+                    self.canvas.itemconfig(item, text=m.label, fill=style.get("label", "white"),
+                                           font=self._label_font, state="normal")
+                else:
+                    fill = "yellow" if style.get("shape") == "arrow" and i == 1 else style.get("fill", "white")
+                    self.canvas.itemconfig(item, fill=fill, outline=style.get("outline", "black"), state="normal")
+        for (_, item), (_, coords) in zip(m.items, wanted):
+            self.canvas.coords(item, *coords)
+
+    def _hide(self, m: Marker) -> None:
+        for kind, item in m.items:
+            pool = self._pool.setdefault(kind, [])
+            if len(pool) < POOL_LIMIT:
+                self.canvas.itemconfig(item, state="hidden")
+                pool.append(item)
+            else:
+                self.canvas.delete(item)
+        m.items = []
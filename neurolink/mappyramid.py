@@ -0,0 +1,437 @@
+import io
+import os
+import sys
+import json
+import math
+import zlib
+import shutil
+import struct
+import hashlib
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fsutil import atomic_write_json
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+# stop halving once the longer side is at most this
+MIN_LEVEL_SIDE = 256
+TILE_SIZE = 256
+PYRAMID_SUFFIX = ".pyramid"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+# largest map accepted, in pixels (Pillow's own limit is far below survey maps)
+MAX_MAP_PIXELS = 1 << 31
+# Image.MAX_IMAGE_PIXELS is process-global; only lift it holding this
+_PIXEL_LIMIT_LOCK = threading.Lock()
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# samples per pixel by PNG colour type
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# chunks besides IHDR and IDAT that decoding a strip needs
+_PNG_KEEP = (b"PLTE", b"tRNS")
+
+
+def file_sha256(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def pyramid_dir_for(map_path: str) -> str:
+    return map_path + PYRAMID_SUFFIX
+
+
+def _halve(img: "Image.Image") -> "Image.Image":
+    # 2x2 box average; exact for halving and much cheaper than LANCZOS.
+    # Odd sides round up, so halving bands of even height matches halving
+    # the whole image.
+    if hasattr(img, "reduce"):
+        return img.reduce(2)
+    return img.resize(((img.width + 1) // 2, (img.height + 1) // 2), Image.BOX)
+
+
+def open_source_image(path: str) -> "Image.Image":
+    """Open a map image without decoding it (only the header is read).
+
+    Pillow's size check runs in `Image.open`, so the limit is lifted just
+    for that call and MAX_MAP_PIXELS applied instead; decoding later
+    isn't checked again. Raises ValueError for larger images.
+    """
+    with _PIXEL_LIMIT_LOCK:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            img = Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+    if img.width * img.height > MAX_MAP_PIXELS:
+        img.close()
+        raise ValueError(f"{path}: {img.width}x{img.height} is larger than {MAX_MAP_PIXELS} pixels")
+    return img
+
+
+def level_sizes(size: Tuple[int, int], min_side: int = MIN_LEVEL_SIDE) -> List[Tuple[int, int]]:
+    """(width, height) per level, from full resolution down to the first that fits `min_side`."""
+    w, h = size
+    sizes = [(w, h)]
+    while max(w, h) > min_side:
+        w, h = (w + 1) // 2, (h + 1) // 2
+        sizes.append((w, h))
+    return sizes
+
+
+def iter_tiles(img: "Image.Image", tile_size: int) -> Iterator[Tuple[int, int, "Image.Image"]]:
+    """(col, row, tile) covering `img`; edge tiles are cut short, not padded."""
+    for row in range(math.ceil(img.height / tile_size)):
+        for col in range(math.ceil(img.width / tile_size)):
+            box = (col * tile_size, row * tile_size,
+                   min(img.width, (col + 1) * tile_size), min(img.height, (row + 1) * tile_size))
+            yield col, row, img.crop(box)
+
+
+def _png_chunk(ctype: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(data, zlib.crc32(ctype))
+    return struct.pack(">I", len(data)) + ctype + data + struct.pack(">I", crc)
+
+
+def _png_layout(path: str) -> Optional[Tuple[int, int, int]]:
+    """(width, height, colour type) of a PNG that can be read in strips, else None."""
+    with open(path, "rb") as f:
+        head = f.read(8 + 8 + 13)
+    if len(head) < 29 or head[:8] != _PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return None
+    w, h, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", head[16:29])
+    # 8 bits per sample: a row's raw bytes are what Pillow hands back
+    if depth != 8 or interlace or color not in _PNG_CHANNELS:
+        return None
+    return w, h, color
+
+
+def _iter_png_strips(path: str, rows: int, mode: str) -> Iterator["Image.Image"]:
+    """`rows`-high strips of a PNG accepted by `_png_layout`, top to bottom.
+
+    The IDAT stream is inflated incrementally and each strip's scanlines
+    are wrapped as a small PNG of their own for Pillow to unfilter, so the
+    whole image is never in memory.
+    """
+    w, h, color = _png_layout(path)
+    stride = 1 + w * _PNG_CHANNELS[color]
+    ihdr = b""
+    keep = []
+    inflate = zlib.decompressobj()
+    buf = bytearray()
+    prev = None  # last row of the previous strip, unfiltered
+    y = 0
+    with open(path, "rb") as f:
+        f.read(len(_PNG_SIGNATURE))
+        while y < h:
+            head = f.read(8)
+            if len(head) < 8:
+                raise ValueError(f"{path}: truncated PNG")
+            length, ctype = struct.unpack(">I4s", head)
+            if ctype != b"IDAT":
+                data = f.read(length)
+                if ctype == b"IHDR":
+                    ihdr = data
+                elif ctype in _PNG_KEEP:
+                    keep.append(_png_chunk(ctype, data))
+                elif ctype == b"IEND":
+                    raise ValueError(f"{path}: truncated PNG")
+                f.read(4)
+                continue
+            left = length
+            while left and y < h:
+                pending = f.read(min(left, 1 << 20))
+                left -= len(pending)
+                while y < h:
+                    # bounded output: one strip's worth at a time; a full
+                    # chunk of output may mean more is still held back
+                    out = inflate.decompress(pending, stride * rows)
+                    buf += out
+                    pending = inflate.unconsumed_tail
+                    while y < h and len(buf) >= stride * min(rows, h - y):
+                        n = min(rows, h - y)
+                        strip, prev = _png_strip(ihdr, keep, bytes(buf[:stride * n]), n, prev, mode)
+                        del buf[:stride * n]
+                        y += n
+                        yield strip
+                    if not pending and len(out) < stride * rows:
+                        break
+            f.seek(left + 4, os.SEEK_CUR)
+
+
+def _png_strip(ihdr: bytes, keep: List[bytes], data: bytes, rows: int, prev: Optional[bytes],
+               mode: str) -> Tuple["Image.Image", bytes]:
+    # the first row's filter may refer to the row above it, so that row
+    # goes in front, stored unfiltered (filter type 0)
+    skip = 0
+    if prev is not None:
+        data = b"\x00" + prev + data
+        skip = 1
+    width = struct.unpack(">I", ihdr[:4])[0]
+    png = b"".join((
+        _PNG_SIGNATURE,
+        _png_chunk(b"IHDR", struct.pack(">II", width, rows + skip) + ihdr[8:]),
+        *keep,
+        _png_chunk(b"IDAT", zlib.compress(data, 0)),
+        _png_chunk(b"IEND", b""),
+    ))
+    img = Image.open(io.BytesIO(png))
+    img.load()
+    last = img.crop((0, img.height - 1, width, img.height)).tobytes()
+    if img.mode != mode:
+        img = img.convert(mode)
+    if skip:
+        img = img.crop((0, skip, width, img.height))
+    return img, last
+
+
+def iter_source_strips(path: str, rows: int, mode: str) -> Iterator["Image.Image"]:
+    """`rows`-high strips of the map image at `path` in `mode`, top to bottom.
+
+    8-bit non-interlaced PNGs are decoded a strip at a time; anything else
+    is decoded whole first.
+    """
+    if _png_layout(path) is not None:
+        yield from _iter_png_strips(path, rows, mode)
+        return
+    img = open_source_image(path).convert(mode)
+    for top in range(0, img.height, rows):
+        yield img.crop((0, top, img.width, min(img.height, top + rows)))
+
+
+def _take_rows(strips: List["Image.Image"], rows: int) -> "Image.Image":
+    # the first `rows` rows of a queue of strips, removed from it
+    first = strips[0]
+    if first.height == rows:
+        return strips.pop(0)
+    band = Image.new(first.mode, (first.width, rows))
+    y = 0
+    while y < rows:
+        s = strips[0]
+        n = min(s.height, rows - y)
+        if n == s.height:
+            band.paste(strips.pop(0), (0, y))
+        else:
+            band.paste(s.crop((0, 0, s.width, n)), (0, y))
+            strips[0] = s.crop((0, n, s.width, s.height))
+        y += n
+    return band
+
+
+def build_tiles(path: str, mode: str, tile_size: int,
+                on_tile: Callable[[int, int, int, "Image.Image"], None],
+                min_side: int = MIN_LEVEL_SIDE) -> List[Tuple[int, int]]:
+    """Cut the map image at `path` into tiles at every pyramid level.
+
+    Calls `on_tile(level, col, row, tile)` for each tile, levels
+    interleaved, and returns the level sizes. The source is read in strips
+    one tile high and each level keeps only its current band of rows,
+    which is halved into the next level once cut, so memory stays at a few
+    tile rows per level however large the map is. `tile_size` must be even.
+    """
+    with open_source_image(path) as img:
+        sizes = level_sizes(img.size, min_side)
+    pending: List[List["Image.Image"]] = [[] for _ in sizes]
+    cut = [0] * len(sizes)
+
+    def push(level: int, strip: Optional["Image.Image"], last: bool) -> None:
+        strips = pending[level]
+        if strip is not None:
+            strips.append(strip)
+        have = sum(s.height for s in strips)
+        while have >= tile_size or (last and have):
+            band = _take_rows(strips, min(tile_size, have))
+            have -= band.height
+            for col, _, tile in iter_tiles(band, tile_size):
+                on_tile(level, col, cut[level] // tile_size, tile)
+            cut[level] += band.height
+            if level + 1 < len(sizes):
+                push(level + 1, _halve(band), False)
+        if last and level + 1 < len(sizes):
+            push(level + 1, None, True)
+
+    for strip in iter_source_strips(path, tile_size, mode):
+        push(0, strip, False)
+    push(0, None, True)
+    if cut != [h for _, h in sizes]:
+        raise ValueError(f"{path}: expected {sizes}, cut {cut} rows")
+    return sizes
+
+
+TileKey = Tuple[int, int, int]  # (level, col, row)
+
+
+class TileSource:
+    """One map as tiles at successive half resolutions.
+
+    Level 0 is full resolution; level i is roughly 1/2**i of it. Subclasses
+    fill in `levels` and implement `load_tile`; `load_tiles` may be
+    overridden to fetch several tiles in one go.
+    """
+
+    mode = "RGBA"
+    tile_size = TILE_SIZE
+
+    def __init__(self):
+        # (width, height) per level
+        self.levels: List[Tuple[int, int]] = []
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.levels[0]
+
+    def grid(self, level: int, size: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+        """(columns, rows) of tiles at `level`."""
+        w, h = size or self.levels[level]
+        return math.ceil(w / self.tile_size), math.ceil(h / self.tile_size)
+
+    def level_index_for(self, scale: float) -> int:
+        """Coarsest level that still has at least one source pixel per screen pixel.
+
+        `scale` is screen pixels per level-0 pixel, i.e. the zoom.
+        """
+        if scale <= 0:
+            return len(self.levels) - 1
+        best = 0
+        for i in range(1, len(self.levels)):
+            if scale * (2 ** i) <= 1.0:
+                best = i
+            else:
+                break
+        return best
+
+    def load_tile(self, level: int, col: int, row: int) -> "Image.Image":
+        raise NotImplementedError
+
+    def load_tiles(self, keys: Iterable[TileKey]) -> Dict[TileKey, "Image.Image"]:
+        return {key: self.load_tile(*key) for key in keys}
+
+    def close(self) -> None:
+        pass
+
+
+class MapPyramid(TileSource):
+    """A map image cut into tiles at successive half resolutions.
+
+    Level 0 is the source's full resolution; level i is roughly 1/2**i of
+    it. Every level, level 0 included, is stored as `tile_size` PNG tiles
+    in `<map>.pyramid/level<i>/<col>_<row>.png`, so a viewer only ever
+    decodes the tiles it shows. A manifest records the source's SHA-256;
+    the pyramid is built once per map file and reused by later launches.
+    Building reads a PNG source a band of rows at a time (see
+    `build_tiles`), so even a 20k x 20k map builds within a Pi's memory;
+    other formats are decoded whole.
+    """
+
+    def __init__(self, map_path: str, mode: str = "RGBA", tile_size: int = TILE_SIZE):
+        super().__init__()
+        self.map_path = map_path
+        self.mode = mode
+        self.tile_size = tile_size
+        self.dir = pyramid_dir_for(map_path)
+        self.source_hash: Optional[str] = None
+
+    def load(self) -> "MapPyramid":
+        """Use the stored pyramid if it matches the map file, else (re)build it."""
+        st = os.stat(self.map_path)
+        manifest = self._read_manifest()
+        stamp = (st.st_size, st.st_mtime_ns)
+        if manifest and (manifest.get("source_size"), manifest.get("source_mtime_ns")) == stamp:
+            # unchanged since we hashed it; skip re-reading the whole file
+            source_hash = manifest.get("source_hash")
+        else:
+            source_hash = file_sha256(self.map_path)
+        self.source_hash = source_hash
+        if manifest and manifest.get("source_hash") == source_hash:
+            self.levels = [tuple(lv) for lv in manifest["levels"]]
+            if (manifest.get("source_size"), manifest.get("source_mtime_ns")) != stamp:
+                # same bytes, new mtime (copied or touched): refresh the stamp
+                self._write_manifest(st)
+            return self
+        self.build(st)
+        return self
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION
+                or data.get("mode") != self.mode or data.get("tile_size") != self.tile_size):
+            return None
+        return data
+
+    def _write_manifest(self, st: os.stat_result) -> None:
+        atomic_write_json(os.path.join(self.dir, MANIFEST_NAME), {
+            "version": MANIFEST_VERSION,
+            "mode": self.mode,
+            "tile_size": self.tile_size,
+            "source_hash": self.source_hash,
+            "source_size": st.st_size,
+            "source_mtime_ns": st.st_mtime_ns,
+            "levels": [list(lv) for lv in self.levels],
+        })
+
+    def build(self, st: Optional[os.stat_result] = None) -> None:
+        if st is None:
+            st = os.stat(self.map_path)
+        # start from an empty directory and write the manifest last, so a
+        # half-written pyramid is never mistaken for a complete one
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir)
+        made = set()
+
+        def save(level: int, col: int, row: int, tile: "Image.Image") -> None:
+            if level not in made:
+                os.makedirs(os.path.join(self.dir, f"level{level}"), exist_ok=True)
+                made.add(level)
+            path = self.tile_path(level, col, row)
+            tile.save(path + ".tmp", format="PNG", compress_level=1)
+            os.replace(path + ".tmp", path)
+
+        self.levels = build_tiles(self.map_path, self.mode, self.tile_size, save)
+        self._write_manifest(st)
+
+    def tile_path(self, level: int, col: int, row: int) -> str:
+        return os.path.join(self.dir, f"level{level}", f"{col}_{row}.png")
+
+    def load_tile(self, level: int, col: int, row: int) -> "Image.Image":
+        img = Image.open(self.tile_path(level, col, row))
+        if img.mode != self.mode:
+            img = img.convert(self.mode)
+        else:
+            img.load()
+        return img
+
+
+def load_pyramid(map_path: str, mode: str = "RGBA") -> Optional[MapPyramid]:
+    if not PIL_AVAILABLE:
+        return None
+    return MapPyramid(map_path, mode).load()
+
+
+def main(argv=None):
+    # prebuild, e.g. when deploying a new map: python3 mappyramid.py assets/map.png
+    paths = (argv if argv is not None else sys.argv[1:])
+    if not paths or not PIL_AVAILABLE:
+        sys.exit("usage: mappyramid.py MAP_IMAGE... (needs Pillow)")
+    for path in paths:
+        p = load_pyramid(path)
+        sizes = ", ".join(f"{w}x{h}" for w, h in p.levels)
+        print(f"{path}: {len(p.levels)} levels ({sizes}) in {p.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+
+class MapRenderer:
+    """Coalesce map re-renders and do the expensive ones off the Tk thread.
+
+    `request(view)` may be called for every <Configure>, drag or wheel
+    event; `view` is any hashable description of what to show. The first
+    request of a burst gets a cheap preview (`source.render(view,
+    preview=True)`) on the next idle callback; once requests stop for
+    `debounce_ms` the full render runs on a worker thread. As in
+    `AuthService`, results are never delivered from the worker: the Tk
+    thread polls the future with `after` and calls `deliver(result,
+    final)`. Every request bumps a generation counter, and any render
+    started for an older generation is dropped, both before it starts and
+    when it lands.
+    """
+
+    POLL_MS = 15
+
+    def __init__(self, widget, source, deliver: Callable[[Any, bool], None], debounce_ms: int = 80):
+        self.widget = widget
+        self.source = source
+        self.deliver = deliver
+        self.debounce_ms = debounce_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="map-render")
+        self._lock = threading.Lock()
+        self._gen = 0
+        self._target: Optional[Hashable] = None
+        # view of the full-quality result on screen, None while a preview is
+        self._shown: Optional[Hashable] = None
+        self._preview_pending = False
+        self._timer = None
+        self._closed = False
+
+    def request(self, view: Hashable) -> None:
+        if view == self._target:
+            return
+        with self._lock:
+            self._gen += 1
+            gen = self._gen
+        self._target = view
+        if not self._preview_pending:
+            self._preview_pending = True
+            self.widget.after_idle(self._preview)
+        if self._timer is not None:
+            self.widget.after_cancel(self._timer)
+        self._timer = self.widget.after(self.debounce_ms, self._start, gen)
+
+    def _preview(self) -> None:
+        self._preview_pending = False
+        if self._closed or self._target is None or self._target == self._shown:
+            return
+        self._shown = None
+        self.deliver(self.source.render(self._target, preview=True), False)
+
+    def _start(self, gen: int) -> None:
+        self._timer = None
+        if self._closed or gen != self._gen or self._target == self._shown:
+            return
+        future = self._executor.submit(self._render, gen, self._target)
+        self.widget.after(self.POLL_MS, self._poll, future, gen)
+
+    def _render(self, gen: int, view: Hashable):
+        # superseded while queued: don't spend the CPU
+        if gen != self._gen:
+            return None
+        return gen, self.source.render(view)
+
+    def _poll(self, future, gen: int) -> None:
+        if self._closed:
+            return
+        if not future.done():
+            self.widget.after(self.POLL_MS, self._poll, future, gen)
+            return
+        try:
+            res = future.result()
+        except Exception as e:
+            print(f"[maprender] render failed: {e}")
+            return
+        if res is None or gen != self._gen:
+            return
+        self._shown = self._target
+        self.deliver(res[1], True)
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            self._gen += 1
+        if self._timer is not None:
+            try:
+                self.widget.after_cancel(self._timer)
+            except Exception:
+                pass
+            self._timer = None
+        self._executor.shutdown(wait=False)
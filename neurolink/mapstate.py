@@ -0,0 +1,147 @@
+import copy
+import json
+import time
+import atexit
+import threading
+from typing import Any, Dict, Optional
+
+from fsutil import atomic_write_json
+
+# quiet time after the last change before writing
+DEFAULT_DEBOUNCE = 1.0
+# a steady stream of changes (a live feed) is still written this often
+DEFAULT_MAX_DELAY = 10.0
+
+
+def load_state(path: str) -> Dict[str, Any]:
+    """The saved map state, or {} if there is none or it can't be read."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+class MapState:
+    """Map state (position, view, selected map, layers) persisted in the background.
+
+    `update` only merges fields into memory and is cheap enough for every
+    tap or feed frame. A writer thread saves the document with
+    `atomic_write_json` once changes have been quiet for `debounce`
+    seconds, or at the latest `max_delay` seconds after the first unsaved
+    change, so a burst of updates costs one write. `flush` writes now and
+    waits; `close` flushes and stops the thread, and is also run at exit.
+    Write errors never raise into the caller: they are kept in
+    `last_error` (None after the next successful write).
+    """
+
+    def __init__(self, path: str, debounce: float = DEFAULT_DEBOUNCE, max_delay: float = DEFAULT_MAX_DELAY):
+        self.path = path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        # unknown keys in the file are kept as they are
+        self.data: Dict[str, Any] = load_state(path)
+        self.writes = 0
+        self._attempts = 0
+        self.last_error: Optional[Exception] = None
+        self._cond = threading.Condition()
+        self._dirty_since: Optional[float] = None
+        self._changed_at = 0.0
+        # bumped per update / per write, so flush knows when it has caught up
+        self._version = 0
+        self._saved_version = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="map-state", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._cond:
+            return self.data.get(key, default)
+
+    def update(self, **fields: Any) -> None:
+        with self._cond:
+            changed = {k: v for k, v in fields.items() if self.data.get(k, ...) != v}
+            if not changed:
+                return
+            self.data.update(changed)
+            now = time.monotonic()
+            self._changed_at = now
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._version += 1
+            self._cond.notify()
+
+    @property
+    def pending(self) -> bool:
+        with self._cond:
+            return self._saved_version != self._version
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._dirty_since is not None:
+                        now = time.monotonic()
+                        due = min(self._changed_at + self.debounce, self._dirty_since + self.max_delay)
+                        if self._closed or now >= due:
+                            break
+                        self._cond.wait(due - now)
+                    elif self._closed:
+                        return
+                    else:
+                        self._cond.wait()
+                snapshot = copy.deepcopy(self.data)
+                version = self._version
+                self._dirty_since = None
+            self._write(snapshot, version)
+
+    def _write(self, snapshot: Dict[str, Any], version: int) -> None:
+        try:
+            atomic_write_json(self.path, snapshot)
+            error = None
+        except Exception as e:
+            print(f"[mapstate] saving {self.path} failed: {e}")
+            error = e
+        with self._cond:
+            self._attempts += 1
+            self.last_error = error
+            if error is None:
+                self.writes += 1
+                self._saved_version = max(self._saved_version, version)
+            elif self._dirty_since is None:
+                # retry after the next quiet period rather than spinning
+                self._dirty_since = self._changed_at = time.monotonic()
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Write pending changes now; True once they are on disk."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._version
+            attempts = self._attempts
+            if self._dirty_since is not None:
+                # make the pending write due immediately
+                self._dirty_since = self._changed_at = time.monotonic() - max(self.debounce, self.max_delay)
+                self._cond.notify_all()
+            while self._saved_version < target and self._thread.is_alive():
+                left = deadline - time.monotonic()
+                if left <= 0 or (self._attempts != attempts and self.last_error is not None):
+                    break
+                self._cond.wait(min(left, 0.1))
+            return self._saved_version >= target
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._dirty_since = None
+            self._cond.notify_all()
+        self._thread.join(timeout=1.0)
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
@@ -0,0 +1,274 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import perfhud
+from mappyramid import TileKey
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+if PIL_AVAILABLE:
+    try:
+        RESAMPLE = Image.Resampling.LANCZOS
+        PREVIEW_RESAMPLE = Image.Resampling.NEAREST
+    except Exception:
+        try:
+            RESAMPLE = Image.LANCZOS
+        except Exception:
+            # older Pillow may provide ANTIALIAS; if not, fallback to 1
+            RESAMPLE = getattr(Image, "ANTIALIAS", 1)
+        PREVIEW_RESAMPLE = getattr(Image, "NEAREST", 0)
+
+TILE_CACHE_ENV = "NEUROLINK_TILE_CACHE_MB"
+DEFAULT_TILE_CACHE_MB = 64
+
+# tiles decoded per batch by the prefetch thread
+PREFETCH_BATCH = 8
+
+
+class View(NamedTuple):
+    """What the canvas shows: a map point at its centre, a zoom and a size.
+
+    `cx`, `cy` are level-0 map pixels; `zoom` is screen pixels per map pixel.
+    """
+    cx: float
+    cy: float
+    zoom: float
+    width: int
+    height: int
+
+    def to_screen(self, x: float, y: float) -> Tuple[float, float]:
+        return (x - self.cx) * self.zoom + self.width / 2, (y - self.cy) * self.zoom + self.height / 2
+
+    def to_map(self, sx: float, sy: float) -> Tuple[float, float]:
+        return self.cx + (sx - self.width / 2) / self.zoom, self.cy + (sy - self.height / 2) / self.zoom
+
+
+def default_cache_bytes() -> int:
+    try:
+        mb = float(os.environ.get(TILE_CACHE_ENV, DEFAULT_TILE_CACHE_MB))
+    except ValueError:
+        mb = DEFAULT_TILE_CACHE_MB
+    return int(mb * 1024 * 1024)
+
+
+def _image_bytes(img: "Image.Image") -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class TileCache:
+    """Decoded tiles in LRU order, evicted to stay within `budget` bytes."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.bytes = 0
+        self._tiles: "OrderedDict[TileKey, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: TileKey) -> bool:
+        return key in self._tiles
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def get(self, key: TileKey) -> Optional["Image.Image"]:
+        with self._lock:
+            img = self._tiles.get(key)
+            if img is not None:
+                self._tiles.move_to_end(key)
+            return img
+
+    def put(self, key: TileKey, img: "Image.Image") -> None:
+        with self._lock:
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self.bytes -= _image_bytes(old)
+            self._tiles[key] = img
+            self.bytes += _image_bytes(img)
+            while self.bytes > self.budget and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self.bytes -= _image_bytes(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+            self.bytes = 0
+
+
+class TiledMap:
+    """Compose viewport images from a `TileSource` (pyramid directory or MBTiles).
+
+    Only tiles that intersect the view, at the level matching its zoom, are
+    decoded; they are kept in a `TileCache`. The coarsest level (a single
+    small image) stays decoded so a preview can always fill gaps from it.
+    After each full render a background thread decodes the ring of tiles
+    around the view and the next coarser level, so panning and zooming out
+    usually find their tiles cached. Stages are timed on `profiler`
+    (see `perfhud`).
+    """
+
+    def __init__(self, source, cache_bytes: Optional[int] = None, prefetch: bool = True,
+                 profiler: Optional[perfhud.Profiler] = None):
+        self.source = source
+        self.profiler = profiler or perfhud.DISABLED
+        self.cache = TileCache(default_cache_bytes() if cache_bytes is None else cache_bytes)
+        self.top_level = len(source.levels) - 1
+        # coarsest level, kept outside the LRU
+        self.overview = self._compose_level(self.top_level)
+        self._pending: List[TileKey] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        if prefetch:
+            self._thread = threading.Thread(target=self._prefetch_loop, name="map-prefetch", daemon=True)
+            self._thread.start()
+
+    def _compose_level(self, level: int) -> "Image.Image":
+        cols, rows = self.source.grid(level)
+        ts = self.source.tile_size
+        img = Image.new(self.source.mode, self.source.levels[level])
+        keys = [(level, col, row) for row in range(rows) for col in range(cols)]
+        for (_, col, row), tile in self.source.load_tiles(keys).items():
+            img.paste(tile, (col * ts, row * ts))
+        return img
+
+    def tiles(self, keys: Iterable[TileKey], load: bool = True) -> Dict[TileKey, "Image.Image"]:
+        """Decoded tiles for `keys`; missing ones are fetched in one batch unless `load` is False."""
+        found = {}
+        missing = []
+        for key in keys:
+            img = self.cache.get(key)
+            if img is None:
+                missing.append(key)
+            else:
+                found[key] = img
+        if missing and load:
+            with self.profiler.stage("tile_load"):
+                loaded = self.source.load_tiles(missing)
+            for key, img in loaded.items():
+                self.cache.put(key, img)
+                found[key] = img
+        return found
+
+    def _tile_range(self, level: int, x0: float, y0: float, x1: float, y1: float,
+                    margin: int = 0) -> Tuple[int, int, int, int]:
+        # level-`level` pixel box -> inclusive (col0, row0, col1, row1)
+        ts = self.source.tile_size
+        cols, rows = self.source.grid(level)
+        return (max(0, int(x0 // ts) - margin), max(0, int(y0 // ts) - margin),
+                min(cols - 1, math.ceil(x1 / ts) - 1 + margin), min(rows - 1, math.ceil(y1 / ts) - 1 + margin))
+
+    def _visible(self, view: View):
+        # visible part of the map: level-0 box and its screen position
+        mw, mh = self.source.size
+        left = view.cx - view.width / (2 * view.zoom)
+        top = view.cy - view.height / (2 * view.zoom)
+        vx0, vy0 = max(0.0, left), max(0.0, top)
+        vx1, vy1 = min(float(mw), left + view.width / view.zoom), min(float(mh), top + view.height / view.zoom)
+        if vx1 <= vx0 or vy1 <= vy0:
+            return None
+        sx0, sy0 = round((vx0 - left) * view.zoom), round((vy0 - top) * view.zoom)
+        sx1, sy1 = round((vx1 - left) * view.zoom), round((vy1 - top) * view.zoom)
+        return (vx0, vy0, vx1, vy1), (sx0, sy0, max(sx0 + 1, sx1), max(sy0 + 1, sy1))
+
+    def _level_box(self, level: int, box) -> Tuple[float, float, float, float]:
+        mw, mh = self.source.size
+        lw, lh = self.source.levels[level]
+        kx, ky = lw / mw, lh / mh
+        return box[0] * kx, box[1] * ky, box[2] * kx, box[3] * ky
+
+    def render(self, view: View, preview: bool = False) -> Optional[Tuple["Image.Image", int, int]]:
+        """Image of the visible part of the map and its canvas offset.
+
+        With `preview`, nothing is decoded: missing tiles are filled from
+        the overview and the resample is nearest-neighbour, cheap enough for
+        the Tk thread. Returns None when the map is entirely off-screen.
+        """
+        vis = self._visible(view)
+        if vis is None:
+            return None
+        box, (sx0, sy0, sx1, sy1) = vis
+        level = self.source.level_index_for(view.zoom)
+        lx0, ly0, lx1, ly1 = self._level_box(level, box)
+        c0, r0, c1, r1 = self._tile_range(level, lx0, ly0, lx1, ly1)
+        ts = self.source.tile_size
+        lw, lh = self.source.levels[level]
+        ow, oh = self.overview.size
+        # held here, not just in the cache, in case the view needs more than the budget
+        tiles = self.tiles([(level, col, row) for row in range(r0, r1 + 1) for col in range(c0, c1 + 1)],
+                           load=not preview)
+        with self.profiler.stage("compose"):
+            region = Image.new(self.source.mode, ((c1 - c0 + 1) * ts, (r1 - r0 + 1) * ts))
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    img = tiles.get((level, col, row))
+                    if img is None:
+                        # blow up the matching part of the overview instead
+                        tw, th = min(ts, lw - col * ts), min(ts, lh - row * ts)
+                        src = (col * ts * ow / lw, row * ts * oh / lh,
+                               (col * ts + tw) * ow / lw, (row * ts + th) * oh / lh)
+                        img = self.overview.resize((tw, th), PREVIEW_RESAMPLE, box=src)
+                    region.paste(img, ((col - c0) * ts, (row - r0) * ts))
+        with self.profiler.stage("resize_preview" if preview else "resize"):
+            out = region.resize((sx1 - sx0, sy1 - sy0), PREVIEW_RESAMPLE if preview else RESAMPLE,
+                                box=(lx0 - c0 * ts, ly0 - r0 * ts, lx1 - c0 * ts, ly1 - r0 * ts))
+        if not preview:
+            self.prefetch_around(view, level, (lx0, ly0, lx1, ly1))
+        return out, sx0, sy0
+
+    def prefetch_around(self, view: View, level: int, lbox) -> None:
+        keys = []
+        inner = self._tile_range(level, *lbox)
+        c0, r0, c1, r1 = self._tile_range(level, *lbox, margin=1)
+        for row in range(r0, r1 + 1):
+            for col in range(c0, c1 + 1):
+                if not (inner[0] <= col <= inner[2] and inner[1] <= row <= inner[3]):
+                    keys.append((level, col, row))
+        if level < self.top_level:
+            # what zooming out one step would need
+            mw, mh = self.source.size
+            lw, lh = self.source.levels[level]
+            box = (lbox[0] * mw / lw, lbox[1] * mh / lh, lbox[2] * mw / lw, lbox[3] * mh / lh)
+            c0, r0, c1, r1 = self._tile_range(level + 1, *self._level_box(level + 1, box))
+            keys.extend((level + 1, col, row) for row in range(r0, r1 + 1) for col in range(c0, c1 + 1))
+        # never prefetch more than half the cache, or it would evict the view
+        ts = self.source.tile_size
+        keys = [k for k in keys if k not in self.cache][:max(0, self.cache.budget // (2 * ts * ts * 4))]
+        with self._cond:
+            # only the latest view matters
+            self._pending = keys
+            self._cond.notify()
+
+    def _prefetch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                batch = self._pending[:PREFETCH_BATCH]
+                del self._pending[:PREFETCH_BATCH]
+            try:
+                self.tiles(batch)
+            except Exception as e:
+                print(f"[maptiles] prefetch {batch[0]}.. failed: {e}")
+
+    def memory_bytes(self) -> int:
+        """Decoded pixels held: the tile cache plus the overview."""
+        return self.cache.bytes + _image_bytes(self.overview)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._pending = []
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.cache.clear()
+        self.source.close()
@@ -1,35 +1,148 @@
 import os
-import json
 import tkinter as tk
-from tkinter import messagebox, font
+from tkinter import font
+from typing import NamedTuple, Optional, Tuple
+
+import mappyramid
+import maprender
+import maptiles
+import mbtiles
+import assetbuild
+import mapmarkers
+import posfeed
+import tracks
+import georef
+import mapstate
+import perfhud
 
 try:
-    from PIL import Image, ImageTk
+    from PIL import ImageTk
     PIL_AVAILABLE = True
 except Exception:
     PIL_AVAILABLE = False
 
-if PIL_AVAILABLE:
-    try:
-        RESAMPLE = Image.Resampling.LANCZOS
-    except Exception:
+# furthest zoom-in, in screen pixels per map pixel
+MAX_ZOOM = 4.0
+ZOOM_STEP = 1.25
+# pointer travel (px) below which a press/release is a tap, not a drag
+TAP_SLOP = 6
+# canvas size assumed by preload_map when none is given
+PRELOAD_SIZE = (800, 480)
+
+
+def find_map(assets: str, chosen: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """(name under assets/, path to open) of the map to show, or (None, None).
+
+    `chosen` is a map picked earlier (as saved in the state) and goes
+    first. An image may have a tile database prebuilt for this device
+    (see `assetbuild`), which is opened instead.
+    """
+    candidates = ["map" + mbtiles.MBTILES_SUFFIX, "map.png", "map.jpg", "map.jpeg"]
+    if isinstance(chosen, str) and chosen:
+        candidates.insert(0, os.path.basename(chosen))
+    for candidate in candidates:
+        p = os.path.join(assets, candidate)
+        if os.path.exists(p):
+            return candidate, assetbuild.best_map(assets, source=candidate) or p
+    return None, None
+
+
+class LoadedMap(NamedTuple):
+    """A map opened by `load_map`, ready for `MapWindow(preloaded=...)`."""
+    name: Optional[str]
+    path: Optional[str]
+    source: object
+    tiles: Optional[maptiles.TiledMap]
+    georef: Optional[georef.Georeference]
+    profiler: perfhud.Profiler
+
+    def close(self) -> None:
+        if self.tiles:
+            self.tiles.close()
+
+
+def load_map(base: str, chosen: Optional[str] = None, profiler: Optional[perfhud.Profiler] = None) -> LoadedMap:
+    """Open the map under `base`/assets as tiles, with its georeference. Doesn't touch Tk."""
+    profiler = profiler or perfhud.from_env()
+    name, path = find_map(os.path.join(base, "assets"), chosen)
+    source = None
+    tiles = None
+    if path and PIL_AVAILABLE:
         try:
-            RESAMPLE = Image.LANCZOS
-        except Exception:
-            # older Pillow may provide ANTIALIAS; if not, fallback to 1
-            RESAMPLE = getattr(Image, "ANTIALIAS", 1)
+            # a prebuilt tile database wins over an image that has to be cut up
+            if path.endswith(mbtiles.MBTILES_SUFFIX):
+                source = mbtiles.MBTilesSource(path)
+            else:
+                source = mappyramid.load_pyramid(path)
+            tiles = maptiles.TiledMap(source, profiler=profiler)
+        except Exception as e:
+            print(f"[mapview] could not load {path}: {e}")
+            source = None
+            tiles = None
+    # lon/lat calibration: <map>.georef.json, else the bounds of a tile database
+    ref = None
+    if source:
+        try:
+            ref = georef.load_georef(path, source.size)
+            if ref is None and getattr(source, "bounds", None):
+                ref = georef.Georeference.from_bounds(*source.size, *source.bounds)
+        except Exception as e:
+            print(f"[mapview] ignoring georeference for {path}: {e}")
+    return LoadedMap(name, path, source, tiles, ref, profiler)
+
+
+def preload_map(config_path: Optional[str] = None, size: Tuple[int, int] = PRELOAD_SIZE) -> LoadedMap:
+    """`load_map` plus decoding the tiles of the view the window will open on.
+
+    Meant for a background thread while something else is on screen;
+    `size` is the expected canvas size.
+    """
+    base = os.path.abspath(os.path.dirname(__file__))
+    state = mapstate.load_state(config_path or os.path.join(base, "map_config.json"))
+    loaded = load_map(base, state.get("map"))
+    if loaded.tiles:
+        w, h = max(1, size[0]), max(1, size[1])
+        mw, mh = loaded.source.size
+        view = maptiles.View(mw / 2, mh / 2, min(w / mw, h / mh), w, h)
+        saved = state.get("view")
+        if isinstance(saved, dict) and not saved.get("fit") and state.get("map") == loaded.name:
+            try:
+                view = maptiles.View(float(saved["center"][0]), float(saved["center"][1]),
+                                     max(view.zoom, min(MAX_ZOOM, float(saved["zoom"]))), w, h)
+            except (KeyError, TypeError, ValueError, IndexError):
+                pass
+        # the tiles stay in the cache (and their neighbours get prefetched)
+        loaded.tiles.render(view)
+    return loaded
 
 
 class MapWindow:
     """Embed a simple map view into a parent Tk widget.
 
-    It looks for a map image under `assets/map.png|jpg|jpeg` and a JSON
-    config file `map_config.json` next to the package root. The config
-    stores a relative position [rx, ry] in 0..1 indicating where to draw
-    the location arrow on the map.
+    It looks for `assets/map.mbtiles` (see `mbtiles`) or a map image under
+    `assets/map.png|jpg|jpeg`, and a JSON config file `map_config.json`
+    next to the package root. The config stores a relative position
+    [rx, ry] in 0..1 of the map image indicating where to draw the location
+    arrow on the map.
+
+    The map is shown from a tiled pyramid (see `maptiles`): drag to pan,
+    wheel / double-tap / toolbar buttons to zoom. Only the tiles in view
+    are decoded. Units, waypoints and reports go on `self.markers` (see
+    `mapmarkers`), in map pixel coordinates; `attach_feed` keeps them
+    moving from a live `posfeed.PositionFeed` and draws their trails from
+    `self.tracks` (see `tracks`). With a calibration (`georef`) next to
+    the map, feed positions and the saved location may be in lon/lat.
+
+    Position, view, map choice and layer visibility are kept in the config
+    file through `mapstate.MapState`: saved in the background shortly after
+    they change, and flushed on `close`.
+
+    It can be kept built while another screen is up (see `viewmanager`):
+    `hide` / `show` swap it out, and `preloaded` takes a map already
+    opened by `preload_map` on a background thread.
     """
 
-    def __init__(self, parent, config_path=None, touch_mode: bool = False):
+    def __init__(self, parent, config_path=None, touch_mode: bool = False, preloaded: Optional[LoadedMap] = None):
         self.parent = parent
         self.touch_mode = bool(touch_mode)
         base = os.path.abspath(os.path.join(os.path.dirname(__file__), "."))
@@ -41,17 +154,23 @@ class MapWindow:
         self.frame = tk.Frame(parent, bg="black")
         self.frame.pack(fill="both", expand=True)
 
-        # load config
+        # load config; it is written back by the state's own thread
+        self.state = mapstate.MapState(self.config_path)
         self.rel_pos = [0.5, 0.5]
+        saved_lonlat = None
         try:
-            if os.path.exists(self.config_path):
-                with open(self.config_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                p = data.get("position")
-                if isinstance(p, (list, tuple)) and len(p) == 2:
-                    self.rel_pos = [float(p[0]), float(p[1])]
+            p = self.state.get("position")
+            if isinstance(p, (list, tuple)) and len(p) == 2:
+                self.rel_pos = [float(p[0]), float(p[1])]
+            p = self.state.get("lonlat")
+            if isinstance(p, (list, tuple)) and len(p) == 2:
+                saved_lonlat = (float(p[0]), float(p[1]))
         except Exception:
             self.rel_pos = [0.5, 0.5]
+        self.layers = {"tracks": True}
+        layers = self.state.get("layers")
+        if isinstance(layers, dict):
+            self.layers.update((k, bool(v)) for k, v in layers.items() if k in self.layers)
 
         # top toolbar
         tb = tk.Frame(self.frame, bg="#222")
@@ -63,109 +182,374 @@ class MapWindow:
         else:
             tb_font = font.Font(size=12)
             pad = 6
-        tk.Button(tb, text="返回", command=self.close, font=tb_font).pack(side="right", padx=pad, pady=pad)
+        # with on_back set (e.g. by a ViewManager) the view is only hidden
+        self.on_back = None
+        tk.Button(tb, text="返回", command=self._back, font=tb_font).pack(side="right", padx=pad, pady=pad)
         tk.Button(tb, text="设置为当前位置(点击地图)", command=self.enable_set_mode, font=tb_font).pack(side="right", padx=pad, pady=pad)
+        tk.Button(tb, text="全图", command=self.zoom_fit, font=tb_font).pack(side="left", padx=pad, pady=pad)
+        tk.Button(tb, text="放大", command=lambda: self.zoom_by(2.0), font=tb_font).pack(side="left", padx=pad, pady=pad)
+        tk.Button(tb, text="缩小", command=lambda: self.zoom_by(0.5), font=tb_font).pack(side="left", padx=pad, pady=pad)
+        tk.Button(tb, text="轨迹", command=lambda: self.set_layer("tracks", not self.layers["tracks"]),
+                  font=tb_font).pack(side="left", padx=pad, pady=pad)
+        # hints and save results, instead of modal dialogs
+        self.status = tk.Label(tb, text="", fg="#ddd", bg="#222", font=tb_font)
+        self.status.pack(side="left", padx=pad)
+        self._status_job = None
 
         # canvas for map
-        self.canvas = tk.Canvas(self.frame, bg="#333")
+        self.canvas = tk.Canvas(self.frame, bg="#333", highlightthickness=0)
         self.canvas.pack(fill="both", expand=True)
 
-        # load image
-        self.map_image = None
+        # load the map as tiles; only the visible ones get decoded. With
+        # `preloaded` (see preload_map) that has been done off the Tk thread.
+        if preloaded is None:
+            preloaded = load_map(base, self.state.get("map"))
+        # frame-time instrumentation, off unless NEUROLINK_PERF is set
+        self.profiler = preloaded.profiler
+        self.hud = None
+        self.source = preloaded.source
+        self.tiles = preloaded.tiles
+        self.georef = preloaded.georef
+        self.map_path = preloaded.path
+        # file name under assets/ of the map shown, as saved in the state
+        self.map_name = preloaded.name
         self.tk_image = None
-        self.map_path = None
-        for candidate in ("map.png", "map.jpg", "map.jpeg"):
-            p = os.path.join(base, "assets", candidate)
-            if os.path.exists(p):
-                self.map_path = p
-                break
-
-        if self.map_path and PIL_AVAILABLE:
-            try:
-                self.map_image = Image.open(self.map_path).convert("RGBA")
-            except Exception:
-                self.map_image = None
+        if self.georef and saved_lonlat:
+            # the saved lon/lat wins, so the location survives swapping the map
+            mw, mh = self.source.size
+            x, y = self.georef.pixel(*saved_lonlat)
+            self.rel_pos = [max(0.0, min(1.0, x / mw)), max(0.0, min(1.0, y / mh))]
+        # renders happen off the Tk thread; see maprender
+        self.renderer = maprender.MapRenderer(self.canvas, self.tiles, self._show_map) if self.tiles else None
+        self._bg_item = None
 
-        self._resized = None
-        self._arrow = None
+        # view state: map point at the canvas centre and screen px per map px
+        self._size = (1, 1)
+        self._center = None
+        self._zoom = 1.0
+        self._fit = True
+        self._press = None
         self.set_mode = False
+        saved_view = self.state.get("view")
+        if self.source and isinstance(saved_view, dict) and self.state.get("map") == self.map_name:
+            try:
+                self._center = (float(saved_view["center"][0]), float(saved_view["center"][1]))
+                self._zoom = float(saved_view["zoom"])
+                self._fit = bool(saved_view.get("fit", False))
+            except (KeyError, TypeError, ValueError, IndexError):
+                self._center = None
+
+        # the location arrow is the "self" marker
+        self.markers = mapmarkers.MarkerLayer(self.canvas, scale=1.5 if self.touch_mode else 1.0)
+        # called with a marker id when one is tapped (outside set mode)
+        self.on_marker_click = None
+        self.feed = None
+        self._pump = None
+        # position history of feed units, drawn under the markers
+        self.tracks = tracks.TrackStore()
+        self.track_layer = tracks.TrackLayer(self.canvas, self.tracks, width=3 if self.touch_mode else 2,
+                                             below=mapmarkers.LAYER_TAG)
+        self.track_layer.set_visible(self.layers["tracks"])
+        self._expired_at = 0.0
+        # feed positions that could not be placed (lat/lon without a georeference)
+        self.feed_dropped = 0
 
         self.parent.update_idletasks()
         self.canvas.bind("<Configure>", self._on_resize)
-        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_release)
+        self.canvas.bind("<Double-Button-1>", lambda e: self.zoom_by(2.0, e.x, e.y))
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        # X11 reports the wheel as buttons 4/5
+        self.canvas.bind("<Button-4>", lambda e: self.zoom_by(ZOOM_STEP, e.x, e.y))
+        self.canvas.bind("<Button-5>", lambda e: self.zoom_by(1 / ZOOM_STEP, e.x, e.y))
+        if self.profiler.enabled:
+            self.hud = perfhud.PerfHud(self.canvas, self.profiler, font_size=12 if self.touch_mode else 9)
+            self._bind_keys(True)
+
+    def _back(self):
+        if self.on_back:
+            self.on_back()
+        else:
+            self.close()
+
+    def _bind_keys(self, on):
+        # F12 is bound application-wide, so only while the map is up
+        if not self.profiler.enabled:
+            return
+        if on:
+            self.frame.bind_all("<F12>", lambda e: self.dump_perf())
+        else:
+            self.frame.unbind_all("<F12>")
+
+    def show(self):
+        self.frame.pack(fill="both", expand=True)
+        self._bind_keys(True)
+        if self.hud:
+            self.hud.resume()
+
+    def hide(self):
+        self.set_mode = False
+        self._bind_keys(False)
+        if self.hud:
+            self.hud.pause()
+        self.frame.pack_forget()
+
+    def memory_bytes(self):
+        """Rough size of what the view holds: decoded tiles, the shown image, trails."""
+        total = self.tracks.memory_bytes()
+        if self.tiles:
+            total += self.tiles.memory_bytes()
+        if self.tk_image is not None:
+            total += self.tk_image.width() * self.tk_image.height() * 4
+        return total
 
     def enable_set_mode(self):
         self.set_mode = True
-        messagebox.showinfo("提示", "单击地图以设置当前位置。完成后地图会保存配置。")
+        self.show_status("单击地图以设置当前位置", 0)
+
+    def show_status(self, text, seconds=3.0):
+        # toolbar message; 0 keeps it until the next one
+        if self._status_job is not None:
+            self.status.after_cancel(self._status_job)
+            self._status_job = None
+        self.status.config(text=text)
+        if seconds:
+            self._status_job = self.status.after(int(seconds * 1000), lambda: self.show_status("", 0))
+
+    def set_layer(self, name, visible):
+        self.layers[name] = bool(visible)
+        if name == "tracks":
+            self.track_layer.set_visible(visible)
+        self.state.update(layers=dict(self.layers))
+
+    def _save_position(self):
+        mw, mh = self._map_size()
+        fields = {"position": list(self.rel_pos)}
+        if self.georef:
+            fields["lonlat"] = list(self.georef.lonlat(self.rel_pos[0] * mw, self.rel_pos[1] * mh))
+        self.state.update(**fields)
+
+    def _report_save(self):
+        # after the debounce window: say whether the write made it
+        if self.state.pending:
+            self._status_job = self.status.after(500, self._report_save)
+        elif self.state.last_error is not None:
+            self.show_status(f"保存失败: {self.state.last_error}", 8)
+        else:
+            self.show_status("当前位置已保存")
+
+    def _map_size(self):
+        # without a map the placeholder stands in for it, fitted exactly
+        if self.source:
+            return self.source.size
+        return self._size
+
+    def _fit_zoom(self):
+        w, h = self._size
+        mw, mh = self._map_size()
+        return min(w / mw, h / mh)
+
+    def view(self) -> maptiles.View:
+        w, h = self._size
+        mw, mh = self._map_size()
+        fit = self._fit_zoom()
+        if self._fit or self._center is None:
+            self._zoom = fit
+            self._center = (mw / 2, mh / 2)
+        self._zoom = max(fit, min(max(fit, MAX_ZOOM), self._zoom))
+        # keep the map on screen; centre it along axes where it fits
+        cx, cy = self._center
+        half_w, half_h = w / (2 * self._zoom), h / (2 * self._zoom)
+        cx = mw / 2 if half_w * 2 >= mw else max(half_w, min(mw - half_w, cx))
+        cy = mh / 2 if half_h * 2 >= mh else max(half_h, min(mh - half_h, cy))
+        self._center = (cx, cy)
+        return maptiles.View(cx, cy, self._zoom, w, h)
+
+    def zoom_fit(self):
+        self._fit = True
+        self._update_view()
+
+    def zoom_by(self, factor, sx=None, sy=None):
+        # zoom keeping the map point under (sx, sy) in place
+        v = self.view()
+        if sx is None:
+            sx, sy = v.width / 2, v.height / 2
+        mx, my = v.to_map(sx, sy)
+        self._fit = False
+        self._zoom = v.zoom * factor
+        self._zoom = max(self._fit_zoom(), min(max(self._fit_zoom(), MAX_ZOOM), self._zoom))
+        self._center = (mx - (sx - v.width / 2) / self._zoom, my - (sy - v.height / 2) / self._zoom)
+        self._update_view()
+
+    def _on_wheel(self, event):
+        self.zoom_by(ZOOM_STEP if event.delta > 0 else 1 / ZOOM_STEP, event.x, event.y)
+
+    def _on_press(self, event):
+        self._press = (event.x, event.y, event.x, event.y)
+
+    def _on_drag(self, event):
+        if not self._press or self.set_mode:
+            return
+        x0, y0, lx, ly = self._press
+        if abs(event.x - x0) + abs(event.y - y0) < TAP_SLOP:
+            return
+        dx, dy = event.x - lx, event.y - ly
+        self._press = (x0, y0, event.x, event.y)
+        v = self.view()
+        self._fit = False
+        self._center = (v.cx - dx / v.zoom, v.cy - dy / v.zoom)
+        # slide what is on screen right away; the renderer fills the rest
+        self.canvas.move("_bg", dx, dy)
+        self._update_view()
+
+    def _on_release(self, event):
+        press, self._press = self._press, None
+        if press and abs(event.x - press[0]) + abs(event.y - press[1]) < TAP_SLOP:
+            self._on_click(event)
 
     def _on_click(self, event):
         if not self.set_mode:
+            mid = self.markers.hit_test(event.x, event.y, radius=20 if self.touch_mode else 12)
+            if mid is not None and self.on_marker_click:
+                self.on_marker_click(mid)
             return
-        w = self.canvas.winfo_width()
-        h = self.canvas.winfo_height()
-        rx = event.x / float(w) if w else 0.5
-        ry = event.y / float(h) if h else 0.5
-        self.rel_pos = [max(0.0, min(1.0, rx)), max(0.0, min(1.0, ry))]
-        self._draw_overlay()
-        # save config
-        try:
-            with open(self.config_path, "w", encoding="utf-8") as f:
-                json.dump({"position": self.rel_pos}, f, indent=2, ensure_ascii=False)
-            messagebox.showinfo("已保存", "当前位置已保存到配置。")
-        except Exception as e:
-            messagebox.showwarning("保存失败", str(e))
+        mw, mh = self._map_size()
+        mx, my = self.view().to_map(event.x, event.y)
+        self.rel_pos = [max(0.0, min(1.0, mx / mw)), max(0.0, min(1.0, my / mh))]
+        self._place_self_marker()
+        self._save_position()
         self.set_mode = False
+        self.show_status("当前位置已更新", 0)
+        self._status_job = self.status.after(int((self.state.debounce + 0.2) * 1000), self._report_save)
 
     def _on_resize(self, event):
-        # redraw background image to canvas size while preserving aspect
-        w = max(1, event.width)
-        h = max(1, event.height)
-        if self.map_image and PIL_AVAILABLE:
-            try:
-                ow, oh = self.map_image.size
-                # fit into canvas while preserving aspect
-                ratio = min(w / ow, h / oh)
-                nw = max(1, int(ow * ratio))
-                nh = max(1, int(oh * ratio))
-                resized = self.map_image.resize((nw, nh), RESAMPLE)
-                self.tk_image = ImageTk.PhotoImage(resized)
-                self.canvas.delete("_bg")
-                # center
-                x = (w - nw) // 2
-                y = (h - nh) // 2
-                self.canvas.create_image(x, y, anchor="nw", image=self.tk_image, tags=("_bg",))
-                self._resized = (x, y, nw, nh)
-            except Exception:
-                self.canvas.delete("_bg")
-                self._resized = None
-        else:
+        self._size = (max(1, event.width), max(1, event.height))
+        if not self.renderer:
             # no image: clear and show placeholder text
+            w, h = self._size
             self.canvas.delete("_bg")
             self.canvas.create_rectangle(0, 0, w, h, fill="#222", tags=("_bg",))
             self.canvas.create_text(w//2, h//2, text="地图未找到 (assets/map.png) ", fill="white", tags=("_bg",))
-            self._resized = (0, 0, w, h)
+            self.canvas.tag_lower("_bg")
+        self._update_view()
+        # the placeholder "map" is the canvas, so the arrow follows resizes
+        self._place_self_marker()
+
+    def _update_view(self):
+        v = self.view()
+        if self.renderer:
+            self.renderer.request(v)
+            self.state.update(map=self.map_name,
+                              view={"center": [round(v.cx, 1), round(v.cy, 1)], "zoom": round(v.zoom, 4), "fit": self._fit})
+        with self.profiler.stage("tracks"):
+            self.track_layer.set_view(v)
+        with self.profiler.stage("markers"):
+            self.markers.set_view(v)
+
+    def _place_self_marker(self):
+        mw, mh = self._map_size()
+        x, y = self.rel_pos[0] * mw, self.rel_pos[1] * mh
+        if "self" in self.markers:
+            self.markers.move("self", x, y)
+        else:
+            self.markers.add("self", x, y, style="self")
 
-        self._draw_overlay()
+    def attach_feed(self, feed, max_fps=posfeed.DEFAULT_MAX_FPS):
+        """Show positions from `feed` as unit markers; the map owns it from now on.
 
-    def _draw_overlay(self):
-        # remove previous overlay
-        self.canvas.delete("_overlay")
-        if not self._resized:
+        The id "self" moves the location arrow instead.
+        """
+        if self._pump:
+            self._pump.stop()
+        self.feed = feed
+        self._pump = posfeed.FeedPump(self.canvas, feed, self._on_feed_batch, max_fps)
+        self._pump.start()
+
+    def lonlat_at(self, sx, sy):
+        """Lon/lat under canvas point (sx, sy), or None without a georeference."""
+        if not self.georef:
+            return None
+        return self.georef.lonlat(*self.view().to_map(sx, sy))
+
+    def _project_positions(self, batch):
+        # lon/lat positions -> map pixels, all in one call
+        geo = [pos for pos in batch if pos.geo]
+        rest = [pos for pos in batch if not pos.geo]
+        if not self.georef:
+            self.feed_dropped += len(geo)
+            return rest
+        xs, ys = self.georef.to_pixels([pos.x for pos in geo], [pos.y for pos in geo])
+        return rest + [pos._replace(x=float(x), y=float(y), geo=False) for pos, x, y in zip(geo, xs, ys)]
+
+    def _on_feed_batch(self, batch):
+        with self.profiler.stage("feed_apply"):
+            self._apply_positions(batch)
+
+    def _apply_positions(self, batch):
+        mw, mh = self._map_size()
+        batch = self._project_positions(batch)
+        for pos in batch:
+            if pos.id == "self":
+                self.rel_pos = [max(0.0, min(1.0, pos.x / mw)), max(0.0, min(1.0, pos.y / mh))]
+                self._place_self_marker()
+                self._save_position()
+            elif pos.id in self.markers:
+                self.markers.move(pos.id, pos.x, pos.y)
+            else:
+                self.markers.add(pos.id, pos.x, pos.y, style="unit", label=pos.id)
+            self.tracks.append(pos.id, pos.x, pos.y, pos.t)
+        if self.tracks.latest - self._expired_at >= 1.0:
+            self._expired_at = self.tracks.latest
+            self.track_layer.forget(self.tracks.expire())
+        self.track_layer.refresh([pos.id for pos in batch])
+
+    def _show_map(self, result, final):
+        # called on the Tk thread by the renderer: a quick preview first,
+        # then the full-quality image for the same view
+        if result is None:
+            if self._bg_item is not None:
+                self.canvas.itemconfig(self._bg_item, state="hidden")
             return
-        x0, y0, nw, nh = self._resized
-        rx, ry = self.rel_pos
-        px = x0 + int(rx * nw)
-        py = y0 + int(ry * nh)
-        # draw a simple arrow (triangle) pointing up
-        size = max(8, int(min(nw, nh) * 0.03))
-        points = [px, py - size, px - size//2, py + size, px + size//2, py + size]
-        self.canvas.create_polygon(points, fill="red", outline="black", tags=("_overlay",))
-        # optional circle
-        self.canvas.create_oval(px-3, py-3, px+3, py+3, fill="yellow", outline="black", tags=("_overlay",))
+        image, x, y = result
+        with self.profiler.stage("photoimage"):
+            self.tk_image = ImageTk.PhotoImage(image)
+        with self.profiler.stage("canvas"):
+            if self._bg_item is None:
+                self._bg_item = self.canvas.create_image(x, y, anchor="nw", image=self.tk_image, tags=("_bg",))
+                self.canvas.tag_lower(self._bg_item)
+            else:
+                self.canvas.itemconfig(self._bg_item, image=self.tk_image, state="normal")
+                self.canvas.coords(self._bg_item, x, y)
+        self.profiler.frame()
+
+    def dump_perf(self, path=None):
+        """Write the frame-time samples to JSON (see `perfhud`)."""
+        try:
+            path = self.profiler.dump(path)
+            self.show_status(f"性能数据已写入 {path}")
+        except Exception as e:
+            self.show_status(f"性能数据写入失败: {e}", 8)
+        return path
 
     def close(self):
         # destroy the frame to return to previous UI
+        if self.hud:
+            self.hud.close()
+            if self.profiler.dump_path:
+                self.dump_perf()
+        if self._pump:
+            self._pump.stop()
+        if self.feed:
+            self.feed.close()
+        if self.renderer:
+            self.renderer.close()
+        if self.tiles:
+            self.tiles.close()
+        self.state.close()
         try:
+            self._bind_keys(False)
             self.frame.destroy()
         except Exception:
             pass
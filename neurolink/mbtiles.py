@@ -0,0 +1,216 @@
+"""Maps as a single SQLite tile database.
+
+The layout follows MBTiles: a `metadata(name, value)` table and a
+`tiles(zoom_level, tile_column, tile_row, tile_data)` table with a unique
+index on (zoom_level, tile_column, tile_row). Differences, recorded in the
+metadata: `scheme` is "xyz" (rows count down from the top, there is no
+geographic projection), and `levels` lists the pixel size of every zoom
+level. zoom_level 0 is the coarsest level, as in MBTiles; it corresponds to
+the highest pyramid level in `mappyramid`.
+
+Build one on a desktop and copy the single file to the Pi:
+
+    python3 mbtiles.py build survey.png assets/map.mbtiles --format jpeg
+"""
+import io
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import mappyramid
+from fsutil import replace_synced
+from mappyramid import TileKey, TileSource
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+MBTILES_SUFFIX = ".mbtiles"
+FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_data BLOB NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+"""
+
+
+class MBTilesSource(TileSource):
+    """Read tiles from an MBTiles-style database.
+
+    Each thread (the renderer, the prefetcher) gets its own read-only
+    connection. `load_tiles` answers a whole batch with one range query per
+    level instead of one query per tile.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        meta = dict(self._conn().execute("SELECT name, value FROM metadata"))
+        if meta.get("scheme") != "xyz" or "levels" not in meta:
+            raise ValueError(f"{path}: not a neurolink tile database (build one with mbtiles.py)")
+        self.mode = meta.get("mode", "RGB")
+        self.tile_size = int(meta.get("tile_size", mappyramid.TILE_SIZE))
+        self.source_hash = meta.get("source_hash")
+        # MBTiles "bounds": west,south,east,north in degrees, if the map is georeferenced
+        self.bounds = tuple(float(v) for v in meta["bounds"].split(",")) if meta.get("bounds") else None
+        self.levels = [tuple(lv) for lv in json.loads(meta["levels"])]
+        self.top_level = len(self.levels) - 1
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = "file:" + os.path.abspath(self.path).replace("?", "%3f").replace("#", "%23") + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def _decode(self, data: bytes) -> "Image.Image":
+        img = Image.open(io.BytesIO(data))
+        if img.mode != self.mode:
+            return img.convert(self.mode)
+        img.load()
+        return img
+
+    def load_tile(self, level: int, col: int, row: int) -> "Image.Image":
+        r = self._conn().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (self.top_level - level, col, row)).fetchone()
+        if r is None:
+            raise KeyError((level, col, row))
+        return self._decode(r[0])
+
+    def load_tiles(self, keys: Iterable[TileKey]) -> Dict[TileKey, "Image.Image"]:
+        by_level: Dict[int, set] = {}
+        for level, col, row in keys:
+            by_level.setdefault(level, set()).add((col, row))
+        out = {}
+        conn = self._conn()
+        for level, wanted in by_level.items():
+            cols = [c for c, _ in wanted]
+            rows = [r for _, r in wanted]
+            # one indexed range scan over the bounding box, then filter
+            cur = conn.execute(
+                "SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level = ? "
+                "AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                (self.top_level - level, min(cols), max(cols), min(rows), max(rows)))
+            for col, row, data in cur:
+                if (col, row) in wanted:
+                    out[(level, col, row)] = self._decode(data)
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def build_mbtiles(image_path: str, out_path: str, fmt: str = "png", quality: int = 85,
+                  tile_size: int = mappyramid.TILE_SIZE, name: Optional[str] = None,
+                  bounds: Optional[Tuple[float, float, float, float]] = None,
+                  min_side: int = mappyramid.MIN_LEVEL_SIDE) -> List[tuple]:
+    """Cut `image_path` into an MBTiles-style database at `out_path`; returns the level sizes.
+
+    Levels are halved until the longer side is at most `min_side`.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported tile format {fmt!r}")
+    # JPEG has no alpha channel
+    mode = "RGB" if fmt == "jpeg" else "RGBA"
+    source_hash = mappyramid.file_sha256(image_path)
+    tmp = out_path + ".tmp"
+    for p in (tmp, tmp + "-journal"):
+        if os.path.exists(p):
+            os.remove(p)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        save_args = {"quality": quality} if fmt in ("jpeg", "webp") else {"compress_level": 6}
+        with conn:
+            rows = []
+
+            def add(level, col, row, tile):
+                buf = io.BytesIO()
+                tile.save(buf, format=FORMATS[fmt], **save_args)
+                # stored by pyramid level and flipped to zoom_level below,
+                # once the number of levels is known
+                rows.append((-1 - level, col, row, buf.getvalue()))
+                if len(rows) >= 256:
+                    conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+                    rows.clear()
+
+            levels = mappyramid.build_tiles(image_path, mode, tile_size, add, min_side)
+            conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+            top = len(levels) - 1
+            conn.execute("UPDATE tiles SET zoom_level = ? + 1 + zoom_level", (top,))
+            meta = {
+                "name": name or os.path.splitext(os.path.basename(image_path))[0],
+                "format": fmt,
+                "scheme": "xyz",
+                "minzoom": "0",
+                "maxzoom": str(top),
+                "tile_size": str(tile_size),
+                "mode": mode,
+                "levels": json.dumps([list(lv) for lv in levels]),
+                "source_hash": source_hash,
+            }
+            if bounds:
+                meta["bounds"] = ",".join(str(float(v)) for v in bounds)
+            conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", meta.items())
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    replace_synced(tmp, out_path)
+    return levels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mbtiles.py", description="build and inspect map tile databases")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build", help="cut a map image into a tile database")
+    p.add_argument("image")
+    p.add_argument("out", nargs="?", help="output file (default: IMAGE with .mbtiles)")
+    p.add_argument("--format", choices=sorted(FORMATS), default="png", help="tile encoding (default png)")
+    p.add_argument("--quality", type=int, default=85, help="JPEG/WebP quality (default 85)")
+    p.add_argument("--bounds", nargs=4, type=float, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                   help="lon/lat of the map edges, for a north-up map")
+    p = sub.add_parser("info", help="print a tile database's metadata")
+    p.add_argument("file")
+    args = parser.parse_args(argv)
+
+    if not PIL_AVAILABLE:
+        sys.exit("mbtiles.py needs Pillow")
+    if args.cmd == "build":
+        out = args.out or os.path.splitext(args.image)[0] + MBTILES_SUFFIX
+        levels = build_mbtiles(args.image, out, fmt=args.format, quality=args.quality, bounds=args.bounds)
+        print(f"{out}: {len(levels)} levels, {os.path.getsize(out) / 1e6:.1f} MB")
+        return
+    src = MBTilesSource(args.file)
+    n = src._conn().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+    print(f"{args.file}: {src.size[0]}x{src.size[1]} {src.mode}, {len(src.levels)} levels, {n} tiles"
+          + (f", bounds {src.bounds}" if src.bounds else ""))
+    src.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Frame-time instrumentation for the map view.
+
+Off unless `NEUROLINK_PERF` is set (or `src/main.py --perf`): "1" shows
+the overlay, any other value is also the file the samples are written to
+when the map closes. F12 on the map writes a dump at any time.
+
+    NEUROLINK_PERF=pi3.json python3 src/main.py
+    python3 perfhud.py compare desktop.json pi3.json
+
+Each stage keeps its last SAMPLES durations in a ring buffer; percentiles
+are taken over that window.
+"""
+import os
+import json
+import time
+import platform
+import argparse
+import threading
+from array import array
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+PERF_ENV = "NEUROLINK_PERF"
+SAMPLES = 512
+HUD_TAG = "_hud"
+HUD_INTERVAL_MS = 500
+# the Tk loop is probed this often to measure how late callbacks run
+LAG_PROBE_MS = 50
+
+
+def percentiles(samples) -> Dict[str, float]:
+    s = sorted(samples)
+    if not s:
+        return {}
+
+    def pick(q: float) -> float:
+        return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": s[-1], "n": len(s)}
+
+
+class Ring:
+    """The last `size` float samples, in a preallocated array."""
+
+    __slots__ = ("data", "size", "count")
+
+    def __init__(self, size: int = SAMPLES):
+        self.data = array("d", bytes(8 * size))
+        self.size = size
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.data[self.count % self.size] = value
+        self.count += 1
+
+    def values(self) -> List[float]:
+        if self.count < self.size:
+            return self.data[:self.count].tolist()
+        i = self.count % self.size
+        return self.data[i:].tolist() + self.data[:i].tolist()
+
+
+class Profiler:
+    """Stage timings (ms) and frame times; safe to use from worker threads.
+
+    A disabled profiler's `stage` is a shared `nullcontext`, so leaving the
+    calls in the hot paths costs next to nothing.
+    """
+
+    def __init__(self, enabled: bool = True, size: int = SAMPLES, dump_path: Optional[str] = None):
+        self.enabled = enabled
+        self.size = size
+        self.dump_path = dump_path
+        self.stages: Dict[str, Ring] = {}
+        self.frames = Ring(size)
+        self._lock = threading.Lock()
+        self._null = nullcontext()
+        self.started = time.time()
+
+    def record(self, name: str, ms: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            ring = self.stages.get(name)
+            if ring is None:
+                ring = self.stages[name] = Ring(self.size)
+            ring.add(ms)
+
+    @contextmanager
+    def _timed(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - t0) * 1000)
+
+    def stage(self, name: str):
+        """`with profiler.stage("resize"): ...` records how long the block took."""
+        if not self.enabled:
+            return self._null
+        return self._timed(name)
+
+    def frame(self) -> None:
+        """Mark a frame shown on screen (for fps)."""
+        if self.enabled:
+            with self._lock:
+                self.frames.add(time.perf_counter())
+
+    def fps(self, window: float = 2.0) -> float:
+        with self._lock:
+            stamps = self.frames.values()
+        if not stamps:
+            return 0.0
+        now = time.perf_counter()
+        recent = [t for t in stamps if now - t <= window]
+        return len(recent) / window
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples = {name: ring.values() for name, ring in self.stages.items()}
+        return {name: percentiles(vals) for name, vals in samples.items()}
+
+    def slowest(self, n: int = 3, key: str = "p95"):
+        stats = self.summary()
+        return sorted(stats.items(), key=lambda kv: kv[1].get(key, 0.0), reverse=True)[:n]
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """Write host info, percentiles and raw samples as JSON; returns the path."""
+        path = path or self.dump_path or time.strftime("perf-%Y%m%d-%H%M%S.json")
+        with self._lock:
+            samples = {name: ring.values() for name, ring in self.stages.items()}
+        out = {
+            "host": {
+                "node": platform.node(),
+                "machine": platform.machine(),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+            },
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "uptime_s": round(time.time() - self.started, 1),
+            "fps": round(self.fps(), 1),
+            "stages": {name: percentiles(vals) for name, vals in samples.items()},
+            "samples": samples,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=1)
+        return path
+
+
+DISABLED = Profiler(enabled=False)
+
+
+def from_env() -> Profiler:
+    value = os.environ.get(PERF_ENV, "")
+    if value in ("", "0"):
+        return DISABLED
+    return Profiler(dump_path=None if value == "1" else value)
+
+
+class PerfHud:
+    """Overlay in the canvas corner: fps, Tk loop lag and the slowest stages.
+
+    The loop lag comes from a probe rescheduled every LAG_PROBE_MS; how
+    late it fires is how long some other callback held the Tk thread.
+    `pause` stops the probe and redraws while the view is hidden, so they
+    cost nothing and don't fill the ring with idle samples.
+    """
+
+    def __init__(self, canvas, profiler: Profiler, interval_ms: int = HUD_INTERVAL_MS, font_size: int = 9):
+        self.canvas = canvas
+        self.profiler = profiler
+        self.interval_ms = interval_ms
+        self._bg = canvas.create_rectangle(0, 0, 0, 0, fill="black", outline="", stipple="gray50", tags=(HUD_TAG,))
+        self._text = canvas.create_text(6, 6, anchor="nw", fill="#7fff7f", font=("TkFixedFont", font_size),
+                                        tags=(HUD_TAG,))
+        self._closed = False
+        self._jobs: List = []
+        self.resume()
+
+    def resume(self) -> None:
+        if self._closed or self._jobs:
+            return
+        self._probe_due = time.perf_counter() + LAG_PROBE_MS / 1000
+        self._jobs = [self.canvas.after(LAG_PROBE_MS, self._probe), self.canvas.after(self.interval_ms, self._update)]
+
+    def pause(self) -> None:
+        for job in self._jobs:
+            try:
+                self.canvas.after_cancel(job)
+            except Exception:
+                pass
+        self._jobs = []
+
+    def _probe(self) -> None:
+        if not self._jobs:
+            return
+        now = time.perf_counter()
+        self.profiler.record("tk_lag", max(0.0, (now - self._probe_due) * 1000))
+        self._probe_due = now + LAG_PROBE_MS / 1000
+        self._jobs[0] = self.canvas.after(LAG_PROBE_MS, self._probe)
+
+    def _update(self) -> None:
+        if not self._jobs:
+            return
+        lines = [f"{self.profiler.fps():5.1f} fps"]
+        for name, st in self.profiler.slowest(4):
+            lines.append(f"{name:<14} p50 {st['p50']:6.1f}  p95 {st['p95']:6.1f} ms")
+        self.canvas.itemconfig(self._text, text="\n".join(lines))
+        x0, y0, x1, y1 = self.canvas.bbox(self._text) or (0, 0, 0, 0)
+        self.canvas.coords(self._bg, x0 - 4, y0 - 4, x1 + 4, y1 + 4)
+        self.canvas.tag_raise(HUD_TAG)
+        self._jobs[1] = self.canvas.after(self.interval_ms, self._update)
+
+    def close(self) -> None:
+        self._closed = True
+        self.pause()
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{'stage':<14} {'old p50':>8} {'new p50':>8} {'old p95':>8} {'new p95':>8} {'p95 x':>6}")
+    for name in sorted(set(old["stages"]) | set(new["stages"])):
+        a = old["stages"].get(name, {})
+        b = new["stages"].get(name, {})
+        ratio = f"{b['p95'] / a['p95']:.2f}" if a.get("p95") and b.get("p95") else "-"
+        cells = [f"{s[k]:8.2f}" if k in s else f"{'-':>8}" for s, k in ((a, "p50"), (b, "p50"), (a, "p95"), (b, "p95"))]
+        print(f"{name:<14} {' '.join(cells)} {ratio:>6}")
+    print(f"fps: {old.get('fps')} -> {new.get('fps')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="perfhud.py", description="inspect map frame-time dumps")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("show", help="print the percentiles in a dump")
+    p.add_argument("file")
+    p = sub.add_parser("compare", help="compare two dumps, e.g. two builds or two devices")
+    p.add_argument("old")
+    p.add_argument("new")
+    args = parser.parse_args(argv)
+    if args.cmd == "compare":
+        compare(args.old, args.new)
+        return
+    with open(args.file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    print(f"{data['host']['node']} {data['host']['machine']} {data['time']}, {data.get('fps')} fps")
+    for name, st in sorted(data["stages"].items(), key=lambda kv: -kv[1].get("p95", 0)):
+        print(f"  {name:<14} p50 {st['p50']:7.2f}  p95 {st['p95']:7.2f}  max {st['max']:7.2f} ms  (n={st['n']})")
+
+
+if __name__ == "__main__":
+    main()
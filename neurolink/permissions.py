@@ -0,0 +1,77 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+class PermissionEngine:
+    """Role permissions compiled to integer bitmasks.
+
+    Every permission name gets one bit. Each role's mask is the union of
+    its own permissions and those of all roles it inherits from, flattened
+    once at construction, so a check is a single AND. Superuser roles get
+    every bit plus `superuser_bit`, which also satisfies permission names
+    nobody declared.
+    """
+
+    def __init__(self, role_permissions: Dict[str, Iterable[str]],
+                 parents: Optional[Dict[str, Iterable[str]]] = None,
+                 superuser_roles: Iterable[str] = ()):
+        parents = parents or {}
+        names = sorted({p for perms in role_permissions.values() for p in perms})
+        self.bits: Dict[str, int] = {name: 1 << i for i, name in enumerate(names)}
+        self.superuser_bit = 1 << len(names)
+        self._superusers = set(superuser_roles)
+        self._query_cache: Dict[Tuple[str, ...], Tuple[int, bool]] = {}
+
+        own = {role: self._compile(perms)[0] for role, perms in role_permissions.items()}
+        self.role_masks: Dict[str, int] = {}
+        for role in set(own) | set(parents):
+            self.role_masks[role] = self._flatten(role, own, parents, ())
+        for role in self._superusers:
+            self.role_masks[role] = (self.superuser_bit << 1) - 1
+
+    def _compile(self, names: Iterable[str]) -> Tuple[int, bool]:
+        # -> (mask of the declared names, whether every name was declared)
+        mask = 0
+        complete = True
+        for name in names:
+            bit = self.bits.get(name)
+            if bit is None:
+                complete = False
+            else:
+                mask |= bit
+        return mask, complete
+
+    def _flatten(self, role: str, own: Dict[str, int], parents: Dict[str, Iterable[str]],
+                 path: Tuple[str, ...]) -> int:
+        if role in path:
+            raise ValueError(f"role inheritance cycle: {' -> '.join(path + (role,))}")
+        mask = own.get(role, 0)
+        for parent in parents.get(role, ()):
+            mask |= self._flatten(parent, own, parents, path + (role,))
+        return mask
+
+    def _query(self, names: Iterable[str]) -> Tuple[int, bool]:
+        key = tuple(names)
+        q = self._query_cache.get(key)
+        if q is None:
+            q = self._query_cache[key] = self._compile(key)
+        return q
+
+    def role_mask(self, role: str) -> int:
+        return self.role_masks.get(role, 0)
+
+    def has(self, mask: int, name: str) -> bool:
+        return bool(mask & self.bits.get(name, self.superuser_bit))
+
+    def has_all(self, mask: int, names: Iterable[str]) -> bool:
+        if mask & self.superuser_bit:
+            return True
+        want, complete = self._query(names)
+        return complete and mask & want == want
+
+    def has_any(self, mask: int, names: Iterable[str]) -> bool:
+        if mask & self.superuser_bit:
+            return True
+        return bool(mask & self._query(names)[0])
+
+    def permissions(self, mask: int) -> Set[str]:
+        return {name for name, bit in self.bits.items() if mask & bit}
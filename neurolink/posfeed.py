@@ -0,0 +1,405 @@
+"""Live position feeds for the map.
+
+A message is one line (or one UDP datagram holding one or more lines):
+
+    {"id": "A1", "x": 1520.5, "y": 880, "t": 1718000000.25}
+    {"id": "A1", "lat": 31.2304, "lon": 121.4737, "t": 1718000000.25}
+    A1,1520.5,880,1718000000.25
+
+x/y are map pixels; lat/lon need a georeferenced map. `t` is optional
+(receive time is used). Sources run on their own threads and push into a
+`PositionFeed`, which keeps only the newest position per id; the Tk side
+drains it at a capped frame rate with a `FeedPump`.
+
+    python3 posfeed.py synth demo.jsonl --units 200 --seconds 120
+    python3 src/main.py --feed replay:demo.jsonl
+    python3 posfeed.py send demo.jsonl --port 5005   # with --feed udp:5005
+"""
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import serial  # pyserial
+    SERIAL_AVAILABLE = True
+except Exception:
+    SERIAL_AVAILABLE = False
+
+DEFAULT_UDP_PORT = 5005
+DEFAULT_MAX_FPS = 15
+
+
+class Position(NamedTuple):
+    id: str
+    x: float
+    y: float
+    t: float
+    # x/y are lon/lat rather than map pixels
+    geo: bool = False
+
+
+def parse_message(line, now: Optional[float] = None) -> Optional[Position]:
+    """One feed line -> Position, or None if it isn't one."""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", "replace")
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    try:
+        if line[0] == "{":
+            d = json.loads(line)
+            t = float(d.get("t", now if now is not None else time.time()))
+            if "lat" in d and "lon" in d:
+                return Position(str(d["id"]), float(d["lon"]), float(d["lat"]), t, True)
+            return Position(str(d["id"]), float(d["x"]), float(d["y"]), t)
+        parts = line.split(",")
+        t = float(parts[3]) if len(parts) > 3 and parts[3] else (now if now is not None else time.time())
+        return Position(parts[0].strip(), float(parts[1]), float(parts[2]), t)
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+
+class PositionFeed:
+    """Newest position per id, filled by source threads, drained by the UI.
+
+    `push` is cheap and thread-safe; a burst of messages for the same id
+    collapses into one entry, and a message older than one already seen for
+    its id is dropped. `drain` hands over everything pending at once.
+    """
+
+    def __init__(self, sources: Optional[List["Source"]] = None):
+        self.sources: List[Source] = []
+        self._pending: Dict[str, Position] = {}
+        self._last_t: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.counters = {"received": 0, "malformed": 0, "stale": 0, "coalesced": 0, "delivered": 0}
+        for src in sources or ():
+            self.add_source(src)
+
+    def add_source(self, source: "Source") -> None:
+        source.feed = self
+        self.sources.append(source)
+
+    def start(self) -> None:
+        for src in self.sources:
+            src.start()
+
+    def push(self, pos: Optional[Position]) -> None:
+        with self._lock:
+            if pos is None:
+                self.counters["malformed"] += 1
+                return
+            self.counters["received"] += 1
+            if pos.t < self._last_t.get(pos.id, float("-inf")):
+                self.counters["stale"] += 1
+                return
+            self._last_t[pos.id] = pos.t
+            if pos.id in self._pending:
+                self.counters["coalesced"] += 1
+            self._pending[pos.id] = pos
+
+    def push_lines(self, data, now: Optional[float] = None) -> None:
+        for line in data.splitlines():
+            if line.strip():
+                self.push(parse_message(line, now))
+
+    def drain(self) -> List[Position]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self.counters["delivered"] += len(batch)
+        return list(batch.values())
+
+    def close(self) -> None:
+        for src in self.sources:
+            src.stop()
+
+
+class Source(threading.Thread):
+    """A feed input on its own daemon thread; `run_source` loops until `stopped`."""
+
+    name_prefix = "feed"
+
+    def __init__(self):
+        super().__init__(name=self.name_prefix, daemon=True)
+        self.feed: Optional[PositionFeed] = None
+        self._stop_event = threading.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        try:
+            self.run_source()
+        except Exception as e:
+            if not self.stopped:
+                print(f"[posfeed] {self.name} stopped: {e}")
+
+
+class UdpSource(Source):
+    name_prefix = "feed-udp"
+
+    def __init__(self, port: int = DEFAULT_UDP_PORT, host: str = "127.0.0.1"):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.5)
+
+    def run_source(self) -> None:
+        try:
+            while not self.stopped:
+                try:
+                    data, _ = self.sock.recvfrom(65535)
+                except socket.timeout:
+                    continue
+                self.feed.push_lines(data, time.time())
+        finally:
+            self.sock.close()
+
+
+class SerialSource(Source):
+    """Lines from a serial port (needs pyserial) or a pty / FIFO (plain file reads)."""
+
+    name_prefix = "feed-serial"
+
+    def __init__(self, path: str, baudrate: int = 115200):
+        super().__init__()
+        self.path = path
+        self.baudrate = baudrate
+
+    def _open(self):
+        if SERIAL_AVAILABLE and not self.path.startswith("/dev/pts/"):
+            return serial.Serial(self.path, self.baudrate, timeout=0.5)
+        return open(self.path, "rb", buffering=0)
+
+    def run_source(self) -> None:
+        dev = self._open()
+        # a serial port's read waits for its timeout; a plain file returns at once
+        waits = SERIAL_AVAILABLE and isinstance(dev, serial.Serial)
+        buf = b""
+        try:
+            while not self.stopped:
+                chunk = dev.read(4096)
+                if not chunk:
+                    if not waits:
+                        # EOF on a FIFO or a closed pty peer
+                        time.sleep(0.1)
+                    continue
+                buf += chunk
+                if b"\n" in buf:
+                    lines, _, buf = buf.rpartition(b"\n")
+                    self.feed.push_lines(lines, time.time())
+        finally:
+            dev.close()
+
+
+class ReplaySource(Source):
+    """Replay a recorded feed file, paced by its timestamps.
+
+    `speed` multiplies playback speed (0 = as fast as possible); with
+    `loop` the file restarts at the end. Timestamps are rewritten to the
+    replay clock so the feed never sees them as stale.
+    """
+
+    name_prefix = "feed-replay"
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    def run_source(self) -> None:
+        while not self.stopped:
+            start = time.time()
+            first_t = None
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if self.stopped:
+                        return
+                    pos = parse_message(line, now=0.0)
+                    if pos is None:
+                        continue
+                    if first_t is None:
+                        first_t = pos.t
+                    offset = pos.t - first_t
+                    if self.speed > 0:
+                        delay = start + offset / self.speed - time.time()
+                        if delay > 0 and self._stop_event.wait(delay):
+                            return
+                    self.feed.push(pos._replace(t=start + offset))
+            if not self.loop:
+                return
+
+
+def open_source(spec: str) -> Source:
+    """Source from a command-line spec.
+
+    udp:PORT, udp:HOST:PORT, serial:DEVICE[@BAUD], replay:FILE[@SPEED][+loop]
+    """
+    kind, _, arg = spec.partition(":")
+    if kind == "udp":
+        host, _, port = arg.rpartition(":")
+        return UdpSource(int(port or DEFAULT_UDP_PORT), host or "127.0.0.1")
+    if kind == "serial":
+        path, _, baud = arg.partition("@")
+        return SerialSource(path, int(baud) if baud else 115200)
+    if kind == "replay":
+        loop = arg.endswith("+loop")
+        if loop:
+            arg = arg[:-len("+loop")]
+        path, _, speed = arg.partition("@")
+        return ReplaySource(path, float(speed) if speed else 1.0, loop)
+    raise ValueError(f"unknown feed source {spec!r} (udp:, serial: or replay:)")
+
+
+class FeedPump:
+    """Apply a `PositionFeed` to the UI at most `max_fps` times per second.
+
+    Runs on the Tk thread via `after`, like `AuthService`'s polling: every
+    frame it drains the feed and calls `apply(positions)` with at most one
+    position per id, so the work per frame is bounded by the number of ids
+    that moved, not by the message rate. If `apply` overruns the frame,
+    the next frame is pushed back so Tk still gets idle time.
+    """
+
+    def __init__(self, widget, feed: PositionFeed, apply: Callable[[List[Position]], None],
+                 max_fps: float = DEFAULT_MAX_FPS):
+        self.widget = widget
+        self.feed = feed
+        self.apply = apply
+        self.interval_ms = max(1, int(1000 / max_fps))
+        self._job = None
+        self._closed = False
+
+    def start(self) -> None:
+        self._job = self.widget.after(self.interval_ms, self._tick)
+
+    def _tick(self) -> None:
+        self._job = None
+        if self._closed:
+            return
+        t0 = time.perf_counter()
+        batch = self.feed.drain()
+        if batch:
+            try:
+                self.apply(batch)
+            except Exception as e:
+                print(f"[posfeed] applying positions failed: {e}")
+        spent = int((time.perf_counter() - t0) * 1000)
+        self._job = self.widget.after(max(self.interval_ms - spent, spent, 1), self._tick)
+
+    def stop(self) -> None:
+        self._closed = True
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+
+def synth(path: str, units: int = 50, seconds: float = 60.0, rate: float = 1.0,
+          width: float = 2000.0, height: float = 2000.0) -> int:
+    """Write a replay file of `units` random walkers; returns the message count."""
+    rng = random.Random(0)
+    state = [[rng.uniform(0, width), rng.uniform(0, height), rng.uniform(0, 2 * math.pi)] for _ in range(units)]
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for step in range(int(seconds * rate)):
+            t = step / rate
+            for i, s in enumerate(state):
+                s[2] += rng.uniform(-0.3, 0.3)
+                s[0] = min(width, max(0.0, s[0] + math.cos(s[2]) * 5))
+                s[1] = min(height, max(0.0, s[1] + math.sin(s[2]) * 5))
+                f.write(json.dumps({"id": f"U{i:04d}", "x": round(s[0], 1), "y": round(s[1], 1), "t": t}) + "\n")
+                n += 1
+    return n
+
+
+def send(path: str, port: int = DEFAULT_UDP_PORT, host: str = "127.0.0.1", speed: float = 1.0) -> int:
+    """Play a replay file to a UDP feed, batching lines into datagrams per timestamp."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.time()
+    first_t = None
+    sent = 0
+    batch: List[str] = []
+    batch_t = None
+
+    def flush():
+        nonlocal batch, sent
+        # keep datagrams well under the UDP limit
+        for i in range(0, len(batch), 100):
+            sock.sendto("\n".join(batch[i:i + 100]).encode("utf-8"), (host, port))
+        sent += len(batch)
+        batch = []
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            pos = parse_message(line, now=0.0)
+            if pos is None:
+                continue
+            if first_t is None:
+                first_t = pos.t
+            if batch and pos.t != batch_t:
+                flush()
+            if not batch and speed > 0:
+                delay = start + (pos.t - first_t) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            batch_t = pos.t
+            batch.append(line.strip())
+    if batch:
+        flush()
+    sock.close()
+    return sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="posfeed.py", description="position feed tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("synth", help="write a synthetic replay file")
+    p.add_argument("out")
+    p.add_argument("--units", type=int, default=50)
+    p.add_argument("--seconds", type=float, default=60.0)
+    p.add_argument("--rate", type=float, default=1.0, help="messages per unit per second")
+    p = sub.add_parser("send", help="play a replay file to a UDP feed")
+    p.add_argument("file")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_UDP_PORT)
+    p.add_argument("--speed", type=float, default=1.0, help="playback speed, 0 = as fast as possible")
+    p = sub.add_parser("listen", help="print what a feed source receives, as counters")
+    p.add_argument("spec", help="udp:PORT, serial:DEVICE[@BAUD] or replay:FILE[@SPEED]")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "synth":
+        n = synth(args.out, args.units, args.seconds, args.rate)
+        print(f"wrote {n} messages to {args.out}")
+    elif args.cmd == "send":
+        n = send(args.file, args.port, args.host, args.speed)
+        print(f"sent {n} messages")
+    else:
+        feed = PositionFeed([open_source(args.spec)])
+        feed.start()
+        try:
+            while True:
+                time.sleep(1.0)
+                ids = len(feed.drain())
+                print(f"{ids} ids updated, {feed.counters}")
+        except KeyboardInterrupt:
+            feed.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Benchmarks for users.py against synthetic stores of growing size.
+
+For every backend and store size it measures UserManager start-up (the
+store load), authenticate latency, the cost of create_user /
+set_password / delete_user including the write to disk, a full snapshot
+save, and peak Python memory while loading. Results are printed as a
+table and written as JSON; pass `--compare` an earlier JSON file (e.g.
+from the Pi) to print ratios and fail on regressions.
+
+    python3 scripts/bench_users.py --sizes 10,1000,10000 --json pi3.json
+    python3 scripts/bench_users.py --json desktop.json --compare pi3.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import secrets
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+base = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if base not in sys.path:
+    sys.path.insert(0, base)
+import users
+from perfhud import percentiles
+from userstore import open_store
+
+BACKENDS = {
+    # name -> (file name, journal)
+    "json": ("users.json", False),
+    "journal": ("users.json", True),
+    "sqlite": ("users.db", False),
+}
+DEFAULT_SIZES = "10,1000,10000,100000"
+PASSWORD = "bench-password"
+# differences smaller than this (ms or MB) are noise, whatever the ratio
+NOISE_FLOOR = 1.0
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def build_store(path: str, journal: bool, size: int, policy: users.KdfPolicy) -> None:
+    # every synthetic account shares one salt/hash so building 100k users
+    # costs one PBKDF2 run; verification work per login is unchanged
+    salt = secrets.token_bytes(16)
+    dk = users.pbkdf2(policy.kdf, PASSWORD, salt, policy.iterations)
+    roles = (users.ROLE_SOLDIER, users.ROLE_COMMANDER, users.ROLE_ADMIN)
+    store = open_store(path, users.User.from_dict, journal=journal)
+    store.load()
+    batch = []
+    for i in range(size):
+        batch.append(users.User(f"user{i:06d}", roles[i % 3], salt, dk, policy.kdf, policy.iterations))
+        if len(batch) == 10_000:
+            store.put_many(batch)
+            batch = []
+    if batch:
+        store.put_many(batch)
+    store.save()
+    store.close()
+
+
+def bench_case(workdir: str, backend: str, size: int, policy: users.KdfPolicy,
+               args: argparse.Namespace) -> Dict[str, Any]:
+    filename, journal = BACKENDS[backend]
+    path = os.path.join(workdir, f"{backend}-{size}", filename)
+    os.makedirs(os.path.dirname(path))
+    t0 = time.perf_counter()
+    build_store(path, journal, size, policy)
+    result: Dict[str, Any] = {"backend": backend, "size": size,
+                              "build_s": time.perf_counter() - t0,
+                              "file_bytes": os.path.getsize(path)}
+
+    def open_manager() -> users.UserManager:
+        return users.UserManager(path, journal=journal, policy=policy)
+
+    # start-up time; a few runs, fewer for big stores
+    loads = []
+    for _ in range(max(1, args.load_runs if size < 100_000 else args.load_runs // 2)):
+        gc.collect()
+        t0 = time.perf_counter()
+        m = open_manager()
+        loads.append((time.perf_counter() - t0) * 1000.0)
+        m.close()
+        del m
+    result["load_ms"] = percentiles(loads)
+
+    # peak and retained Python memory of a load, in a separate pass because
+    # tracemalloc slows allocation down
+    gc.collect()
+    tracemalloc.start()
+    m = open_manager()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["load_peak_bytes"] = peak
+    result["retained_bytes"] = current
+
+    rng = random.Random(size)
+    names = [f"user{rng.randrange(size):06d}" for _ in range(args.auth_samples)]
+    result["auth_ms"] = percentiles([timed(lambda n=n: m.authenticate(n, PASSWORD)) for n in names])
+    result["auth_unknown_ms"] = percentiles(
+        [timed(lambda: m.authenticate(f"nobody{i}", PASSWORD)) for i in range(args.auth_samples)])
+
+    new_names = [f"bench{i:04d}" for i in range(args.ops)]
+    result["create_ms"] = percentiles(
+        [timed(lambda n=n: m.create_user(n, PASSWORD, users.ROLE_SOLDIER)) for n in new_names])
+    result["set_password_ms"] = percentiles(
+        [timed(lambda n=n: m.set_password(n, PASSWORD + "2")) for n in new_names])
+    result["delete_ms"] = percentiles([timed(lambda n=n: m.delete_user(n)) for n in new_names])
+    m.flush()
+    result["save_ms"] = percentiles([timed(m._save) for _ in range(args.save_runs)])
+    m.close()
+    return result
+
+
+COLUMNS = [
+    # (header, key, sub-key, width, format)
+    ("backend", "backend", None, 8, ""),
+    ("users", "size", None, 7, ""),
+    ("load p50", "load_ms", "p50", 9, ".1f"),
+    ("peak MB", "load_peak_bytes", None, 8, ".1f"),
+    ("auth p50", "auth_ms", "p50", 9, ".1f"),
+    ("auth p99", "auth_ms", "p99", 9, ".1f"),
+    ("unk p50", "auth_unknown_ms", "p50", 8, ".2f"),
+    ("create", "create_ms", "p50", 8, ".1f"),
+    ("passwd", "set_password_ms", "p50", 8, ".1f"),
+    ("delete", "delete_ms", "p50", 8, ".1f"),
+    ("save", "save_ms", "p50", 8, ".1f"),
+]
+
+
+def _cell(r: Dict[str, Any], key: str, sub: Optional[str]) -> Any:
+    v = r.get(key)
+    if sub is not None:
+        v = (v or {}).get(sub)
+    if key.endswith("_bytes") and v is not None:
+        v = v / (1024 * 1024)
+    return v
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print("  ".join(f"{h:>{w}}" for h, _, _, w, _ in COLUMNS))
+    for r in results:
+        print("  ".join(f"{_cell(r, key, sub):>{w}{fmt}}" for _, key, sub, w, fmt in COLUMNS))
+    print("(times in ms, p50 unless noted; memory is tracemalloc peak while loading)")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["backend"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nratio to {baseline_path} (>1 is slower or bigger):")
+    for r in results:
+        old = baseline.get((r["backend"], r["size"]))
+        if old is None:
+            continue
+        parts = []
+        for header, key, sub, _, _ in COLUMNS[2:]:
+            a, b = _cell(r, key, sub), _cell(old, key, sub)
+            if not a or not b:
+                continue
+            ratio = a / b
+            mark = ""
+            if ratio > 1.0 + threshold and a - b > NOISE_FLOOR:
+                mark = "!"
+                regressions += 1
+            parts.append(f"{header} {ratio:.2f}{mark}")
+        print(f"  {r['backend']:>8} {r['size']:>7}: " + ", ".join(parts))
+    if regressions:
+        print(f"{regressions} metric(s) regressed by more than {threshold:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench_users.py", description="benchmark users.py against synthetic stores")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated store sizes (default {DEFAULT_SIZES})")
+    parser.add_argument("--backends", default="json,journal,sqlite", help="comma-separated: json, journal, sqlite")
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="PBKDF2 iterations of the synthetic accounts (default: the saved policy)")
+    parser.add_argument("--auth-samples", type=int, default=30, help="authenticate calls per case (default 30)")
+    parser.add_argument("--ops", type=int, default=10, help="create/set_password/delete calls per case (default 10)")
+    parser.add_argument("--load-runs", type=int, default=5, help="start-up measurements per case (default 5)")
+    parser.add_argument("--save-runs", type=int, default=3, help="full snapshot saves per case (default 3)")
+    parser.add_argument("--dir", default=None, help="where to build stores; use the SD card to include its fsync cost")
+    parser.add_argument("--json", default=None, help="write results to this file")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression threshold for --compare (default 0.2)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    backends = [b for b in args.backends.split(",") if b]
+    for b in backends:
+        if b not in BACKENDS:
+            parser.error(f"unknown backend {b!r}")
+    if args.iterations:
+        policy = users.KdfPolicy(users.DEFAULT_KDF, args.iterations)
+    else:
+        policy = users.load_policy(users.policy_path_for(users.default_store_path()))
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="neurolink-bench-", dir=args.dir) as workdir:
+        for backend in backends:
+            for size in sizes:
+                print(f"[bench] {backend} {size} users ...", file=sys.stderr)
+                results.append(bench_case(workdir, backend, size, policy, args))
+
+    print_table(results)
+    report = {
+        "host": {
+            "node": platform.node(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "policy": {"kdf": policy.kdf, "iterations": policy.iterations},
+        "params": {"auth_samples": args.auth_samples, "ops": args.ops,
+                   "load_runs": args.load_runs, "save_runs": args.save_runs},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.json}")
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
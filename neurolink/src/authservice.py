@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import users
+
+
+class AuthService:
+    """Run password verification off the Tk main thread.
+
+    PBKDF2 in hashlib releases the GIL, so a small thread pool is enough to
+    keep the event loop responsive. Tk is not thread-safe: results are never
+    delivered from the worker; instead the main thread polls the pending
+    future with `root.after` and invokes the callback there.
+
+    Only one check runs at a time. While a check is in flight further
+    requests are ignored (`authenticate` returns False), which also drops
+    duplicate submits from a bouncing touch key or repeated <Return>.
+    """
+
+    POLL_MS = 20
+
+    def __init__(self, root, manager_factory=None, max_workers: int = 1):
+        self.root = root
+        self.manager_factory = manager_factory or users.get_manager
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth")
+        self._future = None
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._future is not None
+
+    def authenticate(self, username: str, password: str, callback) -> bool:
+        """Verify credentials in the background.
+
+        `callback(user, error)` is called on the Tk thread with the
+        authenticated `users.User` (or None on bad credentials) and the
+        exception raised by the check, if any. Returns False if a check is
+        already running and the request was ignored.
+        """
+        with self._lock:
+            if self._future is not None:
+                return False
+            self._future = self._executor.submit(self._verify, username, password)
+        self.root.after(self.POLL_MS, self._poll, self._future, callback)
+        return True
+
+    def warm(self):
+        """Load the user store on the worker ahead of the first login; returns the future."""
+        return self._executor.submit(self.manager_factory)
+
+    def _verify(self, username, password):
+        # get_manager() may itself load the store and hash the default admin
+        # password on first use, so it also belongs on the worker.
+        mgr = self.manager_factory()
+        return mgr.authenticate(username, password)
+
+    def _poll(self, future, callback):
+        if not future.done():
+            self.root.after(self.POLL_MS, self._poll, future, callback)
+            return
+        with self._lock:
+            if self._future is future:
+                self._future = None
+        try:
+            user, error = future.result(), None
+        except Exception as e:
+            user, error = None, e
+        callback(user, error)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_service = None
+
+
+def get_service(root) -> AuthService:
+    global _service
+    if _service is None or _service.root is not root:
+        _service = AuthService(root)
+    return _service
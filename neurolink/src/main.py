@@ -1,5 +1,9 @@
+import time
+# start of the start-up timeline (see startuptrace)
+_T0 = time.perf_counter()
 import os
 import sys
+import math
 import argparse
 import tkinter as tk
 from tkinter import font, messagebox
@@ -8,25 +12,44 @@ from tkinter import font, messagebox
 base = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if base not in sys.path:
     sys.path.insert(0, base)
-import users
-import usermgmt
-import mapview
-
-# Optional Pillow support for JPEG/other formats
-try:
-    from PIL import Image, ImageTk
-    PIL_AVAILABLE = True
-except Exception:
-    PIL_AVAILABLE = False
-
-if PIL_AVAILABLE:
-    try:
-        RESAMPLE = Image.Resampling.LANCZOS
-    except Exception:
+from startuptrace import StartupTrace
+
+# Everything else -- the user store, the map, Pillow -- is imported where it
+# is first used, so the login screen can paint before any of it loads.
+
+_pil = None
+
+
+def load_pil():
+    """(Image, ImageTk, RESAMPLE) from Pillow, or None without it; imported on first use."""
+    global _pil
+    if _pil is None:
         try:
-            RESAMPLE = Image.LANCZOS
+            from PIL import Image, ImageTk
+            try:
+                resample = Image.Resampling.LANCZOS
+            except Exception:
+                resample = getattr(Image, "LANCZOS", getattr(Image, "ANTIALIAS", 1))
+            _pil = (Image, ImageTk, resample)
         except Exception:
-            RESAMPLE = getattr(Image, "ANTIALIAS", 1)
+            _pil = False
+    return _pil or None
+
+
+def auth_error_text(error) -> str:
+    from auththrottle import AuthThrottled
+    from userstore import StoreCorrupt
+    if isinstance(error, AuthThrottled):
+        return f"尝试过于频繁，请 {max(1, math.ceil(error.retry_after))} 秒后再试"
+    if isinstance(error, StoreCorrupt):
+        return f"用户库 {error.path} 已损坏，无法登录。请从备份恢复该文件，或将其移走后重新启动（将重新创建默认管理员 admin/admin）。"
+    return str(error)
+
+
+def preload_map_view(size):
+    # on the preload thread: opening the map imports Pillow and the map modules too
+    import mapview
+    return mapview.preload_map(size=size)
 
 
 def read_version():
@@ -39,11 +62,19 @@ def read_version():
 
 
 class LoginApp:
-    def __init__(self, root, touch_mode: bool = False):
+    def __init__(self, root, touch_mode: bool = False, feed_specs=None, trace=None):
         self.root = root
         self.root.title("neurolink")
         self.root.configure(bg="black")
         self.touch_mode = bool(touch_mode)
+        # position feed sources (posfeed.open_source specs) for the map
+        self.feed_specs = list(feed_specs or [])
+        self.trace = trace or StartupTrace(enabled=False)
+        # called once the login screen is up and the deferred work is done
+        self.on_started = None
+        # login and map screens (see viewmanager), created on first use
+        self._views = None
+        self.mapwin = None
 
         # If touch mode, prefer fullscreen on touch devices
         if self.touch_mode:
@@ -88,38 +119,12 @@ class LoginApp:
             bg="black",
             font=ver_font,
         )
+        self.ver_label.grid(row=1, column=0, pady=(0, 8))
 
-        # Attempt to load logo image (kept in assets/logo.jpeg).
-        # We'll keep the original PIL image in `self.logo_raw` and
-        # perform resizing after the login entry is created so the
-        # logo width can match the input width.
-        self.logo_raw = None
+        # The logo is loaded after the first paint (see _load_logo) and
+        # sized to the username entry's width.
         self.logo_img = None
-        logo_path = None
-        try:
-            base = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-            # prefer PNG if present, fall back to JPEG/JPG
-            logo_path = None
-            for candidate in ("logo.png", "logo.jpeg", "logo.jpg"):
-                p = os.path.join(base, "assets", candidate)
-                if os.path.exists(p):
-                    logo_path = p
-                    break
-            if logo_path:
-                if PIL_AVAILABLE:
-                    try:
-                        self.logo_raw = Image.open(logo_path).convert("RGBA")
-                    except Exception:
-                        self.logo_raw = None
-                else:
-                    try:
-                        self.logo_img = tk.PhotoImage(file=logo_path)
-                    except Exception:
-                        self.logo_img = None
-            else:
-                self.logo_raw = None
-        except Exception:
-            self.logo_raw = None
+        self.logo_label = None
 
         # Center frame for login (as child of container)
         self.frame = tk.Frame(self.container, bg="black")
@@ -152,10 +157,80 @@ class LoginApp:
 
         self.username.focus_set()
         self.root.bind("<Return>", lambda e: self.submit())
+        self.trace.mark("login form built")
+        self.root.after_idle(self._after_first_paint)
 
-        # Now that entries exist and have requested sizes, resize logo to
-        # match the username entry width and place it above the version.
+    def _after_first_paint(self):
+        # flush pending geometry and redraws so the form is really on screen
         self.root.update_idletasks()
+        self.trace.mark("first paint")
+        # one more turn of the loop so input is handled before the extra work
+        self.root.after(1, self._deferred_startup)
+
+    def _deferred_startup(self):
+        self._load_logo()
+        self.trace.mark("logo")
+        # load the user store on the auth worker now, not on the first login
+        import authservice
+        self.trace.mark("auth imported")
+        self._poll_warm(authservice.get_service(self.root).warm())
+
+    def _poll_warm(self, future):
+        if not future.done():
+            self.root.after(20, self._poll_warm, future)
+            return
+        self.trace.mark("user store loaded" if future.exception() is None else "user store failed")
+        self._preload_map()
+        if self.on_started:
+            self.on_started()
+
+    def views(self):
+        if self._views is None:
+            import viewmanager
+            self._views = viewmanager.ViewManager()
+            self._views.add("login", self, pinned=True)
+            self._views.current = "login"
+        return self._views
+
+    def show(self):
+        self.container.place(relx=0.5, rely=0.45, anchor="center")
+        self.username.focus_set()
+
+    def hide(self):
+        self.password.delete(0, "end")
+        self.container.place_forget()
+
+    def close(self):
+        # the login screen lives as long as the root window
+        pass
+
+    def _preload_map(self):
+        # open the map and decode its first view while the user types
+        views = self.views()
+        if "map" in views or views.preloading("map"):
+            return
+        self.root.update_idletasks()
+        views.preload("map", preload_map_view, (self.root.winfo_width(), self.root.winfo_height()))
+        self.trace.mark("map preload started")
+
+    def _load_logo(self):
+        # Attempt to load logo image (kept in assets/logo.png|jpeg|jpg),
+        # sized to match the username entry width, above the version.
+        logo_path = None
+        try:
+            base = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+            # prefer PNG if present, fall back to JPEG/JPG
+            for candidate in ("logo.png", "logo.jpeg", "logo.jpg"):
+                p = os.path.join(base, "assets", candidate)
+                if os.path.exists(p):
+                    logo_path = p
+                    break
+        except Exception:
+            logo_path = None
+        if not logo_path:
+            print("LOGO: not found")
+            return
+
         try:
             target_w = self.username.winfo_width()
         except Exception:
@@ -167,135 +242,219 @@ class LoginApp:
             except Exception:
                 target_w = 300
 
-        if self.logo_raw:
+        import assetbuild
+        import imagecache
+        # a variant prebuilt for this display (assetbuild.py), else one
+        # scaled once and kept on disk; neither needs Pillow to load
+        cached = assetbuild.best_logo(target_w) or imagecache.get_cache().scaled_to_width(logo_path, target_w)
+        if cached:
             try:
-                ow, oh = self.logo_raw.size
-                ratio = target_w / float(ow)
-                new_h = max(20, int(oh * ratio))
-                resized = self.logo_raw.resize((target_w, new_h), RESAMPLE)
+                self.logo_img = tk.PhotoImage(file=cached)
+                print(f"LOGO: loaded {target_w}px wide from cache {cached}")
+            except Exception as e:
+                print("LOGO: cached image failed to load", e)
+
+        # no cache entry: scale with Pillow, or at least subsample in Tk
+        pil = None if self.logo_img else load_pil()
+        if not self.logo_img and pil:
+            Image, ImageTk, resample = pil
+            try:
+                raw = Image.open(logo_path)
+                ow, oh = raw.size
+                new_h = max(20, int(oh * target_w / float(ow)))
+                # JPEG can decode at 1/2, 1/4, 1/8 scale, much faster than full size
+                raw.draft("RGB", (target_w, new_h))
+                resized = raw.convert("RGBA").resize((target_w, new_h), resample)
                 self.logo_img = ImageTk.PhotoImage(resized)
-                self.logo_label = tk.Label(self.container, image=self.logo_img, bg="black")
-                # logo tightly above version
-                self.logo_label.grid(row=0, column=0, pady=(0, 2))
-                self.ver_label.grid(row=1, column=0, pady=(0, 2))
                 print(f"LOGO: loaded and resized to {target_w}x{new_h} from {logo_path}")
             except Exception as e:
-                self.logo_label = None
+                self.logo_img = None
                 print("LOGO: failed to create image", e)
-        elif self.logo_img:
+        elif not self.logo_img:
             try:
-                # If PIL wasn't available and we only have a Tk PhotoImage,
-                # try to subsample it to approximate the target width.
-                try:
-                    cur_w = self.logo_img.width()
-                except Exception:
-                    cur_w = None
+                self.logo_img = tk.PhotoImage(file=logo_path)
+                # If PIL isn't available we only have a Tk PhotoImage;
+                # subsample it to approximate the target width.
+                cur_w = self.logo_img.width()
                 if cur_w and target_w and cur_w > target_w:
-                    try:
-                        import math
-                        factor = max(1, math.ceil(cur_w / float(target_w)))
-                        if factor > 1:
-                            self.logo_img = self.logo_img.subsample(factor, factor)
-                    except Exception:
-                        pass
-                self.logo_label = tk.Label(self.container, image=self.logo_img, bg="black")
-                self.logo_label.grid(row=0, column=0, pady=(0, 2))
-                self.ver_label.grid(row=1, column=0, pady=(0, 2))
+                    factor = max(1, math.ceil(cur_w / float(target_w)))
+                    if factor > 1:
+                        self.logo_img = self.logo_img.subsample(factor, factor)
                 print(f"LOGO: loaded PhotoImage from {logo_path} (cur_w={cur_w}, target_w={target_w})")
-            except Exception:
-                self.logo_label = None
-                print("LOGO: PhotoImage exists but failed to place")
-        else:
-            self.logo_label = None
-            self.ver_label.grid(row=1, column=0, pady=(0, 8))
-            print(f"LOGO: not found at {logo_path} or failed to load")
-
-
-        # second set (recreate fonts if needed)
-        if getattr(self, "touch_mode", False):
-            label_font = font.Font(size=26)
-            entry_font = font.Font(size=22)
-            btn_font = font.Font(size=24)
-        else:
-            label_font = font.Font(size=18)
-            entry_font = font.Font(size=16)
-            btn_font = font.Font(size=18)
-
-        tk.Label(self.frame, text="用户名", fg="white", bg="black", font=label_font).grid(row=0, column=0, pady=8, sticky="e")
-        self.username = tk.Entry(self.frame, font=entry_font, width=20)
-        self.username.grid(row=0, column=1, pady=8, padx=10)
-
-        tk.Label(self.frame, text="密码", fg="white", bg="black", font=label_font).grid(row=1, column=0, pady=8, sticky="e")
-        self.password = tk.Entry(self.frame, font=entry_font, show="*", width=20)
-        self.password.grid(row=1, column=1, pady=8, padx=10)
-
-        if getattr(self, "touch_mode", False):
-            self.login_btn = tk.Button(self.frame, text="登录", command=self.submit, font=btn_font, height=2, width=14)
-        else:
-            self.login_btn = tk.Button(self.frame, text="登录", command=self.submit, font=btn_font)
-        self.login_btn.grid(row=2, column=0, columnspan=2, pady=16)
-
-        self.username.focus_set()
-        self.root.bind("<Return>", lambda e: self.submit())
+            except Exception as e:
+                self.logo_img = None
+                print("LOGO: failed to load", e)
+        if self.logo_img:
+            self.logo_label = tk.Label(self.container, image=self.logo_img, bg="black")
+            # logo tightly above version
+            self.logo_label.grid(row=0, column=0, pady=(0, 2))
+            self.ver_label.grid_configure(pady=(0, 2))
 
     def submit(self):
+        if self._views is not None and self._views.current != "login":
+            # <Return> is bound on the root, so it also fires over the map
+            return
+        import authservice
+        auth = authservice.get_service(self.root)
+        if auth.busy:
+            # a check is already in flight; ignore repeated submits
+            return
         user = self.username.get().strip()
         pwd = self.password.get()
         if not user:
             messagebox.showwarning("提示", "请输入用户名")
             return
-        mgr = users.get_manager()
-        u = mgr.authenticate(user, pwd)
+        if auth.authenticate(user, pwd, self._on_authenticated):
+            self._set_busy(True)
+
+    def _set_busy(self, busy: bool, text: str = "验证中…"):
+        try:
+            if busy:
+                self.login_btn.config(state="disabled", text=text)
+                self.root.config(cursor="watch")
+            else:
+                self.login_btn.config(state="normal", text="登录")
+                self.root.config(cursor="")
+        except Exception:
+            pass
+
+    def _on_authenticated(self, u, error):
+        self._set_busy(False)
+        if error is not None:
+            messagebox.showerror("错误", auth_error_text(error))
+            return
         if not u:
             messagebox.showerror("登录失败", "用户名或密码错误")
             return
         # On success, open the configured map view (replace login UI)
-        try:
-            role_name = u.role
-            perms = users.PERMISSIONS.get(role_name, set())
-            # hide login container and embed the map view
+        self._open_map()
+
+    def _open_map(self):
+        # switch to the map view, reusing the one kept from an earlier login
+        # or the map preloaded in the background
+        views = self.views()
+        if "map" not in views:
+            future = views.preloading("map")
+            if future is not None and not future.done():
+                self._set_busy(True, "加载地图…")
+                self.root.after(20, self._open_map)
+                return
+            self._set_busy(False)
+            future = views.take_preload("map")
+            loaded = None
+            if future is not None:
+                try:
+                    loaded = future.result()
+                except Exception as e:
+                    print(f"[main] map preload failed, loading it now: {e}")
+            import mapview
             try:
-                self.container.place_forget()
-            except Exception:
-                pass
-            self.mapwin = mapview.MapWindow(self.root, touch_mode=getattr(self, "touch_mode", False))
+                self.mapwin = mapview.MapWindow(self.root, touch_mode=getattr(self, "touch_mode", False),
+                                                preloaded=loaded)
+            except Exception as e:
+                if loaded is not None:
+                    loaded.close()
+                messagebox.showerror("错误", str(e))
+                return
+            self.mapwin.on_back = self.logout
+            views.add("map", self.mapwin)
+            self._attach_feed(self.mapwin)
+        views.show("map")
+
+    def _attach_feed(self, mapwin):
+        if not self.feed_specs:
+            return
+        import posfeed
+        try:
+            feed = posfeed.PositionFeed([posfeed.open_source(s) for s in self.feed_specs])
+            feed.start()
+            mapwin.attach_feed(feed)
         except Exception as e:
-            messagebox.showerror("错误", str(e))
+            messagebox.showwarning("位置数据源", f"无法打开位置数据源: {e}")
+
+    def logout(self):
+        # back to the login screen; the map stays built (feed and all) for
+        # the next login unless the view manager has to evict it
+        views = self.views()
+        views.show("login")
+        if "map" not in views:
+            self.mapwin = None
+            self._preload_map()
 
     def open_usermgmt(self):
-        # Prompt for admin credentials before opening management UI
-        auth = AdminAuthDialog(self.root)
+        # Prompt for admin credentials before opening management UI; the
+        # dialog verifies them on the auth worker and returns the user.
+        import authservice
+        import users
+        import usermgmt
+        auth = AdminAuthDialog(self.root, authservice.get_service(self.root))
         if not auth.result:
             return
-        user, pwd = auth.result
-        mgr = users.get_manager()
-        u = mgr.authenticate(user, pwd)
-        if not u or u.role != users.ROLE_ADMIN:
+        u = auth.result
+        if u.role != users.ROLE_ADMIN:
             messagebox.showerror("认证失败", "需要系统管理员权限")
             return
         # Open management window
-        usermgmt.UserMgmtWindow(self.root, manager=mgr)
+        usermgmt.UserMgmtWindow(self.root, manager=users.get_manager())
 
 
 def main():
     parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument("--touch", action="store_true", help="enable touch-friendly UI (fullscreen, larger controls)")
+    parser.add_argument("--auth-socket", help="use the authd.py daemon listening on this socket for accounts")
+    parser.add_argument("--feed", action="append", default=[], metavar="SPEC",
+                        help="live positions for the map: udp:PORT, serial:DEVICE[@BAUD] or replay:FILE[@SPEED][+loop]")
+    parser.add_argument("--perf", nargs="?", const="1", metavar="FILE",
+                        help="show frame timings on the map; with FILE, write them there when the map closes")
+    parser.add_argument("--startup-trace", nargs="?", const="-", metavar="FILE",
+                        help="print a timeline of the start-up phases; with FILE, also write it there as JSON")
+    parser.add_argument("--startup-budget", type=float, metavar="MS",
+                        help="with --startup-trace: warn (and exit 1 with --quit-after-start) if first paint takes longer")
+    parser.add_argument("--quit-after-start", action="store_true", help="exit once start-up has finished (for timing)")
     args, _ = parser.parse_known_args()
+    trace = StartupTrace(_T0, enabled=bool(args.startup_trace))
+    if args.auth_socket:
+        import users
+        os.environ[users.AUTHD_SOCKET_ENV] = args.auth_socket
+    if args.perf:
+        import perfhud
+        os.environ[perfhud.PERF_ENV] = args.perf
+    trace.mark("imports and arguments")
 
     root = tk.Tk()
-    app = LoginApp(root, touch_mode=bool(args.touch))
+    trace.mark("Tk created")
+    app = LoginApp(root, touch_mode=bool(args.touch), feed_specs=args.feed, trace=trace)
     # add a small management button under the stacked container
     try:
         mgmt_btn = tk.Button(app.container, text="用户管理", command=app.open_usermgmt)
         mgmt_btn.grid(row=3, column=0, pady=(8, 2))
     except Exception:
         pass
+    status = {"code": 0}
+
+    def started():
+        if args.startup_trace:
+            trace.report()
+            if args.startup_trace != "-":
+                trace.dump(args.startup_trace)
+            paint = trace.elapsed("first paint")
+            if args.startup_budget and paint is not None and paint > args.startup_budget:
+                print(f"[startup] first paint {paint:.0f} ms is over the {args.startup_budget:.0f} ms budget",
+                      file=sys.stderr)
+                status["code"] = 1
+        if args.quit_after_start:
+            root.destroy()
+
+    app.on_started = started
     root.mainloop()
+    if status["code"]:
+        sys.exit(status["code"])
 
 
 class AdminAuthDialog:
-    def __init__(self, parent):
+    def __init__(self, parent, auth_service):
         self.result = None
+        self.auth = auth_service
         self.win = tk.Toplevel(parent)
         self.win.title("管理员认证")
         self.win.transient(parent)
@@ -313,7 +472,8 @@ class AdminAuthDialog:
         btns = tk.Frame(self.win)
         btns.pack(pady=6)
         tk.Button(btns, text="取消", command=self.cancel).pack(side="right", padx=4)
-        tk.Button(btns, text="确定", command=self.ok).pack(side="right", padx=4)
+        self.ok_btn = tk.Button(btns, text="确定", command=self.ok)
+        self.ok_btn.pack(side="right", padx=4)
 
         self.win.bind("<Return>", lambda e: self.ok())
         self.win.bind("<Escape>", lambda e: self.cancel())
@@ -321,12 +481,33 @@ class AdminAuthDialog:
         parent.wait_window(self.win)
 
     def ok(self):
+        if self.auth.busy:
+            return
         user = self.user_ent.get().strip()
         pw = self.pw_ent.get()
         if not user or not pw:
             messagebox.showwarning("提示", "请输入用户名和密码")
             return
-        self.result = (user, pw)
+        if self.auth.authenticate(user, pw, self._on_authenticated):
+            self.ok_btn.config(state="disabled", text="验证中…")
+            self.win.config(cursor="watch")
+
+    def _on_authenticated(self, u, error):
+        # the dialog may have been cancelled while the check was running
+        try:
+            if not self.win.winfo_exists():
+                return
+        except Exception:
+            return
+        self.ok_btn.config(state="normal", text="确定")
+        self.win.config(cursor="")
+        if error is not None:
+            messagebox.showerror("错误", auth_error_text(error), parent=self.win)
+            return
+        if not u:
+            messagebox.showerror("认证失败", "用户名或密码错误", parent=self.win)
+            return
+        self.result = u
         self.win.destroy()
 
     def cancel(self):
@@ -33,7 +33,7 @@ class UserMgmtWindow:
     def refresh(self):
         for row in self.tree.get_children():
             self.tree.delete(row)
-        for u in sorted(self.manager.users.values(), key=lambda x: x.username):
+        for u in self.manager.list_users():
             self.tree.insert("", "end", iid=u.username, values=(u.role,))
 
     def add_user(self):
@@ -0,0 +1,45 @@
+"""Timeline of the kiosk's start-up phases.
+
+`src/main.py --startup-trace` prints one line per phase to stderr once the
+login screen is interactive, and with a FILE also writes the phases as
+JSON. Times are from the first line of `src/main.py`; the interpreter's
+own start-up comes before that and is not included.
+
+    python3 src/main.py --startup-trace --quit-after-start
+    python3 src/main.py --startup-trace boot.json --startup-budget 1500 --quit-after-start
+"""
+import sys
+import json
+import time
+from typing import List, Optional, Tuple
+
+
+class StartupTrace:
+    def __init__(self, t0: Optional[float] = None, enabled: bool = True):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.enabled = enabled
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """Record that `phase` just finished."""
+        if self.enabled:
+            self.phases.append((phase, (time.perf_counter() - self.t0) * 1000))
+
+    def elapsed(self, phase: str) -> Optional[float]:
+        for name, ms in self.phases:
+            if name == phase:
+                return ms
+        return None
+
+    def report(self, out=None) -> None:
+        out = out or sys.stderr
+        prev = 0.0
+        for name, ms in self.phases:
+            print(f"[startup] {ms:8.1f} ms  +{ms - prev:7.1f}  {name}", file=out)
+            prev = ms
+        out.flush()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "phases": [{"phase": n, "ms": round(ms, 2)} for n, ms in self.phases]}, f, indent=2)
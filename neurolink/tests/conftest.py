@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# the modules live flat in the project root, as src/main.py imports them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import users  # noqa: E402
+
+
+@pytest.fixture
+def fast_policy():
+    # the cheapest policy users.py accepts; tests are about behaviour, not cost
+    return users.KdfPolicy(users.DEFAULT_KDF, users.MIN_PBKDF2_ITER)
+
+
+@pytest.fixture
+def make_user():
+    def make(name, role="soldier", fill=b"\x01"):
+        return users.User(username=name, role=role, salt=fill * 16, pwd_hash=fill * 32)
+    return make
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import subprocess
+
+import pytest
+
+import users
+from conftest import ROOT
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="authd needs Unix domain sockets")
+
+if hasattr(socket, "AF_UNIX"):
+    import authd
+
+
+@pytest.fixture(scope="module")
+def daemon(tmp_path_factory):
+    d = tmp_path_factory.mktemp("authd")
+    store = str(d / "users.json")
+    sock = str(d / "authd.sock")
+    # the cheapest accepted policy, picked up by the daemon's manager
+    with open(users.policy_path_for(store), "w", encoding="utf-8") as f:
+        json.dump({"kdf": users.DEFAULT_KDF, "iterations": users.MIN_PBKDF2_ITER}, f)
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "authd.py"), "--store", store, "--socket", sock],
+                            env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while not os.path.exists(sock):
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            pytest.fail("authd did not start")
+        time.sleep(0.05)
+    yield {"store": store, "socket": sock}
+    proc.terminate()
+    proc.wait(30)
+
+
+@pytest.fixture
+def client(daemon):
+    c = authd.AuthClient(daemon["socket"], timeout=30.0)
+    yield c
+    c.close()
+
+
+def test_round_trip(client):
+    u = client.create_user("alice", "secret", users.ROLE_SOLDIER)
+    assert (u.username, u.role) == ("alice", users.ROLE_SOLDIER)
+    assert client.authenticate("alice", "secret").username == "alice"
+    assert client.authenticate("alice", "wrong") is None
+
+    client.set_password("alice", "better")
+    assert client.authenticate("alice", "better").username == "alice"
+    client.update_role("alice", users.ROLE_COMMANDER)
+    assert client.get_user("alice").role == users.ROLE_COMMANDER
+    assert "alice" in client.users
+    assert [x.username for x in client.list_users(users.ROLE_COMMANDER)] == ["alice"]
+
+    client.delete_user("alice")
+    assert client.get_user("alice") is None
+    assert "alice" not in client.users
+
+
+def test_default_admin_exists(client):
+    assert client.get_user("admin").role == users.ROLE_ADMIN
+
+
+def test_errors_cross_the_socket(client):
+    client.create_user("bob", "pw", users.ROLE_SOLDIER)
+    with pytest.raises(ValueError):
+        client.create_user("bob", "pw", users.ROLE_SOLDIER)
+    with pytest.raises(KeyError):
+        client.delete_user("nobody")
+    with pytest.raises(KeyError):
+        client.set_password("nobody", "pw")
+    client.delete_user("bob")
+
+
+def test_bulk_create(client):
+    report = client.create_users([{"username": f"s{i}", "password": "pw"} for i in range(5)]
+                                 + [{"username": "s0", "password": "pw"}], default_role=users.ROLE_SOLDIER)
+    assert sorted(report.created) == [f"s{i}" for i in range(5)]
+    assert len(report.errors) == 1
+    assert len(client.users) >= 6
+
+
+def test_writes_reach_the_store(client, daemon):
+    client.create_user("carol", "pw", users.ROLE_SOLDIER)
+    # the daemon flushes after every write batch, so a fresh reader sees it
+    mgr = users.UserManager(daemon["store"], journal=True)
+    try:
+        assert mgr.get_user("carol") is not None
+    finally:
+        mgr.close()
+
+
+def test_client_reconnects(client):
+    assert client.get_user("admin") is not None
+    client._disconnect()
+    assert client.get_user("admin") is not None
+
+
+def test_writes_need_admin_uid(tmp_path, fast_policy):
+    mgr = users.UserManager(str(tmp_path / "users.json"), policy=fast_policy)
+    d = authd.AuthDaemon(mgr, str(tmp_path / "authd.sock"), admin_uids={os.geteuid() + 1})
+    try:
+        with pytest.raises(PermissionError):
+            asyncio.run(d._dispatch("delete_user", {"username": "admin"}, uid=os.geteuid()))
+        with pytest.raises(PermissionError):
+            asyncio.run(d._dispatch("create_user", {"username": "x", "password": "pw", "role": "soldier"}))
+    finally:
+        d._hash_pool.shutdown()
+        d._write_pool.shutdown()
+        d._read_pool.shutdown()
+        mgr.close()
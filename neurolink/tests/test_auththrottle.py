@@ -0,0 +1,186 @@
+import pytest
+
+import auththrottle
+import users
+from auththrottle import AuthThrottle, AuthThrottled
+
+
+class FakeTime:
+    """Stands in for the `time` module inside auththrottle."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def thread_time(self):
+        return 0.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(auththrottle, "time", fake)
+    return fake
+
+
+def _throttle(**kw):
+    # buckets wide open unless a test is about them
+    opts = dict(user_rate=100.0, user_burst=100, global_rate=100.0, global_burst=100)
+    opts.update(kw)
+    return AuthThrottle(**opts)
+
+
+def _fail(t, n, user="alice", client=None):
+    for _ in range(n):
+        t.admit(user, client)
+        t.record(user, False, client)
+
+
+def test_backoff_starts_after_free_failures(clock):
+    t = _throttle(free_failures=3, backoff_base=1.0)
+    _fail(t, 2)
+    t.admit("alice")
+    t.record("alice", False)
+    with pytest.raises(AuthThrottled) as e:
+        t.admit("alice")
+    assert e.value.retry_after == pytest.approx(1.0)
+    assert e.value.reason == "too many failed attempts"
+
+
+def test_backoff_doubles_and_expires(clock):
+    t = _throttle(free_failures=1, backoff_base=1.0)
+    waits = []
+    for _ in range(4):
+        t.record("alice", False)
+        with pytest.raises(AuthThrottled) as e:
+            t.admit("alice")
+        waits.append(e.value.retry_after)
+    assert waits == pytest.approx([1.0, 2.0, 4.0, 8.0])
+    clock.now += 8.0
+    t.admit("alice")
+
+
+@pytest.mark.parametrize("client,cap", [(None, 30.0), ("uid:1000", 300.0)])
+def test_backoff_cap_depends_on_client(clock, client, cap):
+    t = _throttle(free_failures=1, backoff_base=1.0, backoff_max=300.0, backoff_max_local=30.0)
+    for _ in range(20):
+        t.record("admin", False, client)
+    with pytest.raises(AuthThrottled) as e:
+        t.admit("admin", client)
+    assert e.value.retry_after == pytest.approx(cap)
+
+
+def test_backoff_is_per_client(clock):
+    t = _throttle(free_failures=1)
+    _fail(t, 1, client="uid:1000")
+    with pytest.raises(AuthThrottled):
+        t.admit("alice", "uid:1000")
+    t.admit("alice", "uid:1001")
+    t.admit("alice")
+    t.admit("bob", "uid:1000")
+
+
+def test_success_resets_failures(clock):
+    t = _throttle(free_failures=2)
+    _fail(t, 1)
+    t.record("alice", True)
+    _fail(t, 1)
+    t.admit("alice")
+
+
+def test_user_bucket(clock):
+    t = _throttle(user_rate=0.5, user_burst=2)
+    t.admit("alice")
+    t.admit("alice")
+    with pytest.raises(AuthThrottled) as e:
+        t.admit("alice")
+    assert e.value.reason == "too many attempts for this user"
+    assert e.value.retry_after == pytest.approx(2.0)
+    t.admit("bob")
+    clock.now += 2.0
+    t.admit("alice")
+
+
+def test_global_bucket(clock):
+    t = _throttle(global_rate=1.0, global_burst=3)
+    for name in ("a", "b", "c"):
+        t.admit(name)
+    with pytest.raises(AuthThrottled) as e:
+        t.admit("d")
+    assert e.value.reason == "too many login attempts"
+    assert t.stats()["throttled"] == 1
+
+
+def test_hashing_busy_raises(clock):
+    t = _throttle(max_inflight=1)
+    with t.hashing():
+        clock.now += 0.25
+        with pytest.raises(AuthThrottled) as e:
+            with t.hashing():
+                pass
+        assert e.value.reason == "verification busy"
+    with t.hashing():
+        pass
+    stats = t.stats()
+    assert stats["busy"] == 1 and stats["hash_count"] == 2
+
+
+def test_hash_delay_tracks_measurements(clock):
+    t = _throttle()
+    with t.hashing():
+        clock.now += 0.5
+    # the first measurement replaces the initial guess
+    assert t.hash_delay() == pytest.approx(0.5)
+    with t.hashing():
+        clock.now += 1.5
+    assert t.hash_delay() == pytest.approx(0.5 + 0.2 * 1.0)
+
+
+def test_tracked_keys_are_bounded(clock):
+    t = _throttle(free_failures=1, max_tracked=4)
+    _fail(t, 1, user="victim")
+    for i in range(4):
+        t.admit(f"u{i}")
+    # the oldest key fell out, taking its backoff with it
+    t.admit("victim")
+    assert len(t._users) == 4
+
+
+# -- through UserManager ---------------------------------------------------
+
+@pytest.fixture
+def manager(tmp_path, fast_policy):
+    throttle = _throttle(free_failures=2, backoff_base=60.0)
+    mgr = users.UserManager(str(tmp_path / "users.json"), policy=fast_policy, throttle=throttle)
+    mgr.create_user("alice", "secret", users.ROLE_SOLDIER)
+    return mgr
+
+
+def test_manager_raises_after_failures(manager):
+    assert manager.authenticate("alice", "wrong") is None
+    assert manager.authenticate("alice", "wrong") is None
+    with pytest.raises(AuthThrottled):
+        manager.authenticate("alice", "secret")
+    # another client is not locked out
+    assert manager.authenticate("alice", "secret", client="uid:1000").username == "alice"
+
+
+def test_manager_unknown_user_skips_hashing(manager):
+    before = manager.throttle.stats()
+    assert manager.authenticate("mallory", "x") is None
+    after = manager.throttle.stats()
+    assert after["hash_count"] == before["hash_count"]
+    assert after["unknown_user"] == before["unknown_user"] + 1
+    assert manager.authenticate("mallory", "x") is None
+    with pytest.raises(AuthThrottled):
+        manager.authenticate("mallory", "x")
+
+
+def test_manager_success_counts_hash(manager):
+    assert manager.authenticate("alice", "secret").username == "alice"
+    stats = manager.throttle.stats()
+    assert stats["successes"] == 1 and stats["hash_count"] == 1
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+import georef
+from georef import Georeference
+
+
+def _affine(px, py):
+    return 121.4 + 3.5e-5 * px + 2.0e-7 * py, 31.3 - 1.0e-7 * px - 4.0e-5 * py
+
+
+def _projective(px, py):
+    w = 1.0 + 2e-5 * px - 1e-5 * py
+    return (121.4 + 3.5e-5 * px + 2e-6 * py) / w, (31.3 - 1e-6 * px - 4e-5 * py) / w
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "pure"])
+def numpy_or_not(request, monkeypatch):
+    if request.param and not georef.NUMPY_AVAILABLE:
+        pytest.skip("NumPy not installed")
+    monkeypatch.setattr(georef, "NUMPY_AVAILABLE", request.param)
+
+
+def _points(f, pixels):
+    return [(px, py, *f(px, py)) for px, py in pixels]
+
+
+def test_affine_exact_fit(numpy_or_not):
+    pts = _points(_affine, [(0, 0), (4000, 0), (0, 3000), (4000, 3000), (1234, 567)])
+    g = Georeference.fit(pts)
+    assert g.residual() == pytest.approx(0.0, abs=1e-5)
+    for px, py, lon, lat in pts:
+        assert g.lonlat(px, py) == pytest.approx((lon, lat), abs=1e-9)
+        assert g.pixel(lon, lat) == pytest.approx((px, py), abs=1e-4)
+
+
+def test_affine_needs_only_three(numpy_or_not):
+    g = Georeference.fit(_points(_affine, [(0, 0), (4000, 0), (0, 3000)]))
+    assert g.residual() == pytest.approx(0.0, abs=1e-5)
+    assert g.lonlat(2000, 1500) == pytest.approx(_affine(2000, 1500), abs=1e-9)
+
+
+def test_projective_exact_fit(numpy_or_not):
+    pixels = [(0, 0), (4000, 0), (0, 3000), (4000, 3000), (2000, 1000), (500, 2500)]
+    g = Georeference.fit(_points(_projective, pixels), "projective")
+    assert g.residual() == pytest.approx(0.0, abs=1e-3)
+    assert g.lonlat(3000, 700) == pytest.approx(_projective(3000, 700), abs=1e-8)
+
+
+def test_affine_cannot_fit_a_projective_map(numpy_or_not):
+    pixels = [(0, 0), (4000, 0), (0, 3000), (4000, 3000), (2000, 1500)]
+    pts = _points(_projective, pixels)
+    assert Georeference.fit(pts, "affine").residual() > 1.0
+    assert Georeference.fit(pts, "projective").residual() < 1e-3
+
+
+def test_noisy_points_residual(numpy_or_not):
+    rng = random.Random(1)
+    pixels = [(rng.uniform(0, 4000), rng.uniform(0, 3000)) for _ in range(30)]
+    # about 2 px of noise in each axis
+    pts = [(px + rng.gauss(0, 2), py + rng.gauss(0, 2), *_affine(px, py)) for px, py in pixels]
+    r = Georeference.fit(pts).residual()
+    assert 1.0 < r < 4.0
+
+
+def test_from_bounds(numpy_or_not):
+    g = Georeference.from_bounds(4000, 3000, 121.40, 31.18, 121.55, 31.30)
+    assert g.lonlat(0, 0) == pytest.approx((121.40, 31.30))
+    assert g.lonlat(4000, 3000) == pytest.approx((121.55, 31.18))
+    assert g.pixel(121.475, 31.24) == pytest.approx((2000.0, 1500.0))
+    assert g.residual() == pytest.approx(0.0, abs=1e-6)
+
+
+@pytest.mark.parametrize("kind,pixels", [
+    ("affine", [(0, 0), (100, 100), (200, 200)]),
+    ("affine", [(0, 0), (0, 0), (10, 0)]),
+    ("projective", [(0, 0), (100, 0), (200, 0), (300, 0)]),
+])
+def test_degenerate_points(numpy_or_not, kind, pixels):
+    with pytest.raises(ValueError):
+        Georeference.fit(_points(_affine, pixels), kind)
+
+
+@pytest.mark.parametrize("kind,n", [("affine", 2), ("projective", 3)])
+def test_too_few_points(kind, n):
+    with pytest.raises(ValueError):
+        Georeference.fit(_points(_affine, [(0, 0), (100, 0), (0, 100)][:n]), kind)
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        Georeference.fit(_points(_affine, [(0, 0), (100, 0), (0, 100)]), "polynomial")
+
+
+def test_save_and_load(tmp_path):
+    map_path = str(tmp_path / "map.png")
+    g = Georeference.fit(_points(_affine, [(0, 0), (4000, 0), (0, 3000)]))
+    georef.save_georef(map_path, g)
+    back = georef.load_georef(map_path)
+    assert back.kind == "affine" and back.points == g.points
+    assert back.lonlat(100, 200) == pytest.approx(g.lonlat(100, 200))
+    assert georef.load_georef(str(tmp_path / "other.png")) is None
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from mapmarkers import GridIndex
+
+
+def _inside(points, x0, y0, x1, y1):
+    return {m for m, (x, y) in points.items() if x0 <= x <= x1 and y0 <= y <= y1}
+
+
+def test_points_on_cell_edges():
+    g = GridIndex(cell=100.0)
+    g.insert("origin", 0.0, 0.0)
+    g.insert("edge", 100.0, 100.0)
+    g.insert("below", 99.999, 99.999)
+    g.insert("neg", -0.001, -0.001)
+    g.insert("negedge", -100.0, 0.0)
+    # a point on a cell's lower edge belongs to that cell
+    assert g._key(100.0, 100.0) == (1, 1)
+    assert g._key(99.999, 99.999) == (0, 0)
+    assert g._key(-0.001, -0.001) == (-1, -1)
+    assert g._key(-100.0, 0.0) == (-1, 0)
+    assert g.query(0, 0, 99.5, 99.5) == {"origin", "below"}
+    assert g.query(100, 100, 100, 100) == {"edge"}
+    # a box ending exactly on an edge reaches into the next cell
+    assert g.query(50, 50, 100, 100) == {"origin", "below", "edge"}
+    assert g.query(-50, -50, -1, -1) == {"neg"}
+    assert g.query(-100, 0, -100, 0) == {"negedge"}
+
+
+def test_move_and_remove():
+    g = GridIndex(cell=100.0)
+    g.insert("a", 10, 10)
+    g.insert("a", 20, 20)  # same cell
+    g.insert("a", 250, 10)
+    assert g.query(0, 0, 99, 99) == set()
+    assert g.query(200, 0, 299, 99) == {"a"}
+    g.remove("a")
+    g.remove("a")
+    assert g.query(-1e6, -1e6, 1e6, 1e6) == set()
+    assert g._cells == {} and g._where == {}
+
+
+@pytest.mark.parametrize("span", [50.0, 5000.0, 1e7])
+def test_query_is_superset_of_box(span):
+    # small boxes walk cells; huge ones walk the occupied cells instead
+    rng = random.Random(int(span))
+    g = GridIndex(cell=64.0)
+    points = {}
+    for i in range(500):
+        x, y = rng.uniform(-2000, 2000), rng.uniform(-2000, 2000)
+        if i % 10 == 0:
+            x, y = round(x / 64) * 64.0, round(y / 64) * 64.0
+        points[i] = (x, y)
+        g.insert(i, x, y)
+    for _ in range(100):
+        x0, y0 = rng.uniform(-2100, 2000), rng.uniform(-2100, 2000)
+        if rng.random() < 0.5:
+            x0, y0 = round(x0 / 64) * 64.0, round(y0 / 64) * 64.0
+        box = (x0, y0, x0 + span, y0 + span)
+        got = g.query(*box)
+        assert _inside(points, *box) <= got
+        # nothing further than a cell from the box
+        for m in got:
+            x, y = points[m]
+            assert box[0] - 64 <= x <= box[2] + 64 and box[1] - 64 <= y <= box[3] + 64
@@ -0,0 +1,66 @@
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+import mappyramid  # noqa: E402
+
+
+def _reference(img, mode, tile_size, min_side):
+    # the whole image decoded at once, halved level by level
+    out = {}
+    level_img = img.convert(mode)
+    sizes = mappyramid.level_sizes(img.size, min_side)
+    for level, size in enumerate(sizes):
+        assert level_img.size == size
+        for col, row, tile in mappyramid.iter_tiles(level_img, tile_size):
+            out[level, col, row] = tile
+        level_img = mappyramid._halve(level_img)
+    return sizes, out
+
+
+def _source(tmp_path, mode, size, fmt="PNG", **save):
+    # a gradient with noise so every tile and filter type differs
+    band = Image.blend(Image.effect_noise(size, 64).convert("L"), Image.linear_gradient("L").resize(size), 0.5)
+    if mode == "P":
+        src = Image.merge("RGB", [band] * 3).quantize(32)
+    else:
+        n = len(Image.new(mode, (1, 1)).getbands())
+        src = Image.merge(mode, [band.transpose(Image.Transpose.FLIP_LEFT_RIGHT) if i % 2 else band for i in range(n)])
+    path = str(tmp_path / f"map.{fmt.lower()}")
+    src.save(path, format=fmt, **save)
+    return path
+
+
+@pytest.mark.parametrize("mode,size", [
+    ("L", (300, 200)),
+    ("RGB", (517, 389)),
+    ("RGBA", (1000, 257)),
+    ("P", (255, 513)),
+])
+def test_tiles_match_full_decode(tmp_path, mode, size):
+    path = _source(tmp_path, mode, size)
+    got = {}
+    sizes = mappyramid.build_tiles(path, "RGBA", 64, lambda lv, c, r, t: got.__setitem__((lv, c, r), t), min_side=32)
+    with Image.open(path) as img:
+        img.load()
+        want_sizes, want = _reference(img, "RGBA", 64, 32)
+    assert sizes == want_sizes
+    assert sorted(got) == sorted(want)
+    for key, tile in got.items():
+        assert tile.tobytes() == want[key].tobytes(), key
+
+
+def test_jpeg_source(tmp_path):
+    path = _source(tmp_path, "RGB", (333, 222), fmt="JPEG", quality=90)
+    got = {}
+    mappyramid.build_tiles(path, "RGB", 64, lambda lv, c, r, t: got.__setitem__((lv, c, r), t), min_side=32)
+    with Image.open(path) as img:
+        img.load()
+        _, want = _reference(img, "RGB", 64, 32)
+    assert {k: v.tobytes() for k, v in got.items()} == {k: v.tobytes() for k, v in want.items()}
+
+
+def test_level_sizes_round_up():
+    assert mappyramid.level_sizes((1001, 600), 200) == [(1001, 600), (501, 300), (251, 150), (126, 75)]
+    assert mappyramid.level_sizes((100, 100), 256) == [(100, 100)]
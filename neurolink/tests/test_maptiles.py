@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+from maptiles import TileCache  # noqa: E402
+
+
+def _tile(side=16):
+    return Image.new("RGBA", (side, side))  # 1 KiB at 16 px
+
+
+def test_lru_eviction_within_budget():
+    cache = TileCache(budget=3 * 1024)
+    for col in range(3):
+        cache.put((0, col, 0), _tile())
+    assert cache.bytes == 3 * 1024 and len(cache) == 3
+    cache.get((0, 0, 0))  # now the most recent
+    cache.put((0, 3, 0), _tile())
+    assert (0, 1, 0) not in cache
+    assert all(k in cache for k in ((0, 0, 0), (0, 2, 0), (0, 3, 0)))
+    assert cache.bytes == 3 * 1024
+
+
+def test_replacing_a_tile_keeps_the_count():
+    cache = TileCache(budget=10 * 1024)
+    cache.put((1, 0, 0), _tile())
+    cache.put((1, 0, 0), _tile(32))
+    assert len(cache) == 1 and cache.bytes == 4 * 1024
+
+
+def test_oversized_tile_is_kept_alone():
+    cache = TileCache(budget=1024)
+    cache.put((0, 0, 0), _tile())
+    cache.put((0, 1, 0), _tile(64))
+    assert len(cache) == 1 and (0, 1, 0) in cache and cache.get((0, 0, 0)) is None
+    cache.clear()
+    assert len(cache) == 0 and cache.bytes == 0
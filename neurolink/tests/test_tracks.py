@@ -0,0 +1,141 @@
+import random
+from collections import deque
+
+import pytest
+
+from tracks import TrackBuffer, simplify
+
+
+def _check(buf, ref):
+    # ref: deque of (seq, x, y, t), oldest first
+    assert len(buf) == len(ref)
+    if not ref:
+        assert buf.end == buf.seq0
+        return
+    assert buf.seq0 == ref[0][0] and buf.end == ref[-1][0] + 1
+    assert buf.last_time() == ref[-1][3]
+    seqs = [r[0] for r in ref]
+    for start in range(buf.seq0, buf.end + 1):
+        for stop in range(start, buf.end + 1):
+            xs, ys = buf.coords(start, stop)
+            want = [r for r in ref if start <= r[0] < stop]
+            assert xs == [r[1] for r in want] and ys == [r[2] for r in want], (start, stop)
+    for seq, x, y, _ in ref:
+        assert buf.point(seq) == (x, y)
+    assert seqs == list(range(buf.seq0, buf.end))
+
+
+def test_grows_then_wraps():
+    buf = TrackBuffer(capacity=8, initial=2)
+    ref = deque()
+    for i in range(30):
+        buf.append(float(i), float(-i), float(i))
+        ref.append((i, float(i), float(-i), float(i)))
+        while len(ref) > 8:
+            ref.popleft()
+        _check(buf, ref)
+    assert len(buf.xs) == 8
+
+
+def test_grow_after_wrap_keeps_order():
+    # drop points so the head moves, then grow with the ring wrapped
+    buf = TrackBuffer(capacity=16, initial=4)
+    ref = deque()
+    for i in range(4):
+        buf.append(i, i, i)
+        ref.append((i, float(i), float(i), float(i)))
+    assert buf.drop_before(2) == 2
+    ref.popleft()
+    ref.popleft()
+    for i in range(4, 12):
+        buf.append(i, i, i)
+        ref.append((i, float(i), float(i), float(i)))
+        _check(buf, ref)
+
+
+def test_drop_before_across_wrap():
+    buf = TrackBuffer(capacity=5, initial=5)
+    for i in range(13):
+        buf.append(i, 0, i)
+    assert (buf.seq0, buf.end) == (8, 13)
+    assert buf.drop_before(10.5) == 3
+    assert buf.seq0 == 11 and buf.coords(11, 13) == ([11.0, 12.0], [0.0, 0.0])
+    assert buf.drop_before(100) == 2
+    assert len(buf) == 0 and buf.last_time() is None and buf.end == 13
+    buf.append(1, 2, 200)
+    assert buf.point(13) == (1.0, 2.0)
+
+
+def test_random_against_reference():
+    rng = random.Random(7)
+    buf = TrackBuffer(capacity=12, initial=1)
+    ref = deque()
+    seq = t = 0
+    for _ in range(400):
+        if rng.random() < 0.8:
+            t += 1
+            x, y = float(rng.randint(-99, 99)), float(rng.randint(-99, 99))
+            buf.append(x, y, t)
+            ref.append((seq, x, y, float(t)))
+            seq += 1
+            if len(ref) > 12:
+                ref.popleft()
+        else:
+            cut = t - rng.randint(0, 8)
+            dropped = buf.drop_before(cut)
+            n = len(ref)
+            while ref and ref[0][3] < cut:
+                ref.popleft()
+            assert dropped == n - len(ref)
+        _check(buf, ref)
+
+
+# -- Douglas-Peucker -------------------------------------------------------
+
+@pytest.mark.parametrize("n", [0, 1, 2])
+def test_simplify_short(n):
+    assert simplify([0.0] * n, [0.0] * n, 1.0) == list(range(n))
+
+
+def test_simplify_keeps_endpoints_of_collinear_run():
+    xs = [float(i) for i in range(50)]
+    assert simplify(xs, [2.0 * x for x in xs], 0.01) == [0, 49]
+
+
+def test_simplify_keeps_endpoints_when_closed():
+    # first == last: distances fall back to the distance from the endpoint
+    xs = [0.0, 10.0, 10.0, 0.0, 0.0]
+    ys = [0.0, 0.0, 10.0, 10.0, 0.0]
+    keep = simplify(xs, ys, 1.0)
+    assert keep[0] == 0 and keep[-1] == 4
+    assert 2 in keep
+
+
+def test_simplify_all_identical_points():
+    assert simplify([3.0] * 6, [4.0] * 6, 0.5) == [0, 5]
+
+
+def test_simplify_tolerance():
+    xs = [0.0, 1.0, 2.0, 3.0, 4.0]
+    ys = [0.0, 0.4, 0.0, -2.0, 0.0]
+    assert simplify(xs, ys, 0.5) == [0, 2, 3, 4]
+    assert simplify(xs, ys, 0.3) == [0, 1, 2, 3, 4]
+    assert simplify(xs, ys, 5.0) == [0, 4]
+
+
+def test_simplify_within_tolerance_of_original():
+    rng = random.Random(3)
+    xs, ys = [0.0], [0.0]
+    for _ in range(300):
+        xs.append(xs[-1] + rng.uniform(0.5, 2))
+        ys.append(ys[-1] + rng.uniform(-1, 1))
+    tol = 1.5
+    keep = simplify(xs, ys, tol)
+    assert keep[0] == 0 and keep[-1] == len(xs) - 1 and keep == sorted(set(keep))
+    # every dropped point is within tolerance of the kept segment around it
+    for a, b in zip(keep, keep[1:]):
+        dx, dy = xs[b] - xs[a], ys[b] - ys[a]
+        seg = (dx * dx + dy * dy) ** 0.5
+        for i in range(a + 1, b):
+            d = abs((xs[i] - xs[a]) * dy - (ys[i] - ys[a]) * dx) / seg
+            assert d <= tol + 1e-9
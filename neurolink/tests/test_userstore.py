@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+import pytest
+
+from conftest import ROOT
+from users import User
+from userstore import FileLock, JsonStore, JournaledJsonStore, SQLiteStore, StoreCorrupt, open_store
+
+
+def _run(code, *args, **kw):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.Popen([sys.executable, "-c", code, *args], env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, **kw)
+
+
+# -- journal ---------------------------------------------------------------
+
+def test_journal_replays_after_reopen(tmp_path, make_user):
+    path = str(tmp_path / "users.json")
+    s = JournaledJsonStore(path, User.from_dict, compact_bytes=1 << 30)
+    s.load()
+    s.put(make_user("alice"))
+    s.put_many([make_user("bob"), make_user("carol", fill=b"\x02")])
+    s.put(make_user("bob", role="commander"))
+    s.delete("alice")
+    s.close()
+    assert os.path.exists(s.journal_path)
+
+    r = JournaledJsonStore(path, User.from_dict)
+    r.load()
+    assert sorted(r.usernames()) == ["bob", "carol"]
+    assert r.get("bob").role == "commander"
+    assert r.get("carol") == make_user("carol", fill=b"\x02")
+    r.close()
+
+
+def test_compaction_folds_journal_into_snapshot(tmp_path, make_user):
+    path = str(tmp_path / "users.json")
+    s = JournaledJsonStore(path, User.from_dict, compact_bytes=1 << 30)
+    s.load()
+    for i in range(20):
+        s.put(make_user(f"u{i:02d}"))
+    s.delete("u00")
+    s.compact(wait=True)
+    assert not os.path.exists(s.journal_path)
+    assert not os.path.exists(s.compacting_path)
+    with open(path, encoding="utf-8") as f:
+        names = sorted(d["username"] for d in json.load(f)["users"])
+    assert names == [f"u{i:02d}" for i in range(1, 20)]
+
+    # writes after the compaction start a new journal on top of the snapshot
+    s.put(make_user("late"))
+    s.close()
+    r = JsonStore(path, User.from_dict)
+    r.load()
+    assert r.count() == 20 and r.get("late") is not None
+    r.close()
+
+
+def test_leftover_compacting_journal_is_replayed(tmp_path, make_user):
+    path = str(tmp_path / "users.json")
+    s = JournaledJsonStore(path, User.from_dict, compact_bytes=1 << 30)
+    s.load()
+    s.put(make_user("alice"))
+    s.close()
+    # a crash between rotating the journal and writing the snapshot
+    os.replace(s.journal_path, s.compacting_path)
+
+    r = JournaledJsonStore(path, User.from_dict)
+    r.load()
+    assert r.get("alice") is not None
+    assert not os.path.exists(r.compacting_path)
+    r.close()
+
+
+def test_torn_journal_tail_is_ignored(tmp_path, make_user):
+    path = str(tmp_path / "users.json")
+    s = JournaledJsonStore(path, User.from_dict, compact_bytes=1 << 30)
+    s.load()
+    s.put(make_user("alice"))
+    s.close()
+    with open(s.journal_path, "ab") as f:
+        f.write(b'{"op": "put", "user": {"username": "bo')
+
+    r = JournaledJsonStore(path, User.from_dict)
+    r.load()
+    assert list(r.usernames()) == ["alice"]
+    r.close()
+
+
+def test_unreadable_snapshot_raises_store_corrupt(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text("{not json", encoding="utf-8")
+    s = JsonStore(str(path), User.from_dict)
+    with pytest.raises(StoreCorrupt):
+        s.load()
+    # nothing was written over the damaged file
+    assert path.read_text(encoding="utf-8") == "{not json"
+
+
+# -- backend parity --------------------------------------------------------
+
+BACKENDS = {
+    "json": lambda d: JsonStore(os.path.join(d, "users.json"), User.from_dict),
+    "journal": lambda d: JournaledJsonStore(os.path.join(d, "users.json"), User.from_dict),
+    "sqlite": lambda d: SQLiteStore(os.path.join(d, "users.db"), User.from_dict),
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def store(request, tmp_path):
+    s = BACKENDS[request.param](str(tmp_path))
+    s.load()
+    yield s
+    s.close()
+
+
+def test_store_parity(store, make_user):
+    assert store.count() == 0 and store.get("nobody") is None
+    store.put(make_user("carol", role="commander"))
+    store.put_many([make_user("alice"), make_user("bob", role="system_admin")])
+    assert store.count() == 3
+    assert sorted(store.usernames()) == ["alice", "bob", "carol"]
+    assert [r.username for r in store.records()] == ["alice", "bob", "carol"]
+    assert [r.username for r in store.records("commander")] == ["carol"]
+    assert store.get("alice") == make_user("alice")
+
+    store.put(make_user("alice", role="commander", fill=b"\x03"))
+    assert store.get("alice") == make_user("alice", role="commander", fill=b"\x03")
+    assert [r.username for r in store.records("commander")] == ["alice", "carol"]
+
+    store.delete("bob")
+    assert store.get("bob") is None and store.count() == 2
+
+
+def test_insert_many_skips_taken(store, make_user):
+    store.put(make_user("alice", fill=b"\x07"))
+    taken = store.insert_many([make_user("alice"), make_user("dave"), make_user("erin")])
+    assert taken == ["alice"]
+    # the existing record is never overwritten
+    assert store.get("alice") == make_user("alice", fill=b"\x07")
+    assert sorted(store.usernames()) == ["alice", "dave", "erin"]
+
+
+def test_backends_agree_after_reopen(tmp_path, make_user):
+    ops = [make_user(f"user{i:03d}", role=("soldier", "commander")[i % 2]) for i in range(50)]
+    seen = {}
+    for name, make in BACKENDS.items():
+        d = tmp_path / name
+        d.mkdir()
+        s = make(str(d))
+        s.load()
+        s.put_many(ops[:25])
+        for rec in ops[25:]:
+            s.put(rec)
+        for i in range(0, 50, 7):
+            s.delete(ops[i].username)
+        s.close()
+        s = make(str(d))
+        s.load()
+        seen[name] = [r.to_dict() for r in s.records()]
+        s.close()
+    assert seen["json"] == seen["journal"] == seen["sqlite"]
+    assert len(seen["json"]) == 50 - len(range(0, 50, 7))
+
+
+def test_open_store_picks_backend(tmp_path):
+    assert isinstance(open_store(str(tmp_path / "u.db"), User.from_dict), SQLiteStore)
+    assert isinstance(open_store(str(tmp_path / "u.json"), User.from_dict, journal=True), JournaledJsonStore)
+    assert type(open_store(str(tmp_path / "u.json"), User.from_dict)) is JsonStore
+
+
+# -- processes -------------------------------------------------------------
+
+HOLD_LOCK = """
+import sys
+from userstore import FileLock
+with FileLock(sys.argv[1]):
+    print("held", flush=True)
+    sys.stdin.readline()
+"""
+
+
+def test_file_lock_waits_for_other_process(tmp_path):
+    path = str(tmp_path / "users.json.lock")
+    holder = _run(HOLD_LOCK, path)
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        got = threading.Event()
+
+        def take():
+            with FileLock(path):
+                got.set()
+
+        t = threading.Thread(target=take, daemon=True)
+        t.start()
+        assert not got.wait(0.5)
+        holder.stdin.write("\n")
+        holder.stdin.flush()
+        assert got.wait(10)
+        t.join(10)
+    finally:
+        holder.stdin.close()
+        holder.wait(10)
+
+
+def test_file_lock_is_reentrant(tmp_path):
+    lock = FileLock(str(tmp_path / "x.lock"))
+    with lock:
+        with lock:
+            pass
+        assert lock._fd is not None
+    assert lock._fd is None
+
+
+WRITER = """
+import sys
+from users import User
+from userstore import open_store
+s = open_store(sys.argv[1], User.from_dict, journal=sys.argv[2] == "1")
+s.load()
+for i in range(int(sys.argv[4])):
+    with s.lock():
+        s.refresh()
+        s.put(User(f"{sys.argv[3]}{i:03d}", "soldier", b"\\1" * 16, b"\\1" * 32))
+s.close()
+"""
+
+
+@pytest.mark.parametrize("name,journal", [("users.json", False), ("users.json", True), ("users.db", False)])
+def test_concurrent_writers_keep_every_record(tmp_path, name, journal):
+    path = str(tmp_path / name)
+    procs = [_run(WRITER, path, "1" if journal else "0", prefix, "40") for prefix in ("a", "b", "c")]
+    for p in procs:
+        p.stdin.close()
+        assert p.wait(60) == 0
+    s = open_store(path, User.from_dict, journal=journal)
+    s.load()
+    assert s.count() == 120
+    s.close()
+
+
+def test_refresh_sees_other_process(tmp_path, make_user):
+    path = str(tmp_path / "users.json")
+    s = JsonStore(path, User.from_dict, check_interval=0.0)
+    s.load()
+    s.put(make_user("alice"))
+    p = _run(WRITER, path, "0", "x", "3")
+    p.stdin.close()
+    assert p.wait(60) == 0
+    deadline = time.monotonic() + 5
+    while not s.changed() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert s.refresh() == {"x000", "x001", "x002"}
+    assert s.count() == 4
+    s.close()
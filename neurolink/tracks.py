@@ -0,0 +1,352 @@
+import os
+from array import array
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+TRACK_RETENTION_ENV = "NEUROLINK_TRACK_RETENTION"
+# seconds of history kept per unit
+DEFAULT_RETENTION = 3600.0
+TRACK_TAG = "_track"
+# new points drawn as-is before they are simplified into the cached trail
+TAIL_CHUNK = 32
+COLORS = ("#3a7bd5", "#2ca02c", "#9467bd", "#ff7f0e", "#17becf", "#bcbd22", "#8c564b", "#e377c2")
+SELF_COLOR = "red"
+
+
+def default_retention() -> float:
+    try:
+        return float(os.environ.get(TRACK_RETENTION_ENV, DEFAULT_RETENTION))
+    except ValueError:
+        return DEFAULT_RETENTION
+
+
+def simplify(xs, ys, tolerance: float) -> List[int]:
+    """Douglas-Peucker: indices of the points to keep, always the first and last."""
+    n = len(xs)
+    if n <= 2:
+        return list(range(n))
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    tol2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = xs[a], ys[a]
+        dx, dy = xs[b] - ax, ys[b] - ay
+        seg2 = dx * dx + dy * dy
+        best, best_d = -1, tol2
+        for i in range(a + 1, b):
+            px, py = xs[i] - ax, ys[i] - ay
+            if seg2:
+                # squared distance to the line through a and b
+                cross = px * dy - py * dx
+                d = cross * cross / seg2
+            else:
+                d = px * px + py * py
+            if d > best_d:
+                best, best_d = i, d
+        if best >= 0:
+            keep[best] = 1
+            if best - a > 1:
+                stack.append((a, best))
+            if b - best > 1:
+                stack.append((best, b))
+    return [i for i in range(n) if keep[i]]
+
+
+def _to_screen(pts: List[float], zoom: float, ox: float, oy: float) -> List[float]:
+    # map -> screen for interleaved x, y
+    if NUMPY_AVAILABLE and len(pts) > 64:
+        a = np.asarray(pts, dtype=float).reshape(-1, 2)
+        return (a * zoom + (ox, oy)).ravel().tolist()
+    return [p * zoom + (ox if i % 2 == 0 else oy) for i, p in enumerate(pts)]
+
+
+class TrackBuffer:
+    """One unit's positions in a ring of typed arrays (float32 x/y, float64 t).
+
+    Points are addressed by a sequence number that keeps counting as the
+    ring wraps, so cached simplifications stay valid while old points drop
+    off the front. The arrays start small and double up to `capacity`.
+    """
+
+    __slots__ = ("capacity", "xs", "ys", "ts", "head", "n", "seq0")
+
+    def __init__(self, capacity: int, initial: int = 64):
+        self.capacity = capacity
+        size = min(capacity, initial)
+        self.xs = array("f", bytes(4 * size))
+        self.ys = array("f", bytes(4 * size))
+        self.ts = array("d", bytes(8 * size))
+        self.head = 0
+        self.n = 0
+        # sequence number of the oldest point
+        self.seq0 = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def end(self) -> int:
+        """Sequence number after the newest point."""
+        return self.seq0 + self.n
+
+    def _grow(self) -> None:
+        size = len(self.xs)
+        new = min(self.capacity, size * 2)
+        for name, code, width in (("xs", "f", 4), ("ys", "f", 4), ("ts", "d", 8)):
+            old = getattr(self, name)
+            arr = old[self.head:] + old[:self.head]
+            arr.extend(array(code, bytes(width * (new - size))))
+            setattr(self, name, arr)
+        self.head = 0
+
+    def append(self, x: float, y: float, t: float) -> None:
+        size = len(self.xs)
+        if self.n == size and size < self.capacity:
+            self._grow()
+            size = len(self.xs)
+        if self.n == size:
+            # full: overwrite the oldest
+            i = self.head
+            self.head = (self.head + 1) % size
+            self.seq0 += 1
+        else:
+            i = (self.head + self.n) % size
+            self.n += 1
+        self.xs[i] = x
+        self.ys[i] = y
+        self.ts[i] = t
+
+    def drop_before(self, t: float) -> int:
+        """Forget points older than `t`; returns how many went."""
+        size = len(self.xs)
+        dropped = 0
+        while self.n and self.ts[self.head] < t:
+            self.head = (self.head + 1) % size
+            self.n -= 1
+            self.seq0 += 1
+            dropped += 1
+        return dropped
+
+    def last_time(self) -> Optional[float]:
+        if not self.n:
+            return None
+        return self.ts[(self.head + self.n - 1) % len(self.xs)]
+
+    def coords(self, start: int, stop: int) -> Tuple[List[float], List[float]]:
+        """x and y lists for sequence numbers [start, stop)."""
+        size = len(self.xs)
+        a = self.head + (start - self.seq0)
+        b = self.head + (stop - self.seq0)
+        if b <= size:
+            return self.xs[a:b].tolist(), self.ys[a:b].tolist()
+        if a >= size:
+            return self.xs[a - size:b - size].tolist(), self.ys[a - size:b - size].tolist()
+        return (self.xs[a:].tolist() + self.xs[:b - size].tolist(),
+                self.ys[a:].tolist() + self.ys[:b - size].tolist())
+
+    def point(self, seq: int) -> Tuple[float, float]:
+        i = (self.head + seq - self.seq0) % len(self.xs)
+        return self.xs[i], self.ys[i]
+
+
+class Track:
+    """A `TrackBuffer` plus its trail simplified for one tolerance."""
+
+    __slots__ = ("buf", "tolerance", "kept")
+
+    def __init__(self, capacity: int):
+        self.buf = TrackBuffer(capacity)
+        self.tolerance = None
+        # sequence numbers of the simplified points, oldest first
+        self.kept = array("q")
+
+    def trail(self, tolerance: float) -> List[float]:
+        """Flat [x0, y0, x1, y1, ...] map coordinates of the simplified trail.
+
+        The simplification is cached for `tolerance` and extended
+        incrementally: up to TAIL_CHUNK new points are returned raw, then
+        simplified and appended to the cache in one go.
+        """
+        buf = self.buf
+        if not buf.n:
+            return []
+        if tolerance != self.tolerance:
+            self.tolerance = tolerance
+            self.kept = array("q")
+        kept = self.kept
+        if kept and kept[0] < buf.seq0:
+            # the ring dropped points: cut the cache and restart at the oldest point
+            i = 0
+            while i < len(kept) and kept[i] < buf.seq0:
+                i += 1
+            del kept[:i]
+            if not kept or kept[0] != buf.seq0:
+                kept.insert(0, buf.seq0)
+        if not kept:
+            kept.append(buf.seq0)
+        last = kept[-1]
+        if buf.end - last > TAIL_CHUNK:
+            xs, ys = buf.coords(last, buf.end)
+            kept.extend(last + i for i in simplify(xs, ys, tolerance)[1:])
+            last = kept[-1]
+        out: List[float] = []
+        for seq in kept:
+            out.extend(buf.point(seq))
+        if buf.end - last > 1:
+            xs, ys = buf.coords(last + 1, buf.end)
+            for x, y in zip(xs, ys):
+                out.append(x)
+                out.append(y)
+        return out
+
+
+class TrackStore:
+    """Position history per unit, limited to a retention window.
+
+    Each unit gets a `Track`; points older than `retention` seconds
+    (measured against the newest timestamp in the store) are dropped, and a
+    unit holds at most `max_points` points (default: two per second of
+    retention) however fast it reports.
+    """
+
+    def __init__(self, retention: Optional[float] = None, max_points: Optional[int] = None):
+        self.retention = default_retention() if retention is None else retention
+        self.max_points = max_points or max(64, int(self.retention * 2))
+        self.tracks: Dict[Hashable, Track] = {}
+        self.latest = float("-inf")
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def __contains__(self, tid: Hashable) -> bool:
+        return tid in self.tracks
+
+    def get(self, tid: Hashable) -> Optional[Track]:
+        return self.tracks.get(tid)
+
+    def append(self, tid: Hashable, x: float, y: float, t: float) -> None:
+        track = self.tracks.get(tid)
+        if track is None:
+            track = self.tracks[tid] = Track(self.max_points)
+        last = track.buf.last_time()
+        if last is not None and t < last:
+            return
+        track.buf.append(x, y, t)
+        if t > self.latest:
+            self.latest = t
+        track.buf.drop_before(t - self.retention)
+
+    def expire(self) -> List[Hashable]:
+        """Apply the retention window to every track; returns ids that became empty and were removed."""
+        cutoff = self.latest - self.retention
+        gone = []
+        for tid, track in self.tracks.items():
+            track.buf.drop_before(cutoff)
+            if not track.buf.n:
+                gone.append(tid)
+        for tid in gone:
+            del self.tracks[tid]
+        return gone
+
+    def remove(self, tid: Hashable) -> None:
+        self.tracks.pop(tid, None)
+
+    def clear(self) -> None:
+        self.tracks.clear()
+        self.latest = float("-inf")
+
+    def memory_bytes(self) -> int:
+        return sum(t.buf.xs.itemsize * len(t.buf.xs) * 2 + t.buf.ts.itemsize * len(t.buf.ts) + t.kept.itemsize * len(t.kept)
+                   for t in self.tracks.values())
+
+
+class TrackLayer:
+    """Draw a `TrackStore` on a canvas: one line item per unit.
+
+    Trails are simplified to `tolerance` screen pixels for the current
+    zoom (see `Track.trail`), so the cache holds until the zoom changes. A
+    pure pan moves all lines with one `canvas.move`, as `MarkerLayer` does.
+    Lines sit below the marker layer.
+    """
+
+    def __init__(self, canvas, store: TrackStore, tolerance: float = 1.0, width: float = 2.0,
+                 below: Optional[str] = None):
+        self.canvas = canvas
+        self.store = store
+        self.tolerance = tolerance
+        self.width = width
+        self.below = below
+        self.view = None
+        self.visible = True
+        self._items: Dict[Hashable, int] = {}
+        self._colors: Dict[Hashable, str] = {}
+
+    def color(self, tid: Hashable) -> str:
+        c = self._colors.get(tid)
+        if c is None:
+            c = SELF_COLOR if tid == "self" else COLORS[len(self._colors) % len(COLORS)]
+            self._colors[tid] = c
+        return c
+
+    def set_visible(self, visible: bool) -> None:
+        if bool(visible) == self.visible:
+            return
+        self.visible = bool(visible)
+        if not self.visible:
+            self.canvas.itemconfig(TRACK_TAG, state="hidden")
+        else:
+            # lines were not kept up to date while hidden
+            self.refresh(list(self.store.tracks))
+
+    def set_view(self, view) -> None:
+        old, self.view = self.view, view
+        if not self.visible:
+            return
+        if old is not None and (old.zoom, old.width, old.height) == (view.zoom, view.width, view.height):
+            dx = (old.cx - view.cx) * view.zoom
+            dy = (old.cy - view.cy) * view.zoom
+            if dx or dy:
+                self.canvas.move(TRACK_TAG, dx, dy)
+            return
+        self.refresh(list(self.store.tracks))
+
+    def refresh(self, ids: Iterable[Hashable]) -> None:
+        """Redraw the trails of `ids` (after they got new points)."""
+        v = self.view
+        if v is None or not self.visible:
+            return
+        tol = self.tolerance / v.zoom
+        z, ox, oy = v.zoom, v.width / 2 - v.cx * v.zoom, v.height / 2 - v.cy * v.zoom
+        for tid in ids:
+            track = self.store.get(tid)
+            item = self._items.get(tid)
+            pts = track.trail(tol) if track is not None else []
+            if len(pts) < 4:
+                if item is not None:
+                    self.canvas.itemconfig(item, state="hidden")
+                continue
+            coords = _to_screen(pts, z, ox, oy)
+            if item is None:
+                item = self._items[tid] = self.canvas.create_line(
+                    *coords, fill=self.color(tid), width=self.width, tags=(TRACK_TAG,))
+                if self.below and self.canvas.find_withtag(self.below):
+                    self.canvas.tag_lower(item, self.below)
+            else:
+                self.canvas.coords(item, *coords)
+                self.canvas.itemconfig(item, state="normal")
+
+    def forget(self, ids: Iterable[Hashable]) -> None:
+        for tid in ids:
+            item = self._items.pop(tid, None)
+            if item is not None:
+                self.canvas.delete(item)
+
+    def clear(self) -> None:
+        self.forget(list(self._items))
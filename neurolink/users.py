@@ -1,155 +1,642 @@
 import os
-import json
+import sys
+import atexit
 import hashlib
 import hmac
 import secrets
-from dataclasses import dataclass
-from typing import Optional, Dict, Any
+import argparse
+import csv
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from collections.abc import Mapping, ValuesView
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Iterable, Set
+
+from auththrottle import AuthThrottle
+from permissions import PermissionEngine
+from fsutil import atomic_write_json
+from userstore import UserStore, open_store
 
 # Roles
 ROLE_ADMIN = "system_admin"
 ROLE_COMMANDER = "commander"
 ROLE_SOLDIER = "soldier"
 
-# Define permissions sets (strings) — expand as needed
-PERMISSIONS = {
-    ROLE_ADMIN: {"manage_users", "view_reports", "send_commands", "view_status", "configure_system"},
-    ROLE_COMMANDER: {"view_reports", "send_commands", "view_status"},
+# Permissions each role grants itself (strings) — expand as needed.
+# Roles also inherit everything from ROLE_PARENTS, and the admin role
+# implicitly has every permission.
+ROLE_GRANTS = {
+    ROLE_ADMIN: {"manage_users", "configure_system"},
+    ROLE_COMMANDER: {"view_reports", "send_commands"},
     ROLE_SOLDIER: {"view_status"},
 }
+ROLE_PARENTS = {
+    ROLE_ADMIN: [ROLE_COMMANDER],
+    ROLE_COMMANDER: [ROLE_SOLDIER],
+}
+PERMISSION_ENGINE = PermissionEngine(ROLE_GRANTS, ROLE_PARENTS, superuser_roles=[ROLE_ADMIN])
+
+
+def effective_permissions(role: str) -> Set[str]:
+    """All permission names a role has, including inherited ones."""
+    return PERMISSION_ENGINE.permissions(PERMISSION_ENGINE.role_mask(role))
+
+
+# Everything each role may do, inherited permissions included
+PERMISSIONS = {role: effective_permissions(role) for role in ROLE_GRANTS}
+
 
 DEFAULT_STORE_FILENAME = "users.json"
+# override the store location; a .db/.sqlite path selects the SQLite backend
+STORE_ENV = "NEUROLINK_USER_STORE"
+# set to 1 to append mutations to a journal instead of rewriting the store
+JOURNAL_ENV = "NEUROLINK_USER_JOURNAL"
+# socket of a running authd.py; get_manager() then returns an AuthClient
+AUTHD_SOCKET_ENV = "NEUROLINK_AUTHD_SOCKET"
 
+# Default KDF cost; also assumed for records written before the cost was
+# stored per user.
 PBKDF2_ITER = 100_000
 HASH_NAME = "sha256"
+KDF_PREFIX = "pbkdf2_"
+DEFAULT_KDF = KDF_PREFIX + HASH_NAME
+MIN_PBKDF2_ITER = 10_000
+MAX_PBKDF2_ITER = 2_000_000
+# per-deployment KDF policy written by `users.py calibrate`, next to the store
+POLICY_FILENAME = "kdf_policy.json"
+
+USERNAME_MAX_LEN = 64
+# salt for the dummy hash run for unknown usernames
+_DUMMY_SALT = secrets.token_bytes(16)
+
+
+@dataclass(frozen=True)
+class KdfPolicy:
+    kdf: str = DEFAULT_KDF
+    iterations: int = PBKDF2_ITER
+
+
+def pbkdf2(kdf: str, password: str, salt: bytes, iterations: int) -> bytes:
+    if not kdf.startswith(KDF_PREFIX):
+        raise ValueError(f"unsupported kdf {kdf!r}")
+    return hashlib.pbkdf2_hmac(kdf[len(KDF_PREFIX):], password.encode("utf-8"), salt, iterations)
+
+
+def calibrate_policy(target_ms: float = 250.0, kdf: str = DEFAULT_KDF) -> KdfPolicy:
+    """Measure PBKDF2 throughput on this host and pick an iteration count
+    whose verification takes about `target_ms`."""
+    probe = MIN_PBKDF2_ITER
+    while True:
+        t0 = time.perf_counter()
+        pbkdf2(kdf, "calibrate", b"\0" * 16, probe)
+        elapsed = time.perf_counter() - t0
+        # time at least 50 ms so timer resolution and warm-up don't dominate
+        if elapsed >= 0.05 or probe >= MAX_PBKDF2_ITER:
+            break
+        probe *= 2
+    iterations = int(probe * (target_ms / 1000.0) / max(elapsed, 1e-6))
+    iterations = max(MIN_PBKDF2_ITER, min(MAX_PBKDF2_ITER, iterations // 1000 * 1000))
+    return KdfPolicy(kdf=kdf, iterations=iterations)
+
+
+def policy_path_for(store_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(store_path)), POLICY_FILENAME)
+
+
+def load_policy(path: str) -> KdfPolicy:
+    """Read the deployment's KDF policy; the built-in default if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        return KdfPolicy(kdf=str(d["kdf"]), iterations=int(d["iterations"]))
+    except FileNotFoundError:
+        return KdfPolicy()
+    except Exception as e:
+        print(f"[users] ignoring unreadable KDF policy {path}: {e}")
+        return KdfPolicy()
+
+
+def save_policy(policy: KdfPolicy, path: str, target_ms: Optional[float] = None) -> None:
+    data = {"kdf": policy.kdf, "iterations": policy.iterations}
+    if target_ms is not None:
+        data["target_ms"] = target_ms
+    atomic_write_json(path, data)
 
 
-@dataclass
 class User:
-    username: str
-    role: str
-    salt: str
-    pwd_hash: str
+    """One account.
+
+    `salt` and `pwd_hash` are raw bytes in memory, decoded once when the
+    record is loaded; the store keeps them as hex. `__slots__` keeps the
+    per-account footprint small for large stores.
+    """
+
+    __slots__ = ("username", "role", "salt", "pwd_hash", "kdf", "iterations")
+
+    def __init__(self, username: str, role: str, salt: bytes, pwd_hash: bytes,
+                 kdf: str = DEFAULT_KDF, iterations: int = PBKDF2_ITER):
+        self.username = username
+        self.role = role
+        self.salt = salt
+        self.pwd_hash = pwd_hash
+        self.kdf = kdf
+        self.iterations = iterations
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, User):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"User(username={self.username!r}, role={self.role!r}, kdf={self.kdf!r}, iterations={self.iterations})"
+
+    def copy(self) -> "User":
+        return User(self.username, self.role, self.salt, self.pwd_hash, self.kdf, self.iterations)
 
     def to_dict(self) -> Dict[str, Any]:
-        return {"username": self.username, "role": self.role, "salt": self.salt, "pwd_hash": self.pwd_hash}
+        return {"username": self.username, "role": self.role, "salt": self.salt.hex(), "pwd_hash": self.pwd_hash.hex(),
+                "kdf": self.kdf, "iterations": self.iterations}
 
     @staticmethod
     def from_dict(d: Dict[str, Any]) -> "User":
-        return User(username=d["username"], role=d["role"], salt=d["salt"], pwd_hash=d["pwd_hash"])
+        # role and kdf repeat across thousands of records: share one string
+        return User(username=d["username"], role=sys.intern(d["role"]),
+                    salt=bytes.fromhex(d["salt"]), pwd_hash=bytes.fromhex(d["pwd_hash"]),
+                    kdf=sys.intern(d.get("kdf", DEFAULT_KDF)), iterations=int(d.get("iterations", PBKDF2_ITER)))
+
+
+@dataclass
+class RowError:
+    row: int
+    username: str
+    message: str
+
+
+@dataclass
+class ImportReport:
+    created: List[str] = field(default_factory=list)
+    errors: List[RowError] = field(default_factory=list)
+
+
+@dataclass
+class PreparedUsers:
+    """Accounts validated and hashed by `UserManager.prepare_users`, not stored yet."""
+    report: ImportReport
+    rows: List[tuple] = field(default_factory=list)  # (row, User)
+
+
+def validate_record(username: Any, password: Any, role: Any) -> Optional[str]:
+    """Return why a new account record is invalid, or None if it is fine."""
+    if not isinstance(username, str) or not username:
+        return "username is empty"
+    if len(username) > USERNAME_MAX_LEN:
+        return f"username longer than {USERNAME_MAX_LEN} characters"
+    if username != username.strip() or any(c.isspace() or not c.isprintable() for c in username):
+        return "username contains whitespace or control characters"
+    if not isinstance(password, str) or not password:
+        return "password is empty"
+    if role not in ROLE_GRANTS:
+        return f"unknown role {role!r}"
+    return None
+
+
+def _pbkdf2_job(job) -> bytes:
+    # module level so ProcessPoolExecutor workers can unpickle it
+    kdf, password, salt, iterations = job
+    return pbkdf2(kdf, password, salt, iterations)
+
+
+def _hash_many(jobs: List[tuple], workers: Optional[int]) -> List[bytes]:
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        # imported here: multiprocessing is slow to import and only bulk imports need it
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                chunk = max(1, len(jobs) // (workers * 4))
+                return list(ex.map(_pbkdf2_job, jobs, chunksize=chunk))
+        except (OSError, NotImplementedError):
+            # no multiprocessing support here; hash serially
+            pass
+    return [_pbkdf2_job(j) for j in jobs]
+
+
+def read_import_file(path: str) -> List[Dict[str, Any]]:
+    """Read account rows from CSV (username,password,role header) or JSON.
+
+    JSON may be a list of objects or `{"users": [...]}`.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("users", [])
+        return [d if isinstance(d, dict) else {} for d in data]
+    # utf-8-sig: tolerate the BOM Excel puts in front of CSV exports
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return [dict(row) for row in csv.DictReader(f)]
+
+
+class _UserValues(ValuesView):
+    def __iter__(self):
+        return self._mapping._store.records()
+
+
+class UserView(Mapping):
+    """Read-only username -> User mapping backed by a `UserStore`.
+
+    Lookups go to the store, so a SQLite backend never has to hold every
+    account in memory.
+    """
+
+    def __init__(self, store: UserStore):
+        self._store = store
+
+    def __getitem__(self, username: str) -> User:
+        u = self._store.get(username)
+        if u is None:
+            raise KeyError(username)
+        return u
+
+    def __contains__(self, username) -> bool:
+        return self._store.get(username) is not None
+
+    def __iter__(self):
+        return self._store.usernames()
+
+    def __len__(self) -> int:
+        return self._store.count()
+
+    def values(self):
+        return _UserValues(self)
 
 
 class UserManager:
-    def __init__(self, store_path: Optional[str] = None):
-        if store_path is None:
+    def __init__(self, store_path: Optional[str] = None, journal: bool = False,
+                 store: Optional[UserStore] = None, policy: Optional[KdfPolicy] = None,
+                 permissions: Optional[PermissionEngine] = None,
+                 throttle: Optional[AuthThrottle] = None):
+        if store is not None:
+            store_path = store.path
+        elif store_path is None:
             base = os.path.abspath(os.path.join(os.path.dirname(__file__), "."))
             store_path = os.path.join(base, DEFAULT_STORE_FILENAME)
         self.store_path = store_path
-        self.users: Dict[str, User] = {}
+        self._store = store or open_store(store_path, User.from_dict, journal=journal)
+        self.users = UserView(self._store)
+        self.policy = policy or load_policy(policy_path_for(store_path))
+        self.permissions = permissions or PERMISSION_ENGINE
+        # admission control for authenticate(); None means unthrottled
+        self.throttle = throttle
+        self._masks: Dict[str, int] = {}
         self._load()
 
     def _load(self):
-        if os.path.exists(self.store_path):
-            try:
-                with open(self.store_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                for u in data.get("users", []):
-                    user = User.from_dict(u)
-                    self.users[user.username] = user
-            except Exception:
-                # if file corrupt, start fresh
-                self.users = {}
-        else:
-            self.users = {}
+        self._store.load()
 
     def _save(self):
-        data = {"users": [u.to_dict() for u in self.users.values()]}
-        with open(self.store_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        # full snapshot; single mutations go through the store directly
+        self._store.save()
+
+    def flush(self) -> None:
+        self._store.flush()
+
+    def refresh(self) -> Optional[Set[str]]:
+        """Merge account changes other processes wrote to the store.
+
+        Returns the changed usernames (None: unknown, assume all).
+        """
+        changed = self._store.refresh()
+        if changed is None:
+            self._masks.clear()
+        else:
+            for name in changed:
+                self._masks.pop(name, None)
+        return changed
 
-    def _hash_password(self, password: str, salt: Optional[bytes] = None) -> tuple[str, str]:
-        # returns (salt_hex, hash_hex)
+    def _sync(self) -> None:
+        # a stat or an inotify read unless another process wrote something
+        if self._store.changed():
+            self.refresh()
+
+    @contextmanager
+    def _mutation(self, username: Optional[str] = None):
+        # read-modify-write under the store's inter-process lock, on top of
+        # whatever other processes committed meanwhile
+        with self._store.lock():
+            changed = self.refresh()
+            if username is not None and changed and username in changed:
+                print(f"[users] {username} was changed by another process; applying on top of it")
+            yield
+
+    def lock(self):
+        """The store's lock; hold it to read several records as one consistent view."""
+        return self._store.lock()
+
+    def close(self) -> None:
+        self._store.close()
+
+    def hash_password(self, password: str, salt: Optional[bytes] = None) -> tuple[bytes, bytes]:
+        """(salt, hash) of `password` under the current policy."""
         if salt is None:
             salt = secrets.token_bytes(16)
-        dk = hashlib.pbkdf2_hmac(HASH_NAME, password.encode("utf-8"), salt, PBKDF2_ITER)
-        return salt.hex(), dk.hex()
+        return salt, pbkdf2(self.policy.kdf, password, salt, self.policy.iterations)
+
+    def _set_hash(self, u: User, password: str) -> None:
+        u.salt, u.pwd_hash = self.hash_password(password)
+        u.kdf = self.policy.kdf
+        u.iterations = self.policy.iterations
 
     def create_user(self, username: str, password: str, role: str) -> User:
-        if username in self.users:
+        self._sync()
+        if self._store.get(username) is not None:
             raise ValueError("user exists")
-        salt_hex, hash_hex = self._hash_password(password)
-        user = User(username=username, role=role, salt=salt_hex, pwd_hash=hash_hex)
-        self.users[username] = user
-        self._save()
+        # hash before taking the store lock so other processes aren't
+        # blocked behind PBKDF2
+        return self.add_user(self.new_user(username, password, role))
+
+    def new_user(self, username: str, password: str, role: str) -> User:
+        """A hashed account, not stored yet; see `add_user`."""
+        user = User(username=username, role=role, salt=b"", pwd_hash=b"")
+        self._set_hash(user, password)
         return user
 
-    def authenticate(self, username: str, password: str) -> Optional[User]:
-        u = self.users.get(username)
-        if not u:
+    def add_user(self, user: User) -> User:
+        """Store an account from `new_user`; ValueError if the name is taken."""
+        with self._mutation(user.username):
+            if self._store.insert_many([user]):
+                raise ValueError("user exists")
+        return user
+
+    def create_users(self, records: Iterable[Dict[str, Any]], default_role: Optional[str] = None,
+                     workers: Optional[int] = None) -> ImportReport:
+        """Create many accounts at once.
+
+        Each record is a dict with `username`, `password` and `role` (falling
+        back to `default_role`). Invalid rows are reported per row and
+        skipped; the remaining passwords are hashed across `workers`
+        processes (all cores by default) and stored in a single commit.
+        """
+        return self.add_users(self.prepare_users(records, default_role, workers))
+
+    def prepare_users(self, records: Iterable[Dict[str, Any]], default_role: Optional[str] = None,
+                      workers: Optional[int] = None) -> PreparedUsers:
+        """The validating and hashing half of `create_users`; stores nothing."""
+        report = ImportReport()
+        accepted = []
+        seen = set()
+        # under the lock only while checking names, not while hashing
+        with self.lock():
+            self._sync()
+            for row, rec in enumerate(records, 1):
+                username = rec.get("username")
+                username = username.strip() if isinstance(username, str) else username
+                password = rec.get("password")
+                role = rec.get("role") or default_role
+                err = validate_record(username, password, role)
+                if err is None and username in seen:
+                    err = "duplicate username in batch"
+                if err is None and self._store.get(username) is not None:
+                    err = "user exists"
+                if err is not None:
+                    report.errors.append(RowError(row, str(username or ""), err))
+                    continue
+                seen.add(username)
+                accepted.append((row, username, password, role, secrets.token_bytes(16)))
+
+        kdf, iterations = self.policy.kdf, self.policy.iterations
+        hashes = _hash_many([(kdf, pw, salt, iterations) for _, _, pw, _, salt in accepted], workers)
+        return PreparedUsers(report, [
+            (row, User(username=name, role=role, salt=salt, pwd_hash=h, kdf=kdf, iterations=iterations))
+            for (row, name, _, role, salt), h in zip(accepted, hashes)])
+
+    def add_users(self, prepared: PreparedUsers) -> ImportReport:
+        """Store accounts from `prepare_users` in one commit and report the outcome."""
+        report = prepared.report
+        taken = set()
+        if prepared.rows:
+            with self._mutation():
+                # another process may have created some while we were hashing
+                taken = set(self._store.insert_many([u for _, u in prepared.rows]))
+        for row, u in prepared.rows:
+            if u.username in taken:
+                report.errors.append(RowError(row, u.username, "user exists"))
+            else:
+                report.created.append(u.username)
+        return report
+
+    def import_users(self, path: str, default_role: Optional[str] = None,
+                     workers: Optional[int] = None) -> ImportReport:
+        """Bulk-create accounts from a CSV or JSON file, see `read_import_file`."""
+        return self.create_users(read_import_file(path), default_role=default_role, workers=workers)
+
+    def authenticate(self, username: str, password: str, client: Optional[str] = None) -> Optional[User]:
+        """Verify a password; raises AuthThrottled when rate limits refuse the attempt.
+
+        `client` identifies where the attempt comes from (authd passes the
+        peer's uid), so failure backoff is per username and client.
+        """
+        self._sync()
+        throttle = self.throttle
+        if throttle is not None:
+            throttle.admit(username, client)
+        u = self._store.get(username)
+        ok = False
+        if u is None and throttle is not None:
+            # take as long as checking a real account, without the CPU or
+            # a hash slot, so a missing username can't be told apart by timing
+            time.sleep(throttle.hash_delay())
+        elif u is None:
+            # unthrottled: no timing estimate, so do the real work
+            pbkdf2(self.policy.kdf, password, _DUMMY_SALT, self.policy.iterations)
+        else:
+            with throttle.hashing() if throttle is not None else nullcontext():
+                try:
+                    ok = hmac.compare_digest(pbkdf2(u.kdf, password, u.salt, u.iterations), u.pwd_hash)
+                except ValueError:
+                    pass
+        if throttle is not None:
+            if u is None:
+                throttle.reject_unknown(username, client)
+            else:
+                throttle.record(username, ok, client)
+        if not ok:
             return None
-        salt = bytes.fromhex(u.salt)
-        dk = hashlib.pbkdf2_hmac(HASH_NAME, password.encode("utf-8"), salt, PBKDF2_ITER)
-        if hmac.compare_digest(dk.hex(), u.pwd_hash):
-            return u
-        return None
+        if (u.kdf, u.iterations) != (self.policy.kdf, self.policy.iterations):
+            # upgrade (or downgrade) to the deployment's policy while we
+            # have the plaintext; a failed write just retries next login.
+            # `u` may be the store's live record, so change a copy.
+            try:
+                with throttle.hashing() if throttle is not None else nullcontext():
+                    salt, pwd_hash = self.hash_password(password)
+                with self._mutation(username):
+                    cur = self._store.get(username)
+                    # skip if the password changed since we verified it
+                    if cur is not None and hmac.compare_digest(cur.pwd_hash, u.pwd_hash):
+                        new = cur.copy()
+                        new.salt, new.pwd_hash = salt, pwd_hash
+                        new.kdf, new.iterations = self.policy.kdf, self.policy.iterations
+                        self._store.put(new)
+                        u = new
+            except Exception as e:
+                print(f"[users] could not rehash {username}: {e}")
+        return u
+
+    def auth_stats(self) -> Dict[str, float]:
+        """Throttle counters (attempts, refusals, hash CPU seconds); empty when unthrottled."""
+        return self.throttle.stats() if self.throttle is not None else {}
 
     def get_user(self, username: str) -> Optional[User]:
-        return self.users.get(username)
+        self._sync()
+        return self._store.get(username)
+
+    def list_users(self, role: Optional[str] = None) -> List[User]:
+        """Users ordered by username, optionally filtered by role."""
+        self._sync()
+        return list(self._store.records(role))
+
+    def _mask(self, username: str) -> int:
+        # effective permission mask per user, dropped on role changes
+        self._sync()
+        m = self._masks.get(username)
+        if m is None:
+            u = self._store.get(username)
+            if not u:
+                return 0
+            m = self._masks[username] = self.permissions.role_mask(u.role)
+        return m
 
     def has_permission(self, username: str, permission: str) -> bool:
-        u = self.get_user(username)
-        if not u:
-            return False
-        perms = PERMISSIONS.get(u.role, set())
-        # admin implicitly has all permissions in PERMISSIONS mapping
-        return permission in perms
+        return self.permissions.has(self._mask(username), permission)
+
+    def has_all(self, username: str, permissions: Iterable[str]) -> bool:
+        return self.permissions.has_all(self._mask(username), permissions)
+
+    def has_any(self, username: str, permissions: Iterable[str]) -> bool:
+        return self.permissions.has_any(self._mask(username), permissions)
 
     def set_password(self, username: str, new_password: str) -> None:
-        u = self.get_user(username)
-        if not u:
+        if self.get_user(username) is None:
             raise KeyError("user not found")
-        salt_hex, hash_hex = self._hash_password(new_password)
-        u.salt = salt_hex
-        u.pwd_hash = hash_hex
-        self._save()
+        self.store_password(username, *self.hash_password(new_password))
+
+    def store_password(self, username: str, salt: bytes, pwd_hash: bytes) -> None:
+        """Set a password hashed by `hash_password`."""
+        with self._mutation(username):
+            u = self._store.get(username)
+            if not u:
+                raise KeyError("user not found")
+            u = u.copy()
+            u.salt, u.pwd_hash = salt, pwd_hash
+            u.kdf, u.iterations = self.policy.kdf, self.policy.iterations
+            self._store.put(u)
 
     def delete_user(self, username: str) -> None:
-        if username in self.users:
-            del self.users[username]
-            self._save()
-        else:
-            raise KeyError("user not found")
+        with self._mutation(username):
+            if self._store.get(username) is None:
+                raise KeyError("user not found")
+            self._store.delete(username)
+            self._masks.pop(username, None)
 
     def update_role(self, username: str, role: str) -> None:
-        u = self.get_user(username)
-        if not u:
-            raise KeyError("user not found")
-        u.role = role
-        self._save()
+        with self._mutation(username):
+            u = self._store.get(username)
+            if not u:
+                raise KeyError("user not found")
+            u = u.copy()
+            u.role = role
+            self._store.put(u)
+            self._masks.pop(username, None)
 
 
 # Convenience: global manager that auto-creates admin if missing
 _manager: Optional[UserManager] = None
 
 
+def default_store_path() -> str:
+    base = os.path.abspath(os.path.join(os.path.dirname(__file__), "."))
+    return os.environ.get(STORE_ENV) or os.path.join(base, DEFAULT_STORE_FILENAME)
+
+
+def ensure_default_admin(mgr: UserManager) -> None:
+    if "admin" not in mgr.users:
+        try:
+            mgr.create_user("admin", "admin", ROLE_ADMIN)
+            print("[users] Created default admin/admin")
+        except Exception:
+            pass
+
+
 def get_manager() -> UserManager:
     global _manager
     if _manager is None:
-        base = os.path.abspath(os.path.join(os.path.dirname(__file__), "."))
-        store = os.path.join(base, DEFAULT_STORE_FILENAME)
-        _manager = UserManager(store)
-        # ensure admin exists
-        if "admin" not in _manager.users:
-            try:
-                _manager.create_user("admin", "admin", ROLE_ADMIN)
-                print("[users] Created default admin/admin")
-            except Exception:
-                pass
+        socket_path = os.environ.get(AUTHD_SOCKET_ENV)
+        if socket_path:
+            # the daemon owns the store and the default admin
+            import authd
+            _manager = authd.AuthClient(socket_path)
+            return _manager
+        store = default_store_path()
+        journal = os.environ.get(JOURNAL_ENV, "") not in ("", "0")
+        _manager = UserManager(store, journal=journal, throttle=AuthThrottle())
+        atexit.register(_manager.close)
+        ensure_default_admin(_manager)
     return _manager
 
 
-if __name__ == "__main__":
+def migrate_store(src_path: str, dst_path: str) -> int:
+    """Copy every account from one store to another (e.g. JSON -> SQLite)."""
+    src = UserManager(src_path)
+    dst = UserManager(dst_path)
+    recs = list(src.users.values())
+    dst._store.put_many(recs)
+    n = len(recs)
+    src.close()
+    dst.close()
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="users.py", description="neurolink user store tools")
+    sub = parser.add_subparsers(dest="cmd")
+    sub.add_parser("list", help="list users (default)")
+    p = sub.add_parser("migrate", help="copy all users to another store, e.g. users.db")
+    p.add_argument("src")
+    p.add_argument("dst")
+    p = sub.add_parser("import", help="bulk-create users from a CSV or JSON file")
+    p.add_argument("file")
+    p.add_argument("--role", help="role for rows that don't specify one")
+    p.add_argument("--workers", type=int, help="hashing processes (default: all cores)")
+    p = sub.add_parser("calibrate", help="pick a KDF cost for this host and save it as the policy")
+    p.add_argument("--target-ms", type=float, default=250.0, help="target verification time (default 250)")
+    p.add_argument("--dry-run", action="store_true", help="print the result without saving it")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "calibrate":
+        policy = calibrate_policy(args.target_ms)
+        print(f"{policy.kdf}: {policy.iterations} iterations for ~{args.target_ms:g} ms")
+        if not args.dry_run:
+            path = policy_path_for(default_store_path())
+            save_policy(policy, path, target_ms=args.target_ms)
+            print(f"saved {path}; accounts are rehashed on their next login")
+        return
+
+    if args.cmd == "import":
+        report = get_manager().import_users(args.file, default_role=args.role, workers=args.workers)
+        for e in report.errors:
+            print(f"row {e.row} ({e.username}): {e.message}")
+        print(f"created {len(report.created)} users, {len(report.errors)} rows rejected")
+        return
+    if args.cmd == "migrate":
+        n = migrate_store(args.src, args.dst)
+        print(f"migrated {n} users from {args.src} to {args.dst}")
+        return
     m = get_manager()
     print("Users:")
     for u in m.users.values():
         print(u.username, u.role)
+
+
+if __name__ == "__main__":
+    main()
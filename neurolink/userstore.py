@@ -0,0 +1,809 @@
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+from fsutil import atomic_write_json, fsync_dir as _fsync_dir, write_temp_json as _write_temp_json
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class StoreCorrupt(RuntimeError):
+    """The store file exists but can't be read; nothing is loaded or written."""
+
+    def __init__(self, path: str, error: Exception):
+        super().__init__(f"user store {path} is unreadable ({error}); restore it from a backup, "
+                         f"or move it away to start over with the default admin")
+        self.path = path
+
+
+class FileLock:
+    """Re-entrant lock shared between threads and processes.
+
+    Threads serialize on an RLock; the outermost holder also takes an
+    exclusive `flock` (or `msvcrt.locking` on Windows) on `path`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+            except OSError:
+                # read-only location: fall back to in-process locking
+                if self._fd is not None:
+                    os.close(self._fd)
+                self._fd = None
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._rlock.release()
+
+
+class _Inotify:
+    """Minimal non-blocking inotify watch on one directory (Linux only)."""
+
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, fd: int, names: Set[str]):
+        self.fd = fd
+        self.names = names
+
+    @classmethod
+    def create(cls, directory: str, names: Set[str]) -> Optional["_Inotify"]:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = (cls.IN_MODIFY | cls.IN_ATTRIB | cls.IN_CLOSE_WRITE | cls.IN_MOVED_FROM
+                    | cls.IN_MOVED_TO | cls.IN_CREATE | cls.IN_DELETE)
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+                os.close(fd)
+                return None
+            return cls(fd, names)
+        except Exception:
+            return None
+
+    def poll(self) -> bool:
+        """True if any watched name was touched since the last poll."""
+        hit = False
+        while True:
+            try:
+                buf = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return hit
+            except OSError:
+                return True
+            if not buf:
+                return hit
+            pos = 0
+            while pos + self._EVENT.size <= len(buf):
+                _, _, _, length = self._EVENT.unpack_from(buf, pos)
+                pos += self._EVENT.size
+                name = buf[pos:pos + length].rstrip(b"\0").decode("utf-8", "replace")
+                pos += length
+                if name in self.names:
+                    hit = True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class UserStore:
+    """Storage backend interface used by `users.UserManager`.
+
+    `factory` turns a stored dict into a record; records must provide
+    `username`, `role` and `to_dict()`. Records returned by `get` may be
+    fresh objects on every call, so callers persist changes with `put`.
+
+    Several processes may share one store. `changed` is a cheap check for
+    writes by someone else, `refresh` merges them, and `lock` serializes a
+    read-modify-write against other threads and processes.
+    """
+
+    def __init__(self, path: str, factory: Callable[[Dict[str, Any]], Any]):
+        self.path = path
+        self.factory = factory
+        self._lock = threading.RLock()
+
+    def load(self) -> None:
+        raise NotImplementedError
+
+    def get(self, username: str):
+        raise NotImplementedError
+
+    def put(self, rec) -> None:
+        raise NotImplementedError
+
+    def put_many(self, recs) -> None:
+        """Store several records in one commit."""
+        raise NotImplementedError
+
+    def insert_many(self, recs) -> List[str]:
+        """Store the records whose usernames are free, in one commit.
+
+        Returns the usernames that were taken; those records are skipped,
+        never overwritten. The check and the write are one step for other
+        threads and processes.
+        """
+        with self.lock():
+            taken = [r.username for r in recs if self.get(r.username) is not None]
+            fresh = [r for r in recs if r.username not in taken]
+            if fresh:
+                self.put_many(fresh)
+            return taken
+
+    def delete(self, username: str) -> None:
+        raise NotImplementedError
+
+    def usernames(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def records(self, role: Optional[str] = None) -> Iterator[Any]:
+        """Records ordered by username, optionally only those with `role`."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def lock(self):
+        return self._lock
+
+    def changed(self) -> bool:
+        return False
+
+    def refresh(self) -> Optional[Set[str]]:
+        """Merge changes made by other processes.
+
+        Returns the usernames whose records changed, or None if the backend
+        can't tell which (treat everything as changed).
+        """
+        return set()
+
+    def save(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+_Stat = Optional[Tuple[int, int, int]]
+
+
+def _stat(path: str) -> _Stat:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class JsonStore(UserStore):
+    """Whole-file JSON store: `{"users": [...]}` rewritten on every change.
+
+    All records are held in `self.users` (username -> record). Writes take
+    an inter-process lock on `<path>.lock` and merge other processes'
+    changes first, so a save never overwrites someone else's edit. Changes
+    are detected by (mtime, size, inode) of the store files, confirmed with
+    a content hash of the snapshot; with inotify the stat is only done
+    after a change event, otherwise at most every `check_interval` seconds.
+    """
+
+    def __init__(self, path: str, factory: Callable[[Dict[str, Any]], Any], check_interval: float = 0.5):
+        super().__init__(path, factory)
+        self.users: Dict[str, Any] = {}
+        self.journal_path = path + ".journal"
+        self.compacting_path = path + ".journal.compacting"
+        self.check_interval = check_interval
+        self._lock = FileLock(path + ".lock")
+        self._fingerprint: Tuple[_Stat, _Stat, _Stat] = (None, None, None)
+        self._snap_hash: Optional[bytes] = None
+        self._next_check = 0.0
+        self._inotify = _Inotify.create(
+            os.path.dirname(os.path.abspath(path)),
+            {os.path.basename(p) for p in (path, self.journal_path, self.compacting_path)},
+        )
+
+    def _stat_all(self) -> Tuple[_Stat, _Stat, _Stat]:
+        return (_stat(self.path), _stat(self.journal_path), _stat(self.compacting_path))
+
+    def _mark_synced(self) -> None:
+        self._fingerprint = self._stat_all()
+
+    def load(self) -> None:
+        with self._lock:
+            self.users = self._read_state()
+            # fold in a journal left by JournaledJsonStore so switching
+            # modes never drops changes
+            if self._fingerprint[1] or self._fingerprint[2]:
+                self.save()
+
+    def _read_state(self) -> Dict[str, Any]:
+        # stat first: a write racing with the read shows up as a changed
+        # fingerprint on the next check and is simply merged again
+        fp = self._stat_all()
+        state: Dict[str, Any] = {}
+        self._snap_hash = self._read_snapshot(state)
+        for p in (self.compacting_path, self.journal_path):
+            self._apply(state, self._read_journal(p)[0])
+        self._fingerprint = fp
+        return state
+
+    def _read_snapshot(self, into: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            data = json.loads(raw.decode("utf-8"))
+            for d in data.get("users", []):
+                rec = self.factory(d)
+                into[rec.username] = rec
+        except Exception as e:
+            # Refuse to go on with an empty store: it would be saved over
+            # the damaged file, and an empty store gets the default admin.
+            raise StoreCorrupt(self.path, e) from e
+        return hashlib.sha256(raw).digest()
+
+    def _read_journal(self, path: str, offset: int = 0) -> Tuple[List[Tuple[str, Any]], int]:
+        """-> ([(username, record or None for delete)], end offset)"""
+        ops: List[Tuple[str, Any]] = []
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return ops, 0
+        bad = 0
+        with f:
+            f.seek(offset)
+            data = f.read()
+        end = offset + len(data)
+        if data and not data.endswith(b"\n"):
+            # a record still being written (or torn by a power cut): read
+            # up to the last complete line and pick the rest up next time
+            cut = data.rfind(b"\n") + 1
+            end = offset + cut
+            data = data[:cut]
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line.decode("utf-8"))
+                if entry["op"] == "put":
+                    rec = self.factory(entry["user"])
+                    ops.append((rec.username, rec))
+                elif entry["op"] == "del":
+                    ops.append((entry["username"], None))
+            except Exception:
+                bad += 1
+        if bad:
+            print(f"[users] skipped {bad} unreadable journal record(s) in {path}")
+        return ops, end
+
+    @staticmethod
+    def _apply(state: Dict[str, Any], ops: List[Tuple[str, Any]]) -> None:
+        for name, rec in ops:
+            if rec is None:
+                state.pop(name, None)
+            else:
+                state[name] = rec
+
+    def _merge(self, ops: List[Tuple[str, Any]]) -> Set[str]:
+        # apply other writers' records, keeping our objects for records
+        # whose content didn't change
+        changed = set()
+        for name, rec in ops:
+            old = self.users.get(name)
+            if rec is None:
+                if old is not None:
+                    del self.users[name]
+                    changed.add(name)
+            elif old is None or old.to_dict() != rec.to_dict():
+                self.users[name] = rec
+                changed.add(name)
+        return changed
+
+    def changed(self) -> bool:
+        if self._inotify is not None:
+            if not self._inotify.poll():
+                return False
+        else:
+            now = time.monotonic()
+            if now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+        return self._stat_all() != self._fingerprint
+
+    def refresh(self) -> Optional[Set[str]]:
+        with self._lock:
+            fp = self._stat_all()
+            if fp == self._fingerprint:
+                return set()
+            return self._refresh(fp)
+
+    def _refresh(self, fp) -> Set[str]:
+        if fp[1:] == self._fingerprint[1:] and fp[0] is not None:
+            # only the snapshot's metadata moved; skip the parse if the
+            # content is identical
+            with open(self.path, "rb") as f:
+                if hashlib.sha256(f.read()).digest() == self._snap_hash:
+                    self._fingerprint = fp
+                    return set()
+        state = self._read_state()
+        ops = [(name, rec) for name, rec in state.items()]
+        ops += [(name, None) for name in self.users if name not in state]
+        return self._merge(ops)
+
+    def _snapshot_data(self) -> Dict[str, Any]:
+        return {"users": [u.to_dict() for u in self.users.values()]}
+
+    def save(self) -> None:
+        """Persist the full record set."""
+        with self._lock:
+            atomic_write_json(self.path, self._snapshot_data())
+            self._remove_journals()
+            self._snap_hash = None
+            self._mark_synced()
+
+    def _remove_journals(self) -> None:
+        for p in (self.journal_path, self.compacting_path):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def get(self, username: str):
+        return self.users.get(username)
+
+    def put(self, rec) -> None:
+        self.put_many([rec])
+
+    def put_many(self, recs) -> None:
+        with self._lock:
+            self.refresh()
+            self._put_all(recs, self.save)
+
+    def _put_all(self, recs, write: Callable[[], None]) -> None:
+        # change memory, then persist; undo the memory change if that fails
+        old = {rec.username: self.users.get(rec.username) for rec in recs}
+        for rec in recs:
+            self.users[rec.username] = rec
+        try:
+            write()
+        except BaseException:
+            for name, rec in old.items():
+                if rec is None:
+                    self.users.pop(name, None)
+                else:
+                    self.users[name] = rec
+            raise
+
+    def delete(self, username: str) -> None:
+        with self._lock:
+            self.refresh()
+            del self.users[username]
+            self.save()
+
+    def usernames(self) -> Iterator[str]:
+        return iter(list(self.users))
+
+    def records(self, role: Optional[str] = None) -> Iterator[Any]:
+        recs = sorted(self.users.values(), key=lambda r: r.username)
+        if role is not None:
+            recs = [r for r in recs if r.role == role]
+        return iter(recs)
+
+    def count(self) -> int:
+        return len(self.users)
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+class JournaledJsonStore(JsonStore):
+    """JSON snapshot plus an append-only journal of mutations.
+
+    Each `put`/`delete` appends one JSON line to `<path>.journal` instead of
+    rewriting the snapshot. Appends are fsynced in batches (every
+    `fsync_batch` records or `fsync_interval` seconds, whichever comes
+    first). `load` replays the journal onto the snapshot. Once the journal
+    grows past `compact_bytes` it is rotated to `<path>.journal.compacting`
+    and a background thread folds it into a new snapshot written with
+    atomic rename. Journal records are full upserts/deletes, so replaying
+    a rotated journal onto a snapshot that already contains it is harmless.
+    When another process only appended to the journal, `refresh` reads
+    just the new records.
+    """
+
+    def __init__(self, path: str, factory, fsync_batch: int = 16, fsync_interval: float = 1.0,
+                 compact_bytes: int = 256 * 1024, check_interval: float = 0.5):
+        super().__init__(path, factory, check_interval=check_interval)
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._journal = None
+        self._journal_offset = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._timer: Optional[threading.Timer] = None
+        self._compactor: Optional[threading.Thread] = None
+
+    def load(self) -> None:
+        with self._lock:
+            self._close_journal()
+            self.users = self._read_state()
+            if self._fingerprint[2] is not None:
+                # a compaction didn't finish; fold everything now
+                self.save()
+
+    def _read_state(self) -> Dict[str, Any]:
+        state = super()._read_state()
+        jr = self._fingerprint[1]
+        self._journal_offset = jr[1] if jr else 0
+        return state
+
+    def _refresh(self, fp) -> Set[str]:
+        old = self._fingerprint
+        jr, old_jr = fp[1], old[1]
+        if (fp[0] == old[0] and fp[2] == old[2] and jr is not None and old_jr is not None
+                and jr[2] == old_jr[2] and jr[1] >= self._journal_offset):
+            # same snapshot, same journal file that only grew: read the tail
+            ops, self._journal_offset = self._read_journal(self.journal_path, self._journal_offset)
+            self._fingerprint = fp
+            return self._merge(ops)
+        return super()._refresh(fp)
+
+    def _open_journal(self) -> None:
+        # terminate a torn last record so the next append starts a new line
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        except OSError:
+            torn = False
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if torn:
+            self._journal.write("\n")
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._sync()
+            self._journal.close()
+            self._journal = None
+
+    def _current_journal(self):
+        # another process may have compacted: never append to a rotated file
+        if self._journal is not None:
+            cur = _stat(self.journal_path)
+            if cur is None or cur[2] != os.fstat(self._journal.fileno()).st_ino:
+                self._close_journal()
+        if self._journal is None:
+            self._open_journal()
+        return self._journal
+
+    def _append(self, *entries: Dict[str, Any]) -> None:
+        journal = self._current_journal()
+        journal.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+        journal.flush()
+        self._pending += len(entries)
+        if self._pending >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.fsync_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        self._journal_offset = journal.tell()
+        self._mark_synced()
+        if self._journal_offset >= self.compact_bytes:
+            self.compact()
+
+    def _sync(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._journal is not None and self._pending:
+            os.fsync(self._journal.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def put(self, rec) -> None:
+        with self._lock:
+            self.refresh()
+            self._put_all([rec], lambda: self._append({"op": "put", "user": rec.to_dict()}))
+
+    def put_many(self, recs) -> None:
+        with self._lock:
+            self.refresh()
+            entries = [{"op": "put", "user": rec.to_dict()} for rec in recs]
+            if entries:
+                self._put_all(recs, lambda: (self._append(*entries), self._sync()))
+
+    def delete(self, username: str) -> None:
+        with self._lock:
+            self.refresh()
+            del self.users[username]
+            self._append({"op": "del", "username": username})
+
+    def save(self) -> None:
+        """Write a full snapshot and drop the journal it supersedes.
+
+        A background compaction still in flight notices that its rotated
+        journal is gone and discards its (older) snapshot.
+        """
+        with self._lock:
+            self._close_journal()
+            super().save()
+            self._journal_offset = 0
+
+    def compact(self, wait: bool = False) -> None:
+        """Fold the journal into the snapshot on a background thread."""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            if os.path.exists(self.compacting_path):
+                # leftover from a crash or another process: compact now
+                self.save()
+                return
+            if not os.path.exists(self.journal_path):
+                return
+            self._close_journal()
+            os.replace(self.journal_path, self.compacting_path)
+            self._journal_offset = 0
+            self._mark_synced()
+            rotated = self._fingerprint[2]
+            data = self._snapshot_data()
+            self._compactor = threading.Thread(target=self._write_compacted, args=(data, rotated),
+                                               name="users-compact", daemon=True)
+            self._compactor.start()
+            compactor = self._compactor
+        if wait:
+            compactor.join()
+
+    def _write_compacted(self, data: Dict[str, Any], rotated: _Stat) -> None:
+        tmp = None
+        try:
+            # the slow part runs unlocked; only the swap is serialized
+            tmp = _write_temp_json(self.path, data)
+            with self._lock:
+                cur = _stat(self.compacting_path)
+                if cur is None or rotated is None or cur[2] != rotated[2]:
+                    return  # superseded by a full save
+                os.replace(tmp, self.path)
+                tmp = None
+                _fsync_dir(self.path)
+                os.remove(self.compacting_path)
+                self._snap_hash = None
+                self._mark_synced()
+        except Exception as e:
+            # the rotated journal is still replayed on the next load
+            print(f"[users] journal compaction failed: {e}")
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def flush(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_journal()
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        super().close()
+
+
+class SQLiteStore(UserStore):
+    """SQLite-backed store for large user sets.
+
+    Nothing is loaded up front: `get` is a primary-key lookup, role
+    listings use an index on `role`, and every mutation is committed in its
+    own transaction. The full record is kept as JSON next to the indexed
+    columns so new record fields need no schema migration. Reads always
+    see other processes' commits; `changed` uses `PRAGMA data_version`.
+    `lock` holds a write transaction (`BEGIN IMMEDIATE`), so a get-modify-put
+    under it can't interleave with another process's.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users ("
+        " username TEXT PRIMARY KEY,"
+        " role TEXT NOT NULL,"
+        " record TEXT NOT NULL"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS users_role ON users(role)",
+    )
+
+    def __init__(self, path: str, factory: Callable[[Dict[str, Any]], Any]):
+        super().__init__(path, factory)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version = None
+        # nesting depth of lock(); writes inside it join its transaction
+        self._tx_depth = 0
+
+    def load(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                return
+            # one connection shared by the Tk thread and the auth worker
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            for stmt in self.SCHEMA:
+                conn.execute(stmt)
+            self._conn = conn
+            self._data_version = self._version()
+
+    def _version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _query(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            if self._tx_depth:
+                self._tx_depth += 1
+                try:
+                    yield
+                finally:
+                    self._tx_depth -= 1
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._tx_depth = 1
+            try:
+                yield
+            except BaseException:
+                self._tx_depth = 0
+                self._conn.execute("ROLLBACK")
+                raise
+            self._tx_depth = 0
+            self._conn.execute("COMMIT")
+
+    def _write(self, sql: str, params=(), many: bool = False) -> None:
+        with self.lock():
+            if many:
+                self._conn.executemany(sql, params)
+            else:
+                self._conn.execute(sql, params)
+
+    def changed(self) -> bool:
+        with self._lock:
+            return self._version() != self._data_version
+
+    def refresh(self) -> Optional[Set[str]]:
+        with self._lock:
+            v = self._version()
+            if v == self._data_version:
+                return set()
+            self._data_version = v
+            return None
+
+    def get(self, username: str):
+        rows = self._query("SELECT record FROM users WHERE username = ?", (username,))
+        return self.factory(json.loads(rows[0][0])) if rows else None
+
+    def put(self, rec) -> None:
+        self.put_many([rec])
+
+    def put_many(self, recs) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO users (username, role, record) VALUES (?, ?, ?)",
+            [(r.username, r.role, json.dumps(r.to_dict(), ensure_ascii=False)) for r in recs],
+            many=True,
+        )
+
+    def insert_many(self, recs) -> List[str]:
+        # one write transaction, so a concurrent create in another process
+        # either commits first (and is reported) or waits for ours
+        taken = []
+        with self.lock():
+            for r in recs:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO users (username, role, record) VALUES (?, ?, ?)",
+                    (r.username, r.role, json.dumps(r.to_dict(), ensure_ascii=False)))
+                if cur.rowcount == 0:
+                    taken.append(r.username)
+        return taken
+
+    def delete(self, username: str) -> None:
+        self._write("DELETE FROM users WHERE username = ?", (username,))
+
+    def usernames(self) -> Iterator[str]:
+        for (name,) in self._query("SELECT username FROM users ORDER BY username"):
+            yield name
+
+    def records(self, role: Optional[str] = None) -> Iterator[Any]:
+        # page through the table so large listings stay memory-flat
+        last = ""
+        while True:
+            if role is None:
+                rows = self._query(
+                    "SELECT username, record FROM users WHERE username > ? ORDER BY username LIMIT 500", (last,))
+            else:
+                rows = self._query(
+                    "SELECT username, record FROM users WHERE role = ? AND username > ? ORDER BY username LIMIT 500",
+                    (role, last))
+            if not rows:
+                return
+            for name, record in rows:
+                yield self.factory(json.loads(record))
+            last = rows[-1][0]
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM users")[0][0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def open_store(path: str, factory: Callable[[Dict[str, Any]], Any], journal: bool = False) -> UserStore:
+    """Pick a backend from the file name: SQLite for .db/.sqlite, else JSON."""
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        return SQLiteStore(path, factory)
+    if journal:
+        return JournaledJsonStore(path, factory)
+    return JsonStore(path, factory)
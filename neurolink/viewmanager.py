@@ -0,0 +1,157 @@
+"""Screens of the kiosk (login, map) stacked in one root window.
+
+Only one view is shown at a time. Views that are switched away from stay
+built, so switching back (e.g. from the map to the login screen on logout
+and in again) is instant. Hidden views are closed, least recently shown
+first, once all views together take more than `NEUROLINK_VIEW_CACHE_MB`
+(default 128) or the system runs low on memory.
+
+A view is any object with `show()`, `hide()` and `close()`; it may report
+its size with `memory_bytes()`. The expensive part of a view (decoding a
+map, say) can be started ahead of time with `preload`, on a background
+thread, and picked up with `take_preload` when the view is built.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+VIEW_CACHE_MB_ENV = "NEUROLINK_VIEW_CACHE_MB"
+DEFAULT_VIEW_CACHE_MB = 128
+# hidden views are also dropped while less than this is available
+MIN_FREE_MB = 48
+
+
+def default_budget_bytes() -> int:
+    try:
+        mb = float(os.environ.get(VIEW_CACHE_MB_ENV, DEFAULT_VIEW_CACHE_MB))
+    except ValueError:
+        mb = DEFAULT_VIEW_CACHE_MB
+    return int(mb * 1024 * 1024)
+
+
+def available_bytes() -> Optional[int]:
+    """Memory available to new allocations (MemAvailable), or None where unknown."""
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def view_bytes(view) -> int:
+    try:
+        return int(view.memory_bytes())
+    except Exception:
+        return 0
+
+
+class ViewManager:
+    """Built views by name, in least recently shown order. Tk thread only,
+    except for the preload functions, which must not touch Tk."""
+
+    def __init__(self, budget_bytes: Optional[int] = None, min_free_bytes: int = MIN_FREE_MB * 1024 * 1024):
+        self.budget_bytes = default_budget_bytes() if budget_bytes is None else budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.views: "OrderedDict[str, Any]" = OrderedDict()
+        self.pinned = set()
+        self.current: Optional[str] = None
+        self._preloads: Dict[str, Future] = {}
+        # names of views closed by trim, oldest first (for diagnostics)
+        self.evicted: List[str] = []
+
+    def add(self, name: str, view, pinned: bool = False) -> None:
+        """Keep `view` under `name`; pinned views are never evicted."""
+        old = self.views.pop(name, None)
+        if old is not None and old is not view:
+            old.close()
+        self.views[name] = view
+        if pinned:
+            self.pinned.add(name)
+        else:
+            self.pinned.discard(name)
+
+    def get(self, name: str):
+        return self.views.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.views
+
+    def show(self, name: str):
+        """Hide the current view and show `name`; returns it."""
+        view = self.views[name]
+        if self.current != name:
+            shown = self.views.get(self.current)
+            if shown is not None:
+                shown.hide()
+            view.show()
+            self.current = name
+        self.views.move_to_end(name)
+        self.trim()
+        return view
+
+    def remove(self, name: str) -> None:
+        view = self.views.pop(name, None)
+        self.pinned.discard(name)
+        if self.current == name:
+            self.current = None
+        if view is not None:
+            view.close()
+
+    def memory_bytes(self) -> int:
+        return sum(view_bytes(v) for v in self.views.values())
+
+    def _low_memory(self) -> bool:
+        free = available_bytes()
+        return free is not None and free < self.min_free_bytes
+
+    def trim(self) -> List[str]:
+        """Close hidden, unpinned views until within budget; returns their names."""
+        closed = []
+        for name in list(self.views):
+            if name == self.current or name in self.pinned:
+                continue
+            if self.memory_bytes() <= self.budget_bytes and not self._low_memory():
+                break
+            self.remove(name)
+            closed.append(name)
+        self.evicted.extend(closed)
+        return closed
+
+    # -- preloading --------------------------------------------------------
+
+    def preload(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Run `fn(*args, **kwargs)` on a background thread for view `name`.
+
+        Returns the running preload instead if there is one; the thread is a
+        daemon, so an unfinished preload never holds up exit.
+        """
+        future = self._preloads.get(name)
+        if future is not None:
+            return future
+        future = self._preloads[name] = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"preload-{name}", daemon=True).start()
+        return future
+
+    def preloading(self, name: str) -> Optional[Future]:
+        return self._preloads.get(name)
+
+    def take_preload(self, name: str) -> Optional[Future]:
+        """The preload for `name`, handed over to the caller (who owns its result)."""
+        return self._preloads.pop(name, None)
+
+    def close(self) -> None:
+        for name in list(self.views):
+            self.remove(name)